@@ -3,8 +3,12 @@ import boilerplate.config as config
 from boilerplate.app import app
 from flask import Flask, redirect, url_for, abort
 from flask_login import login_required, current_user
-from boilerplate.utils.urls import route_info
+from boilerplate.utils.urls import route_info_response, route_version, build_route_manifest
 from boilerplate.modules.role.role_decorators import require_system_role
+from boilerplate.modules.login.login_decorators import anonymous_route
+from boilerplate.utils.etags import etag
+from boilerplate.utils.rate_limit import rate_limit
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
 
 
 # ==============================================================================================================================================================
@@ -24,6 +28,7 @@ time.tzset()
 #                                                                      View Routes
 # ==============================================================================================================================================================
 @app.route('/')
+@anonymous_route
 def index():
     return redirect(url_for("get_user_list"))
 
@@ -33,6 +38,15 @@ def index():
 @app.get('/api/v1/routes')
 @login_required
 @require_system_role
+@priority(PRIORITY_LOW)
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+@etag(route_version)
 def get_all_routes():
-    return sorted(route_info(), key=lambda route: route['module'])
+    return route_info_response()
+
+# ==============================================================================================================================================================
+#                                                                    Route Manifest
+# ==============================================================================================================================================================
+# Every route has been registered by now
+build_route_manifest()
 
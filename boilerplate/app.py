@@ -1,5 +1,6 @@
 import boilerplate.config as config
 from boilerplate.db import db
+from boilerplate.utils.json_provider import ModelJSONProvider
 from flask import Flask
 from sqlalchemy.exc import OperationalError
 
@@ -8,6 +9,7 @@ from sqlalchemy.exc import OperationalError
 # ==============================================================================================================================================================
 # Setup Flask app object
 app = Flask(__name__)
+app.json = ModelJSONProvider(app)
 app.secret_key = config.APP_SECRET
 if config.DEBUG_MODE:
     app.debug = config.DEBUG_MODE
@@ -23,11 +25,23 @@ db.init_app(app)
 with app.app_context():
     # Import all app modules
     import boilerplate.utils.lumberjack
+    # Registered first so shed requests skip every other before request hook
+    import boilerplate.utils.load_shedding
+    import boilerplate.utils.cache
+    # Registered before the other after request hooks so it runs after them
+    import boilerplate.utils.compression
+    import boilerplate.utils.health
     import boilerplate.errors
     import boilerplate.utils.filters
+    import boilerplate.utils.assets
     import boilerplate.modules.role as role
     import boilerplate.modules.user as user
     import boilerplate.modules.login as login
+    import boilerplate.utils.profiler
+    import boilerplate.utils.diagnostics
+    import boilerplate.utils.scheduler as scheduler
+    import boilerplate.utils.housekeeping
+    import boilerplate.utils.stats as stats
 
     # Create any db models
     db.create_all()
@@ -38,4 +52,16 @@ with app.app_context():
     role.role_model.update_system_roles()
     #role.role_model.action_clean_up()
     user.user_model.seed_user_if_required()
+    # Indexes the users of a database created before user search existed
+    user.user_model.user_search.ensure()
+    # Counts the users and roles of a database created before the aggregates table existed, or changed while the app was stopped
+    stats.reconcile()
+    db.session.commit()
+
+    # Render the error pages now the asset manifest and template context are in place
+    boilerplate.errors.render_error_pages()
+
+# Under gunicorn the master stops this thread again once the app is loaded and each worker starts its own after forking (see gunicorn.conf.py)
+if scheduler.serving():
+    scheduler.start()
 
@@ -0,0 +1,48 @@
+from boilerplate import app
+from boilerplate.db import pool_on_loop, dispose_async_engine
+import boilerplate.config as config
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# The synchronous part of every request (routing, hooks, Flask-Login, sync views, templates) runs on these threads. Async views are handed back to
+# the server's event loop while their thread waits, so their database calls share one loop and one connection pool.
+executor = ThreadPoolExecutor(max_workers=config.ASGI_THREADS, thread_name_prefix="asgi")
+
+# ==============================================================================================================================================================
+#                                                                     ASGI Adapter
+# ==============================================================================================================================================================
+# asgiref runs every request on the same single thread. This runs them on the executor instead so requests are served concurrently.
+class ThreadPoolInstance(WsgiToAsgiInstance):
+    async def run_wsgi_app(self, body):
+        run = partial(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, self)
+        await sync_to_async(run, thread_sensitive=False, executor=executor)(body)
+
+
+class ASGIApplication(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        await ThreadPoolInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+    # Servers that don't send lifespan events still work, but the async engine then opens a connection for every session
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                pool_on_loop(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await dispose_async_engine()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+# Run with SERVER_INTERFACE=asgi so gunicorn.conf.py serves this with uvicorn workers and the async API route variants are registered
+application = ASGIApplication(app)
@@ -13,6 +13,8 @@ BASE_URL = os.getenv('BASE_URL', 'https://localhost')
 # Database Configuration
 DB_CONNECTION_STRING = os.getenv('DB_CONNECTION_STRING', 'sqlite:////deploy/database.db')
 DB_SEED = os.getenv('DB_SEED', 'True').lower() in ('true', '1', 'yes')
+# Used by the async API routes in ASGI mode. Derived from DB_CONNECTION_STRING when empty (ex. sqlite:// becomes sqlite+aiosqlite://).
+DB_ASYNC_CONNECTION_STRING = os.getenv('DB_ASYNC_CONNECTION_STRING', '')
 
 # Logging Configuration
 LOGGING_LEVEL = os.getenv('LOGGING_LEVEL', 'DEBUG')
@@ -22,7 +24,12 @@ LOGGING_FILE = os.getenv('LOGGING_FILE', './boilerplate/logs/main.log')
 LOGGING_LOG_400_ERRORS = os.getenv('LOGGING_LOG_400_ERRORS', 'True').lower() in ('true', '1', 'yes')
 LOGGING_LOG_403_ERRORS = os.getenv('LOGGING_LOG_403_ERRORS', 'True').lower() in ('true', '1', 'yes')
 LOGGING_LOG_404_ERRORS = os.getenv('LOGGING_LOG_404_ERRORS', 'True').lower() in ('true', '1', 'yes')
+LOGGING_LOG_429_ERRORS = os.getenv('LOGGING_LOG_429_ERRORS', 'True').lower() in ('true', '1', 'yes')
 LOGGING_LOG_500_ERRORS = os.getenv('LOGGING_LOG_500_ERRORS', 'True').lower() in ('true', '1', 'yes')
+# Only the first LOGGING_ERROR_SAMPLE_LIMIT errors with the same status and route in each LOGGING_ERROR_SAMPLE_WINDOW seconds are logged in full. The
+# rest are counted and summarized in a single line. 0 stops error logging altogether.
+LOGGING_ERROR_SAMPLE_LIMIT = int(os.getenv('LOGGING_ERROR_SAMPLE_LIMIT', '10'))
+LOGGING_ERROR_SAMPLE_WINDOW = float(os.getenv('LOGGING_ERROR_SAMPLE_WINDOW', '60'))
 
 # Session Configuration (Minutes)
 SESSION_TIMEOUT = int(os.getenv('SESSION_TIMEOUT', '1440'))
@@ -36,6 +43,144 @@ PASSWORD_REQUIRE_NUMERALS = os.getenv('PASSWORD_REQUIRE_NUMERALS', 'True').lower
 PASSWORD_REQUIRE_SPECIAL_CHARACTERS = os.getenv('PASSWORD_REQUIRE_SPECIAL_CHARACTERS', 'True').lower() in ('true', '1', 'yes')
 PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS = os.getenv('PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS', '!#$%&()*+,-./:;<=>?@^_{|}~')
 PASSWORD_RESET_CODE_VALIDITY = int(os.getenv('PASSWORD_RESET_CODE_VALIDITY', '120'))
+# bcrypt cost factor of new password hashes (4 to 31). Each step doubles the time a hash takes. Existing hashes keep the cost they were made with.
+# The test suite lowers it to 4.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
 
 # Profile Configuration
-NUMBER_OF_PROFILE_COLORS = int(os.getenv('NUMBER_OF_PROFILE_COLORS', '8'))
\ No newline at end of file
+NUMBER_OF_PROFILE_COLORS = int(os.getenv('NUMBER_OF_PROFILE_COLORS', '8'))
+
+# Cache Configuration
+# CACHE_BACKEND may be "memory" (per worker), "sqlite" (shared between workers on one host) or "redis" (shared between hosts)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite').lower()
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+# The SQLite cache only records a hit when the entry wasn't already used in the last CACHE_TOUCH_SECONDS, and each worker trims it back to
+# CACHE_MAX_ENTRIES every CACHE_EVICT_EVERY sets, so it can hold up to that many more per worker in between
+CACHE_TOUCH_SECONDS = float(os.getenv('CACHE_TOUCH_SECONDS', '60'))
+CACHE_EVICT_EVERY = int(os.getenv('CACHE_EVICT_EVERY', '100'))
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', './boilerplate/cache/cache.db')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'boilerplate:')
+CACHE_INVALIDATION_POLL_SECONDS = float(os.getenv('CACHE_INVALIDATION_POLL_SECONDS', '1'))
+
+# Single Flight Configuration
+# Concurrent identical requests to @single_flight endpoints share one computation. Its response is reused for SINGLE_FLIGHT_TTL seconds (0 = only
+# while in flight) and waiting requests give up and run on their own after SINGLE_FLIGHT_TIMEOUT seconds.
+SINGLE_FLIGHT_TTL = float(os.getenv('SINGLE_FLIGHT_TTL', '1'))
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '10'))
+
+# Health Check Configuration (seconds /readyz waits for the database before reporting the worker unavailable)
+HEALTH_READY_TIMEOUT = float(os.getenv('HEALTH_READY_TIMEOUT', '2'))
+
+# Proxy Configuration
+# Addresses allowed to tell the app about the client with X-Real-IP and X-Request-Start (see nginx/nginx.production.conf), as a comma separated
+# list of IP addresses, networks (ex. 172.16.0.0/12) or host names. Requests over gunicorn's unix socket always are. Those headers are ignored
+# from anyone else, so a client that reaches gunicorn directly can't choose its own rate limit bucket or get its requests shed.
+TRUSTED_PROXIES = os.getenv('TRUSTED_PROXIES', '127.0.0.1,::1')
+
+# Load Shedding Configuration
+# Each request's queueing delay is read from the X-Request-Start header NGINX adds. Once the delay has stayed above LOAD_SHED_TARGET_MS for
+# LOAD_SHED_INTERVAL_MS the worker is overloaded and sheds low priority routes with a 503 until a request gets through under the target. Normal
+# routes are only shed once they have waited LOAD_SHED_MAX_DELAY_MS and critical routes (ex. login) never are.
+LOAD_SHED_ENABLED = os.getenv('LOAD_SHED_ENABLED', 'True').lower() in ('true', '1', 'yes')
+LOAD_SHED_TARGET_MS = float(os.getenv('LOAD_SHED_TARGET_MS', '100'))
+LOAD_SHED_INTERVAL_MS = float(os.getenv('LOAD_SHED_INTERVAL_MS', '1000'))
+LOAD_SHED_MAX_DELAY_MS = float(os.getenv('LOAD_SHED_MAX_DELAY_MS', '10000'))
+LOAD_SHED_RETRY_AFTER = int(os.getenv('LOAD_SHED_RETRY_AFTER', '5'))
+
+# Rate Limit Configuration
+# Limits are "<requests>/<period>" (ex. "5/minute" or "20/15minutes"), empty or 0 for none. Buckets are kept in a SQLite file shared by every worker
+# on the host ("sqlite") or in each worker ("memory"). The client address is read from RATE_LIMIT_CLIENT_IP_HEADER, which NGINX sets, when the
+# request comes from a trusted proxy (see TRUSTED_PROXIES) and is the socket address otherwise.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'sqlite').lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', './boilerplate/cache/rate_limit.db')
+RATE_LIMIT_CLIENT_IP_HEADER = os.getenv('RATE_LIMIT_CLIENT_IP_HEADER', 'X-Real-IP')
+RATE_LIMIT_LOGIN_IP = os.getenv('RATE_LIMIT_LOGIN_IP', '20/minute')
+RATE_LIMIT_LOGIN_ACCOUNT = os.getenv('RATE_LIMIT_LOGIN_ACCOUNT', '5/minute')
+RATE_LIMIT_PASSWORD_RESET_IP = os.getenv('RATE_LIMIT_PASSWORD_RESET_IP', '10/hour')
+RATE_LIMIT_PASSWORD_RESET_ACCOUNT = os.getenv('RATE_LIMIT_PASSWORD_RESET_ACCOUNT', '3/hour')
+RATE_LIMIT_API_USER = os.getenv('RATE_LIMIT_API_USER', '3000/minute')
+
+# Scheduler Configuration
+# Every worker runs a scheduler thread that wakes every SCHEDULER_TICK_SECONDS. The one holding the leader lease (a database row renewed each tick
+# and held for SCHEDULER_LEASE_SECONDS) runs the jobs that are due. Reset codes past PASSWORD_RESET_CODE_VALIDITY are cleared every
+# RESET_CODE_CLEANUP_SECONDS and housekeeping (expired cache entries, rate limit buckets, old profiles, snapshots and logs older than
+# HOUSEKEEPING_MAX_AGE_DAYS) runs on the HOUSEKEEPING_CRON schedule.
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'True').lower() in ('true', '1', 'yes')
+SCHEDULER_TICK_SECONDS = float(os.getenv('SCHEDULER_TICK_SECONDS', '10'))
+SCHEDULER_LEASE_SECONDS = float(os.getenv('SCHEDULER_LEASE_SECONDS', '30'))
+RESET_CODE_CLEANUP_SECONDS = float(os.getenv('RESET_CODE_CLEANUP_SECONDS', '900'))
+HOUSEKEEPING_CRON = os.getenv('HOUSEKEEPING_CRON', '0 * * * *')
+HOUSEKEEPING_MAX_AGE_DAYS = float(os.getenv('HOUSEKEEPING_MAX_AGE_DAYS', '14'))
+
+# Compression Configuration
+# Dynamic responses of these types over COMPRESSION_MIN_SIZE bytes are compressed with the best encoding the client accepts: zstd (if the zstandard
+# package is installed), br or gzip. HTML_COLLAPSE_WHITESPACE strips the indentation and blank lines of HTML templates when they are compiled.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True').lower() in ('true', '1', 'yes')
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '500'))
+COMPRESSION_MIMETYPES = os.getenv('COMPRESSION_MIMETYPES', 'text/html,text/css,text/plain,text/javascript,application/javascript,application/json,image/svg+xml').split(',')
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+HTML_COLLAPSE_WHITESPACE = os.getenv('HTML_COLLAPSE_WHITESPACE', 'True').lower() in ('true', '1', 'yes')
+
+# Search Configuration
+# /api/v1/users/search returns SEARCH_PER_PAGE matches a page, or up to SEARCH_MAX_PER_PAGE when a client asks for more.
+SEARCH_PER_PAGE = int(os.getenv('SEARCH_PER_PAGE', '10'))
+SEARCH_MAX_PER_PAGE = int(os.getenv('SEARCH_MAX_PER_PAGE', '100'))
+
+# Aggregates Configuration
+# User and role counts are kept up to date as rows change and counted again from scratch every AGGREGATES_RECONCILE_SECONDS to correct any drift.
+# Role cards list the first ROLE_CARD_MAX_USERS users of each role.
+AGGREGATES_RECONCILE_SECONDS = float(os.getenv('AGGREGATES_RECONCILE_SECONDS', '3600'))
+ROLE_CARD_MAX_USERS = int(os.getenv('ROLE_CARD_MAX_USERS', '25'))
+
+# JSON Configuration
+# JSON_BACKEND is "auto" (orjson when it is installed, otherwise the standard library) or "stdlib"
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto').lower()
+
+# Static Asset Configuration
+# Fingerprinted assets are built with "flask --app boilerplate build-assets". Templates only use them when ASSETS_USE_MANIFEST is on (default outside of debug).
+ASSETS_DIST_FOLDER = os.getenv('ASSETS_DIST_FOLDER', 'dist')
+ASSETS_USE_MANIFEST = os.getenv('ASSETS_USE_MANIFEST', str(not DEBUG_MODE)).lower() in ('true', '1', 'yes')
+
+# Profiler Configuration
+# System users arm endpoints through /api/v1/profiles/arms. Captured profiles are kept in a ring of PROFILER_MAX_PROFILES files.
+PROFILER_FOLDER = os.getenv('PROFILER_FOLDER', './boilerplate/profiles')
+PROFILER_MAX_PROFILES = int(os.getenv('PROFILER_MAX_PROFILES', '50'))
+PROFILER_HEADER = os.getenv('PROFILER_HEADER', 'X-Profile-Token')
+PROFILER_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILER_SAMPLE_INTERVAL_MS', '5'))
+PROFILER_ARM_TTL = int(os.getenv('PROFILER_ARM_TTL', '3600'))
+
+# Diagnostics Configuration
+# Worker memory is sampled at most every DIAGNOSTICS_SAMPLE_SECONDS and the last DIAGNOSTICS_HISTORY samples are kept. tracemalloc snapshots are
+# written to DIAGNOSTICS_FOLDER so any worker can read and diff them.
+DIAGNOSTICS_FOLDER = os.getenv('DIAGNOSTICS_FOLDER', './boilerplate/diagnostics')
+DIAGNOSTICS_MAX_SNAPSHOTS = int(os.getenv('DIAGNOSTICS_MAX_SNAPSHOTS', '20'))
+DIAGNOSTICS_SAMPLE_SECONDS = int(os.getenv('DIAGNOSTICS_SAMPLE_SECONDS', '30'))
+DIAGNOSTICS_HISTORY = int(os.getenv('DIAGNOSTICS_HISTORY', '120'))
+DIAGNOSTICS_TRACEMALLOC_FRAMES = int(os.getenv('DIAGNOSTICS_TRACEMALLOC_FRAMES', '10'))
+
+# Gunicorn Configuration (see gunicorn.conf.py)
+# SERVER_PROFILE is "development" (HTTPS on :8443 with --reload) or "production" (plain HTTP on a unix socket behind NGINX).
+# SERVER_INTERFACE is "wsgi" (gthread workers serving boilerplate:app) or "asgi" (uvicorn workers serving boilerplate.asgi:application with the async
+# variants of the JSON API routes). ASGI_THREADS caps the threads running the synchronous part of requests in each ASGI worker.
+SERVER_INTERFACE = os.getenv('SERVER_INTERFACE', 'wsgi').lower()
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '32'))
+# Worker, thread, timeout and keep-alive values of 0 are sized automatically from the profile and the cores and memory available.
+SERVER_PROFILE = os.getenv('SERVER_PROFILE', 'development').lower()
+GUNICORN_SOCKET = os.getenv('GUNICORN_SOCKET', '/run/gunicorn/gunicorn.sock')
+GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', '0'))
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '0'))
+GUNICORN_WORKER_MEMORY_MB = int(os.getenv('GUNICORN_WORKER_MEMORY_MB', '128'))
+GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', '0'))
+GUNICORN_KEEPALIVE = int(os.getenv('GUNICORN_KEEPALIVE', '0'))
+GUNICORN_MAX_REQUESTS = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+GUNICORN_MAX_REQUESTS_JITTER = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+# Gracefully recycle a worker once its RSS passes this many MB (0 = off)
+GUNICORN_MAX_WORKER_RSS_MB = int(os.getenv('GUNICORN_MAX_WORKER_RSS_MB', '0'))
+# Preloading builds the app once in the master and shares it between workers. It is off by default in development as --reload cannot reload
+# preloaded code.
+GUNICORN_PRELOAD = os.getenv('GUNICORN_PRELOAD', str(SERVER_PROFILE == 'production')).lower() in ('true', '1', 'yes')
@@ -1,7 +1,27 @@
+import boilerplate.config as config
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import inspect
+from sqlalchemy.orm.attributes import del_attribute, set_committed_value
+from contextlib import asynccontextmanager
+import asyncio
+import weakref
 
 db = SQLAlchemy()
 
+# Dialects with INSERT ... ON CONFLICT DO NOTHING RETURNING, and the insert construct that writes it
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+# Async drivers standing in for the sync drivers of the app's engine
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+# One async engine per event loop, and the loops allowed to keep a connection pool (see pool_on_loop)
+async_engines = weakref.WeakKeyDictionary()
+pooled_loops = weakref.WeakSet()
+
 
 def save():
     try:
@@ -10,3 +30,113 @@ def save():
         db.session.rollback()
         raise
     return True
+
+
+# Drops every pooled database connection. Used around a preloaded gunicorn fork: the master closes its connections so none are inherited, and workers
+# pass close=False so they forget any inherited connection without closing a socket that another process may still be using.
+def dispose_engines(close: bool = True):
+    for engine in db.engines.values():
+        engine.dispose(close=close)
+
+# ==============================================================================================================================================================
+#                                                                     Insert Helpers
+# ==============================================================================================================================================================
+# The column values given to a model instance that hasn't been saved, ex. User(...), keyed by attribute name. Foreign keys are read from the related
+# objects it was given (ex. role_uuid from user.role). Columns left unset are filled by their defaults when the row is inserted.
+def column_values(instance):
+    state = inspect(instance)
+    mapper = state.mapper
+    values = {attribute.key: state.dict[attribute.key] for attribute in mapper.column_attrs if attribute.key in state.dict}
+    for relationship in mapper.relationships:
+        related = state.dict.get(relationship.key)
+        if related is None or relationship.uselist:
+            continue
+        for local, remote in relationship.local_remote_pairs:
+            values[mapper.get_property_by_column(local).key] = getattr(related, inspect(related).mapper.get_property_by_column(remote).key)
+    return values
+
+
+# The column values of an instance that only carries them to an insert. It is detached from its related objects, otherwise a backref (ex. the user
+# added to role.users by User(...)) would have the session try to save it along with them.
+def carried_values(instance):
+    values = column_values(instance)
+    for relationship in inspect(instance).mapper.relationships:
+        if relationship.key in inspect(instance).dict:
+            del_attribute(instance, relationship.key)
+    return values
+
+
+# Inserts rows of a model, skipping any that would break a unique constraint (ex. an email or name that is already taken), and commits.
+# Returns the rows that were created as model instances, so the caller can tell which ones already existed. rows may be dictionaries of column
+# values or unsaved instances. SQLite and PostgreSQL do this in one INSERT ... ON CONFLICT DO NOTHING RETURNING statement, so there is no window
+# between checking and inserting for another worker to create the same row. Other databases insert each row in a savepoint and skip the ones
+# the database refuses.
+def insert_if_not_exists(model, rows: list):
+    rows = [row if isinstance(row, dict) else carried_values(row) for row in rows]
+    if not rows:
+        return []
+    upsert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    try:
+        if upsert is not None:
+            created = db.session.scalars(upsert(model).on_conflict_do_nothing().returning(model), rows).all()
+        else:
+            created = []
+            for row in rows:
+                # Built through the mapper as the model's constructor may not take its columns (ex. User hashes the password it is given)
+                instance = model.__mapper__.class_manager.new_instance()
+                for key, value in row.items():
+                    setattr(instance, key, value)
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(instance)
+                except IntegrityError:
+                    continue
+                created.append(instance)
+        # Committing expires the created instances. Their values just came back from the insert, so they are kept rather than loaded again.
+        returned = [column_values(instance) for instance in created]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for instance, values in zip(created, returned):
+        for key, value in values.items():
+            set_committed_value(instance, key, value)
+    return created
+
+
+# ==============================================================================================================================================================
+#                                                                    Async Sessions
+# ==============================================================================================================================================================
+def async_connection_string():
+    if config.DB_ASYNC_CONNECTION_STRING:
+        return config.DB_ASYNC_CONNECTION_STRING
+    url = db.engine.url
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+# The loop an ASGI server runs on lives as long as the worker, so its engine keeps a connection pool. Every other loop gets an engine without one:
+# Flask runs each async view under WSGI on a loop of its own, and a pooled connection can't be used from any loop but the one that opened it.
+def pool_on_loop(loop):
+    pooled_loops.add(loop)
+
+
+def async_engine():
+    loop = asyncio.get_running_loop()
+    engine = async_engines.get(loop)
+    if engine is None:
+        options = {} if loop in pooled_loops else {"poolclass": NullPool}
+        engine = async_engines[loop] = create_async_engine(async_connection_string(), **options)
+    return engine
+
+
+# Objects stay readable after the session closes so views can return them to be serialized
+@asynccontextmanager
+async def async_session():
+    async with AsyncSession(async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+async def dispose_async_engine():
+    engine = async_engines.pop(asyncio.get_running_loop(), None)
+    if engine is not None:
+        await engine.dispose()
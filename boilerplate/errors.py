@@ -2,16 +2,60 @@ from boilerplate.app import app
 import boilerplate.utils.lumberjack as log
 from flask import render_template, abort, request
 from flask_login import current_user
+from markupsafe import escape
+from werkzeug.exceptions import HTTPException
 from datetime import datetime
 import boilerplate.config as config
-import base64
-import uuid
+import threading
 import traceback
+import secrets
+import time
 
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Shown when a view aborts without a description of its own
+ERROR_MESSAGES = {
+    400: "Bad Request. Something was wrong with the data you submitted to the server. "
+         "Please Try Again. If this error continues to occur please report this error.",
+    403: "Forbidden. You do not have permission to perform this action.",
+    404: "Not Found. The resource you requested could not be found. "
+         "Please Try Again. If this error continues to occur please report this error.",
+    429: "Too Many Requests. You have made too many requests in a short time. Please wait a moment and try again.",
+    500: "Internal Server Error. Something went wrong and the server could not recover. "
+         "Please Try Again. If this error continues to occur please report this error.",
+}
+# Statuses that are logged and whether they are enabled. Errors with any other status are returned without being logged.
+LOGGED_ERRORS = {
+    400: config.LOGGING_LOG_400_ERRORS,
+    403: config.LOGGING_LOG_403_ERRORS,
+    404: config.LOGGING_LOG_404_ERRORS,
+    429: config.LOGGING_LOG_429_ERRORS,
+    500: config.LOGGING_LOG_500_ERRORS,
+}
+# Stand ins rendered into the error page at boot and replaced for each error
+PAGE_STATUS = "@@ERROR_STATUS@@"
+PAGE_MESSAGE = "@@ERROR_MESSAGE@@"
+PAGE_ERROR_ID = "@@ERROR_ID@@"
+PAGE_TIME = "@@ERROR_TIME@@"
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# error.html rendered once with the stand ins, then once per status in ERROR_MESSAGES. See render_error_pages.
+error_page = None
+error_pages = {}
+# (status, route) -> [window start, errors in the window]
+error_samples = {}
+samples_lock = threading.Lock()
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
 def get_request_body_string(error_request):
     try:
         # Try to get the JSON data
-        json_data = error_request.get_json()
+        json_data = error_request.get_json(silent=True)
         if json_data is not None:
             return str(json_data)
     except:
@@ -28,88 +72,101 @@ def get_request_body_string(error_request):
     # If we couldn't retrieve the JSON or form data, just return the raw request body
     return str(error_request.data)
 
+
+# Renders error.html once so errors never go through Jinja. Called at the end of app initialization once the asset manifest and context
+# processors are in place. The page only uses static URLs, so a request context for "/" renders it the same as any real request would.
+def render_error_pages():
+    global error_page, error_pages
+    with app.test_request_context("/"):
+        error_page = render_template('error.html', http_status_code=PAGE_STATUS, message=PAGE_MESSAGE, error_id=PAGE_ERROR_ID, now=PAGE_TIME)
+    error_pages = {status: error_page.replace(PAGE_STATUS, str(status)) for status in ERROR_MESSAGES}
+
+
+def error_html(status: int, message: str, error_id: str):
+    if error_page is None:
+        render_error_pages()
+    page = error_pages.get(status) or error_page.replace(PAGE_STATUS, str(status))
+    return page.replace(PAGE_ERROR_ID, error_id).replace(PAGE_TIME, str(datetime.now())).replace(PAGE_MESSAGE, escape(message))
+
+
+# API routes and clients that ask for JSON over HTML get JSON. Browsers send */* after text/html, so they still get the page.
+def wants_json():
+    if request.path.startswith("/api/"):
+        return True
+    return request.accept_mimetypes.best_match(("text/html", "application/json")) == "application/json"
+
+
+# A view's own description is shown. Werkzeug's default description is replaced with ours where we have one.
+def error_message(error: HTTPException):
+    if error.code in ERROR_MESSAGES and error.description in (None, "", type(error).description):
+        return ERROR_MESSAGES[error.code]
+    return error.description or error.name
+
+
+# Counts errors per status and route in windows of LOGGING_ERROR_SAMPLE_WINDOW seconds and reports whether this one should be logged. Only the first
+# LOGGING_ERROR_SAMPLE_LIMIT in each window are. The rest are counted and summarized in one line once the window closes, so a scanner requesting
+# thousands of missing pages writes a handful of lines rather than one per request.
+def sample_error(status: int, route: str, now: float):
+    flush_error_samples(now)
+    with samples_lock:
+        sample = error_samples.setdefault((status, route), [now, 0])
+        sample[1] += 1
+        return sample[1] <= config.LOGGING_ERROR_SAMPLE_LIMIT
+
+
+# Ends the windows that have closed, writing the summary of any that had errors left out, and returns how many summaries were written. Run with
+# each error and on every worker's scheduler tick (see utils/housekeeping.py), so the last burst before errors stop is summarized too.
+def flush_error_samples(now: float):
+    summaries = []
+    with samples_lock:
+        for key, (started, count) in list(error_samples.items()):
+            if now - started >= config.LOGGING_ERROR_SAMPLE_WINDOW:
+                del error_samples[key]
+                if count > config.LOGGING_ERROR_SAMPLE_LIMIT:
+                    summaries.append((key, count, now - started))
+    for (summary_status, summary_route), count, seconds in summaries:
+        log.warning(f"HTTP {summary_status} {summary_route}: {count - config.LOGGING_ERROR_SAMPLE_LIMIT} more of {count} errors "
+                    f"not logged in {seconds:.0f}s")
+    return len(summaries)
+
+
+def log_error(error: HTTPException, status: int, message: str, error_id: str):
+    if not config.LOGGING_ERROR_SAMPLE_LIMIT or not LOGGED_ERRORS.get(status):
+        return
+    # Unmatched URLs share one key however many different paths are requested
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    if not sample_error(status, route, time.monotonic()):
+        return
+
+    user = "Anonymous" if current_user.get_id() is None else current_user.get_id()
+    line = f'HTTP {status} ({error_id}) {request.method}:{request.url} BY:({user})- {message}'
+    if status == 429:
+        log.warning(line)
+        return
+    exception = getattr(error, "original_exception", None)
+    exception_traceback = "".join(traceback.format_exception(exception)) if exception is not None else False
+    log.error(line, traceback=exception_traceback)
+    if request.method != "GET":
+        body_data = get_request_body_string(request)
+        log.debug(f"Body Data ({error_id}):\r\n {body_data}")
+
 # ==============================================================================================================================================================
 #                                                                   Error Views
 # ==============================================================================================================================================================
-#TODO: Add logging to all these errors
-@app.errorhandler(400)
-def bad_request(error):
-    error_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("utf-8").strip("==")
-    http_status_code = 400
-    message = "Bad Request. Something was wrong with the data you submitted to the server. " \
-              "Please Try Again. If this error continues to occur please report this error."
-    if error.description:
-        message = error.description
-
-    # Log if required
-    if config.LOGGING_LOG_400_ERRORS:
-        user = "Anonymous" if current_user.get_id() is None else current_user.get_id()
-        log.error(f'HTTP {http_status_code} ({error_id}) {request.method}:{request.url} BY:({user})- {message}')
-        if request.method != "GET":
-            body_data = get_request_body_string(request)
-            log.debug(f"Body Data ({error_id}):\r\n {body_data}")
-
-    return render_template('error.html', http_status_code=http_status_code, error=str(error), message=message, error_id=error_id, now=datetime.now()), http_status_code
-
-@app.errorhandler(403)
-def forbidden(error):
-    error_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("utf-8").strip("==")
-    http_status_code = 403
-    message = "Forbidden. You do not have permission to perform this action."
-    print("Description: ", error.description, flush=True)
-    if error.description:
-        message = error.description
-
-    # Log if required
-    if config.LOGGING_LOG_403_ERRORS:
-        user = "Anonymous" if current_user.get_id() is None else current_user.get_id()
-        log.error(f'HTTP {http_status_code} ({error_id}) {request.method}:{request.url} BY:({user})- {message}')
-        if request.method != "GET":
-            body_data = get_request_body_string(request)
-            log.debug(f"Body Data ({error_id}):\r\n {body_data}")
-
-    return render_template('error.html', http_status_code=http_status_code, error=str(error), message=message, error_id=error_id, now=datetime.now()), http_status_code
-
-@app.errorhandler(404)
-def page_not_found(error):
-    error_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("utf-8").strip("==")
-    http_status_code = 404
-    message = "Not Found. The resource you requested could not be found. " \
-              "Please Try Again. If this error continues to occur please report this error."
-    if error.description:
-        message = error.description
-
-    # Log if required
-    if config.LOGGING_LOG_404_ERRORS:
-        user = "Anonymous" if current_user.get_id() is None else current_user.get_id()
-        log.error(f'HTTP {http_status_code} ({error_id}) {request.method}:{request.url} BY:({user})- {message}')
-        if request.method != "GET":
-            body_data = get_request_body_string(request)
-            log.debug(f"Body Data ({error_id}):\r\n {body_data}")
-
-    return render_template('error.html', http_status_code=http_status_code, error=str(error), message=message, error_id=error_id, now=datetime.now()), http_status_code
-
-@app.errorhandler(500)
-def internal_server_error(error):
-    error_id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("utf-8").strip("==")
-    http_status_code = 500
-    message = "Internal Server Error. Something went wrong and the server could not recover. " \
-              "Please Try Again. If this error continues to occur please report this error."
-    if error.description:
-        message = error.description
-
-    # Log if required
-    if config.LOGGING_LOG_500_ERRORS:
-        exception_traceback = False
-        if error.original_exception:
-            exception_traceback = traceback.format_exc()
-        user = "Anonymous" if current_user.get_id() is None else current_user.get_id()
-        log.error(f'HTTP {http_status_code} ({error_id}) {request.method}:{request.url} BY:({user})- {message}', traceback=exception_traceback)
-        if request.method != "GET":
-            body_data = get_request_body_string(request)
-            log.debug(f"Body Data ({error_id}):\r\n {body_data}")
-
-    return render_template('error.html', http_status_code=http_status_code, error=str(error), message=message, error_id=error_id, now=datetime.now()), http_status_code
+# Every HTTP error, including unhandled exceptions (which Flask turns into a 500), comes through here. Headers the error carries, such as
+# Retry-After on a 429 or Allow on a 405, are kept.
+@app.errorhandler(HTTPException)
+def handle_http_error(error: HTTPException):
+    status = error.code or 500
+    error_id = secrets.token_urlsafe(16)
+    message = error_message(error)
+    log_error(error, status, message, error_id)
+
+    headers = [(name, value) for name, value in error.get_headers() if name.lower() != "content-type"]
+    if wants_json():
+        body = app.json.dumps({"status": status, "error": error.name, "message": message, "error_id": error_id})
+        return app.response_class(body, status, headers, mimetype="application/json")
+    return app.response_class(error_html(status, message, error_id), status, headers, mimetype="text/html")
 
 # ==============================================================================================================================================================
 #                                                                Error Views Test Routes
@@ -138,4 +195,3 @@ def error_div0():
 @app.post("/errors/post")
 def post_test():
     return abort(400)
-
@@ -1,8 +1,11 @@
 from boilerplate.app import app
-from flask import Flask, render_template, redirect, request, flash, abort, url_for, session
+from flask import Flask, render_template, redirect, request, flash, abort, url_for, session, g
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
-from boilerplate.modules.user.user_model import User, AnonymousUser, get_user_by_uuid, get_user_by_email, send_password_reset
-from boilerplate.utils.urls import is_safe_url
+from boilerplate.modules.user.user_model import User, AnonymousUser, anonymous_user, get_user_by_uuid, get_user_by_email, send_password_reset
+from boilerplate.modules.login.login_decorators import anonymous_route
+from boilerplate.utils.load_shedding import priority, PRIORITY_CRITICAL
+from boilerplate.utils.rate_limit import rate_limit
+from boilerplate.utils.urls import is_safe_url, is_anonymous_endpoint
 from datetime import timedelta
 from flask import render_template
 import boilerplate.config as config
@@ -17,6 +20,12 @@ login_manager.init_app(app)
 login_manager.login_view = 'get_login_page'
 login_manager.login_message = ""
 login_manager.anonymous_user = AnonymousUser
+app.permanent_session_lifetime = timedelta(minutes=config.SESSION_TIMEOUT)
+
+# Request classes. Only "full" requests load the logged in user and touch the session. Health probes never get this far (see utils/health.py).
+REQUEST_CLASS_STATIC = "static"
+REQUEST_CLASS_ANONYMOUS = "anonymous"
+REQUEST_CLASS_FULL = "full"
 
 # ==============================================================================================================================================================
 #                                                                      Utility Functions
@@ -26,15 +35,32 @@ login_manager.anonymous_user = AnonymousUser
 def load_user(user_id: str):
     return get_user_by_uuid(user_id)
 
+# Sorts each request into a class before any other login work. Static files (when NGINX falls through to Flask) and views marked @anonymous_route
+# get the shared anonymous principal, so Flask-Login never reads the session or queries for the user, and the session is never written. Which views
+# are anonymous comes from the route manifest (see utils/urls.py).
+@app.before_request
+def classify_request():
+    if request.endpoint == "static":
+        g.request_class = REQUEST_CLASS_STATIC
+    elif is_anonymous_endpoint(request.endpoint):
+        g.request_class = REQUEST_CLASS_ANONYMOUS
+    else:
+        g.request_class = REQUEST_CLASS_FULL
+        return
+    g._login_user = anonymous_user
+
 # Sets session max length on every request
 @app.before_request
 def session_timeout():
+    if g.request_class != REQUEST_CLASS_FULL:
+        return
     session.permanent = True
-    app.permanent_session_lifetime = timedelta(minutes=config.SESSION_TIMEOUT)
 
 # Checks on every request if a users account is still active
 @app.before_request
 def check_for_expired_accounts():
+    if g.request_class != REQUEST_CLASS_FULL:
+        return
     if (not current_user.is_anonymous) and (not current_user.is_active):
         flash(
             "Your account with this service is no longer active. If you believe this to be in error please contact an admin and have your account reactivated.",
@@ -47,10 +73,15 @@ def check_for_expired_accounts():
 # ==============================================================================================================================================================
 
 @app.get("/login")
+@priority(PRIORITY_CRITICAL)
+@anonymous_route
 def get_login_page():
     return render_template("login/login_page.html")
 
 @app.post("/login")
+@priority(PRIORITY_CRITICAL)
+@rate_limit(config.RATE_LIMIT_LOGIN_IP, by="ip")
+@rate_limit(config.RATE_LIMIT_LOGIN_ACCOUNT, by="account")
 def post_login_user():
     # Get the login credentials from the form
     input_email = request.form.get("email")
@@ -93,6 +124,7 @@ def post_login_user():
     return redirect(next_page or "/")
 
 @app.get("/logout")
+@priority(PRIORITY_CRITICAL)
 def get_logout():
     logout_user()
     return redirect(url_for("get_login_page"))
@@ -0,0 +1,8 @@
+# ==============================================================================================================================================================
+#                                                                   Login Decorators
+# ==============================================================================================================================================================
+# Marks a view that never needs the logged in user. Requests to it skip user loading and the session hooks and see the anonymous principal, so they
+# cost no database queries. Only use it on views that render the same thing for everyone (ex. the login page).
+def anonymous_route(function):
+    function.anonymous_route = True
+    return function
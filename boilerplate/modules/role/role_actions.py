@@ -1,7 +1,11 @@
+import hashlib
+
 # ==============================================================================================================================================================
 #                                                                   Variables
 # ==============================================================================================================================================================
 actions = []
+# Hash of the registry, computed on first use and reset whenever an action is registered
+registry_version = None
 
 # ==============================================================================================================================================================
 #                                                                   Functions
@@ -14,11 +18,20 @@ def register_action(action: str, feature: str, description: str, required_action
         if not required_action in existing_actions:
             raise NonExistentRequiredActionError(existing_actions, required_action)
 
+    global registry_version
     actions.append({'action': action, 'feature': feature, 'description': description, 'required_actions': required_actions, 'system_only':system_only})
+    registry_version = None
 
 def get_actions():
     return sorted(actions, key=lambda action: action['feature'])
 
+# Changes whenever the registered actions do. Used as the ETag version of /api/v1/actions.
+def get_actions_version():
+    global registry_version
+    if registry_version is None:
+        registry_version = hashlib.sha256(repr(get_actions()).encode("utf-8")).hexdigest()
+    return registry_version
+
 def get_action_names():
     return [item['action'] for item in actions]
 
@@ -1,23 +1,45 @@
 from boilerplate.app import app
 from boilerplate.modules.role.role_model import Role
-from boilerplate.modules.role.role_actions import get_actions, register_action
-from flask_login import current_user, login_required
-from flask import abort
+from boilerplate.modules.role.role_actions import get_actions, get_actions_version, register_action
+from boilerplate.modules.role.role_decorators import require_system_role
+from flask_login import login_required
+from boilerplate.utils.single_flight import single_flight
+from boilerplate.utils.etags import etag, channel_version
+from boilerplate.utils.rate_limit import rate_limit
+import boilerplate.config as config
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
+from boilerplate.utils.async_routes import async_variant
+from boilerplate.db import async_session
+from sqlalchemy import select
 
 
+# ==============================================================================================================================================================
+#                                                                  Async Route Variants
+# ==============================================================================================================================================================
+# Served in place of the routes below when running under ASGI (see utils/async_routes.py)
+async def get_all_roles_async():
+    async with async_session() as session:
+        return list(await session.scalars(select(Role)))
+
 # ==============================================================================================================================================================
 #                                                                   Endpoint Routes
 # ==============================================================================================================================================================
 @app.get('/api/v1/roles')
 @login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+@etag(channel_version("roles"))
+@single_flight(channels=("roles",))
+@async_variant(get_all_roles_async)
 def get_all_roles():
-    if current_user.role.system:
-        return Role.query.all()
-    return abort(403)
+    return Role.query.all()
 
 @app.get('/api/v1/actions')
 @login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+@etag(get_actions_version)
 def get_all_actions():
-    if current_user.role.system:
-        return get_actions()
-    return abort(403)
+    return get_actions()
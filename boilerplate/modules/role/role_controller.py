@@ -1,11 +1,28 @@
 from boilerplate.app import app
 from boilerplate.db import save
-from boilerplate.modules.role.role_model import Role, get_role_by_name, get_role_by_uuid, create_if_not_exists
+from boilerplate.modules.role.role_model import Role, get_role_by_uuid, create_if_not_exists
 from boilerplate.modules.role.role_actions import get_actions, get_action_names, register_action
 from boilerplate.modules.role.role_decorators import require_action
-from boilerplate.modules.user.user_model import replace_all_instances_of_role
-from flask import render_template, request, flash, redirect, url_for, abort
+from boilerplate.modules.user.user_model import replace_all_instances_of_role, count_users_by_role, get_role_members, role_has_users
+import boilerplate.config as config
+from flask import render_template, request, url_for, abort
 from flask_login import login_required, current_user
+from boilerplate.utils.fragments import respond
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# User counts come from the aggregates table and only the first ROLE_CARD_MAX_USERS users of each role are listed, so the page costs the same
+# however many users there are
+def role_card_context(roles):
+    return dict(user_counts=count_users_by_role(roles), role_members=get_role_members(roles, config.ROLE_CARD_MAX_USERS))
+
+def render_role_card(role: Role):
+    return render_template("role/role_card.html", role=role, actions=get_actions(), **role_card_context([role]))
+
+# Whether the current user is offered the role as a replacement when deleting another (see role/replacement_option.html)
+def is_replacement_option(role: Role):
+    return ((not role.system) and (not role.hidden) and role.active) or current_user.role.system
 
 # ==============================================================================================================================================================
 #                                                                      View Routes
@@ -16,7 +33,7 @@ from flask_login import login_required, current_user
 def get_roles_list():
     roles = Role.query.all()
     actions = get_actions()
-    return render_template("role/role_list.html", actions=actions, roles=roles)
+    return render_template("role/role_list.html", actions=actions, roles=roles, **role_card_context(roles))
 
 @app.post('/roles')
 @login_required
@@ -39,23 +56,24 @@ def post_create_or_edit_role():
         role_system = True
 
     if role_id == "new":
-        existing_role = get_role_by_name(role_name)
-        if existing_role:
-            flash("A role with that name already exists. Please use a unique name when creating roles.", "error")
-            return redirect(url_for("get_roles_list"))
         for key in request.form:
             value = request.form.get(key)
             if ("action-flag-" in key) and (value == "true"):
                 actions.append(key.replace("action-flag-", ""))
-        create_if_not_exists(Role(role_name, role_description, actions, system=role_system, hidden=role_hidden))
-        flash(f"Role {role_name} created successfully!", "success")
-        return redirect(url_for("get_roles_list"))
+        # Skipped if the name is taken
+        new_role = create_if_not_exists(Role(role_name, role_description, actions, system=role_system, hidden=role_hidden))
+        if not new_role:
+            return respond(url_for("get_roles_list"), "A role with that name already exists. Please use a unique name when creating roles.", "error",
+                           status=409)
+        return respond(url_for("get_roles_list"), f"Role {role_name} created successfully!", "success",
+                       lambda: render_role_card(new_role) + render_template("role/replacement_option.html", role=new_role))
 
 
     existing_role = get_role_by_uuid(role_id)
     if not existing_role:
-        flash("Something happened while updating the role. Please Try again and if you continue to experience issues contact an administrator", "error")
-        return redirect(url_for("get_roles_list"))
+        return respond(url_for("get_roles_list"),
+                       "Something happened while updating the role. Please Try again and if you continue to experience issues contact an administrator", "error",
+                       status=404)
     all_actions = get_action_names()
     existing_actions = existing_role.actions
     new_actions = []
@@ -75,8 +93,11 @@ def post_create_or_edit_role():
     existing_role.system = role_system
     existing_role.hidden = role_hidden
     if save():
-        flash(f"Role {role_name} has been edited!", "success")
-    return redirect(url_for("get_roles_list"))
+        # The delete modal's option is swapped too so it shows the new name, and removed if the role can no longer be chosen
+        removed = [] if is_replacement_option(existing_role) else [f"replacement-option-{existing_role.uuid}"]
+        return respond(url_for("get_roles_list"), f"Role {role_name} has been edited!", "success",
+                       lambda: render_role_card(existing_role) + render_template("role/replacement_option.html", role=existing_role), removed=removed)
+    return respond(url_for("get_roles_list"), status=500)
 
 @app.post('/roles/delete')
 @login_required
@@ -88,44 +109,43 @@ def delete_role():
     delete_role_count = request.form.get("delete-role-count")
 
     if (not role_id) or (not replacement_role_id) or (not delete_role_count):
-        flash(
-            "An error occured while getting the information to delete the role. Please try again and if you continue to "
-            "experience issues contact an administrator",
-            "error")
-        return redirect(url_for("get_roles_list"))
+        return respond(url_for("get_roles_list"),
+                       "An error occured while getting the information to delete the role. Please try again and if you continue to "
+                       "experience issues contact an administrator",
+                       "error", status=400)
 
     # Get the role to delete and confirm it still exists
     existing_role = get_role_by_uuid(role_id)
     if not existing_role:
-        flash("An error occured while retreiving the role to delete. The role may have already been deleted.", "error")
-        return redirect(url_for("get_roles_list"))
+        return respond(url_for("get_roles_list"), "An error occured while retreiving the role to delete. The role may have already been deleted.", "error",
+                       status=404)
 
     # See if the role is in use
-    if len(existing_role.users) > 0:
+    replacement_role = None
+    if role_has_users(existing_role):
         # A user was added to the role being deleted while they were deleting the role, better we have them try again.
         if delete_role_count == 0:
-            flash(
-                "An error occured while preparing to delete the role. Please try again and if you continue to experience"
-                " issues contact an administrator",
-                "error")
-            return redirect(url_for("get_roles_list"))
+            return respond(url_for("get_roles_list"),
+                           "An error occured while preparing to delete the role. Please try again and if you continue to experience"
+                           " issues contact an administrator",
+                           "error", status=409)
 
         # Get the role to replace and confirm it exists.
         replacement_role = get_role_by_uuid(replacement_role_id)
         if not replacement_role:
-            flash(
-                "An error occured while getting the replacement role. Please try again and if you continue to experience"
-                " issues contact an administrator",
-                "error")
-            return redirect(url_for("get_roles_list"))
+            return respond(url_for("get_roles_list"),
+                           "An error occured while getting the replacement role. Please try again and if you continue to experience"
+                           " issues contact an administrator",
+                           "error", status=404)
 
         # Replace the role
         replace_all_instances_of_role(existing_role, replacement_role)
 
     existing_role.delete()
-    flash("Role deleted successfully.","success")
-
-    return redirect(url_for("get_roles_list"))
+    # The replacement's card is sent again as its user count and list have changed
+    return respond(url_for("get_roles_list"), "Role deleted successfully.", "success",
+                   lambda: render_role_card(replacement_role) if replacement_role else "",
+                   removed=[f"role-{role_id}", f"replacement-option-{role_id}"])
 
 # ==============================================================================================================================================================
 #                                                                  Context Processors
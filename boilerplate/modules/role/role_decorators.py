@@ -1,18 +1,21 @@
 from flask_login import current_user
-from flask import abort
+from flask import abort, current_app
 from functools import wraps
 
 
 # ==============================================================================================================================================================
 #                                                                   Role Decotators
 # ==============================================================================================================================================================
+# Both decorators run the view through ensure_sync so they can wrap async views (see utils/async_routes.py)
 def require_action(action: str):
     def decorator(function):
         @wraps(function)
         def decorated_function(*args, **kwargs):
             if not current_user.can(action):
                 return abort(403)
-            return function(*args, **kwargs)
+            return current_app.ensure_sync(function)(*args, **kwargs)
+        # Read by the route manifest (see utils/urls.py). Stacked decorators add up as functools.wraps copies the inner function's attributes.
+        decorated_function.required_actions = (*getattr(function, "required_actions", ()), action)
         return decorated_function
     return decorator
 
@@ -24,5 +27,6 @@ def require_system_role(function):
             return abort(403)
         if not current_user.role.system:
             return abort(403)
-        return function(*args, **kwargs)
+        return current_app.ensure_sync(function)(*args, **kwargs)
+    decorated_function.system_role_required = True
     return decorated_function
\ No newline at end of file
@@ -1,10 +1,12 @@
-from boilerplate.db import db
+from boilerplate.db import db, insert_if_not_exists
 from sqlalchemy.orm import relationship
 from boilerplate.modules.role.role_actions import get_action_names
 from sqlalchemy.sql import func
-from sqlalchemy.exc import IntegrityError
 from typing import List
 import boilerplate.config as config
+import boilerplate.utils.cache as cache
+import boilerplate.utils.stats as stats
+from boilerplate.utils.loader import Loader
 import uuid
 import json
 from datetime import datetime
@@ -62,6 +64,12 @@ class Role(db.Model):
             db.session.rollback()
             raise
 
+# Any committed change to a role is published so every worker can drop what it has cached about roles.
+cache.publish_on_commit(Role, "roles")
+
+# How many roles there are, kept by the aggregates table (see utils/stats.py)
+stats.count_rows(Role, lambda role: ("roles",), (), prefix="roles")
+
 # ==============================================================================================================================================================
 #                                                            Non-Class Utility Functions
 # ==============================================================================================================================================================
@@ -77,29 +85,42 @@ def update_system_roles():
         raise
 
 
-# Will create a role if a role with that name doesn't already exist
+# Will create a role if a role with that name doesn't already exist. Returns the stored role, or None when the name is taken.
 def create_if_not_exists(role: Role):
-    db_roles = db.session.query(Role).filter_by(name=role.name).all()
-    if len(db_roles) == 0:
-        try:
-            db.session.add(role)
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-            raise
-            # Thar be threading afoot. Ignoring integrity errors here, other threads already having created the user.
+    created = insert_if_not_exists(Role, [role])
+    return created[0] if created else None
+
+def to_uuid(value):
+    if isinstance(value, str):
+        return uuid.UUID(value)
+    return value
+
+# Request scoped loaders behind the lookups below. Repeat lookups within a request are answered from memory.
+role_by_name = Loader("role_by_name", Role, "name")
+role_by_uuid = Loader("role_by_uuid", Role, "uuid", normalize=to_uuid)
 
 def get_role_by_name(role_name: str):
-    return db.session.query(Role).filter_by(name=role_name).first()
+    return role_by_name.load(role_name)
 
 def get_role_by_uuid(role_uuid):
-    if isinstance(role_uuid, str):
-        role_uuid = uuid.UUID(role_uuid)
-    return db.session.query(Role).filter_by(uuid=role_uuid).first()
+    return role_by_uuid.load(role_uuid)
+
+def get_roles_by_uuid(role_uuids):
+    return role_by_uuid.load_many(role_uuids)
+
+# All roles, remembered by the loaders so a later lookup of any of them within the request is free
+def get_all_roles():
+    roles = Role.query.all()
+    role_by_uuid.prime(roles)
+    role_by_name.prime(roles)
+    return roles
 
 # Will seed the Roles table in the db with some default roles.
 def seed_roles_if_required():
     if config.DB_SEED:
-        create_if_not_exists(Role("System", "Global Role for the System it's self.", [], system=True, hidden=True))
-        create_if_not_exists(Role("System Admin", "Global Role for a System Admin.", [], system=True, hidden=False))
-        create_if_not_exists(Role("Default Role", "A Default Role for Testing.", [], system=False, hidden=False))
\ No newline at end of file
+        # One statement however many workers seed at once. Roles that already exist are skipped.
+        insert_if_not_exists(Role, [
+            Role("System", "Global Role for the System it's self.", [], system=True, hidden=True),
+            Role("System Admin", "Global Role for a System Admin.", [], system=True, hidden=False),
+            Role("Default Role", "A Default Role for Testing.", [], system=False, hidden=False),
+        ])
\ No newline at end of file
@@ -1,9 +1,36 @@
 from boilerplate.app import app
-from boilerplate.modules.user.user_model import User, get_user_by_uuid
+from boilerplate.modules.user.user_model import User, get_user_by_uuid, search_users
 from boilerplate.utils.urls import validate_uuid
-from flask import abort
-from flask_login import login_required
-from boilerplate.modules.role.role_decorators import require_system_role
+from flask import abort, request
+from flask_login import login_required, current_user
+from boilerplate.modules.role.role_decorators import require_system_role, require_action
+from boilerplate.utils.single_flight import single_flight
+from boilerplate.utils.etags import etag, channel_version
+from boilerplate.utils.rate_limit import rate_limit
+import boilerplate.config as config
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
+from boilerplate.utils.async_routes import async_variant
+from boilerplate.db import async_session
+from boilerplate.modules.role.role_model import to_uuid
+from sqlalchemy import select
+
+# ==============================================================================================================================================================
+#                                                                  Async Route Variants
+# ==============================================================================================================================================================
+# Served in place of the routes below when running under ASGI (see utils/async_routes.py)
+async def get_user_list_json_async():
+    async with async_session() as session:
+        return list(await session.scalars(select(User)))
+
+
+async def get_user_profile_json_async(profile_uuid: str):
+    if not validate_uuid(profile_uuid):
+        abort(400)
+    async with async_session() as session:
+        user = await session.scalar(select(User).where(User.uuid == to_uuid(profile_uuid)))
+    if not user:
+        abort(404)
+    return user.dict()
 
 # ==============================================================================================================================================================
 #                                                                   Endpoint Routes
@@ -13,13 +40,36 @@ from boilerplate.modules.role.role_decorators import require_system_role
 @app.get('/api/v1/users/')
 @login_required
 @require_system_role
+@priority(PRIORITY_LOW)
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+@single_flight(channels=("users",))
+@async_variant(get_user_list_json_async)
 def get_user_list_json():
     all_users = User.query.all()
     return all_users
 
+# API Route to find users by name or email, for the typeahead on the users page
+@app.get('/api/v1/users/search')
+@login_required
+@require_action("read_users_list")
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+def get_user_search_json():
+    query = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", config.SEARCH_PER_PAGE, type=int)
+    if page < 1 or per_page < 1:
+        abort(400)
+    per_page = min(per_page, config.SEARCH_MAX_PER_PAGE)
+    # One extra row tells whether there is another page without counting every match
+    users = search_users(query, current_user.can("manage_deactivated_users"), limit=per_page + 1, offset=(page - 1) * per_page)
+    return {"query": query, "page": page, "per_page": per_page, "has_more": len(users) > per_page, "results": users[:per_page]}
+
 @app.get('/api/v1/users/<profile_uuid>')
 @login_required
 @require_system_role
+@rate_limit(config.RATE_LIMIT_API_USER, by="user")
+@etag(channel_version("users"))
+@async_variant(get_user_profile_json_async)
 def get_user_profile_json(profile_uuid: str):
     if not validate_uuid(profile_uuid):
         abort(400)
@@ -5,14 +5,47 @@ from boilerplate.modules.role.role_model import Role
 from boilerplate.modules.role.role_actions import register_action
 from flask import render_template, request, flash, redirect, url_for, abort
 from flask_login import login_required, current_user
-from boilerplate.modules.role.role_model import get_role_by_uuid
+from boilerplate.modules.role.role_model import get_role_by_uuid, get_all_roles
 from boilerplate.modules.role.role_decorators import require_action
-from boilerplate.modules.user.user_model import User, send_password_reset, get_user_by_uuid, check_password_requirements, get_user_by_email, create_if_not_exists
+from boilerplate.utils.load_shedding import priority, PRIORITY_CRITICAL
+from boilerplate.utils.rate_limit import rate_limit
+from boilerplate.modules.user.user_model import User, send_password_reset, get_user_by_uuid, check_password_requirements, get_user_by_email, create_if_not_exists, attach_roles
 from boilerplate.utils.email import validate_address
 from boilerplate.utils.urls import validate_uuid
+from boilerplate.utils.fragments import respond
+from markupsafe import Markup
 from sqlalchemy.sql import func
 import uuid
 
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# Everything the profile cards need, for the profile page and for the cards sent on their own after a change
+def profile_context(user: User, roles: list = None):
+    return dict(user=user,
+                roles=roles if roles is not None else get_all_roles(),
+                is_users_profile=str(current_user.uuid) == str(user.uuid),
+                PASSWORD_MIN_CHARACTERS=config.PASSWORD_MIN_CHARACTERS,
+                PASSWORD_MAX_CHARACTERS=config.PASSWORD_MAX_CHARACTERS,
+                PASSWORD_REQUIRE_LOWER_CASE=config.PASSWORD_REQUIRE_LOWER_CASE,
+                PASSWORD_REQUIRE_UPPER_CASE=config.PASSWORD_REQUIRE_UPPER_CASE,
+                PASSWORD_REQUIRE_NUMERALS=config.PASSWORD_REQUIRE_NUMERALS,
+                PASSWORD_REQUIRE_SPECIAL_CHARACTERS=config.PASSWORD_REQUIRE_SPECIAL_CHARACTERS,
+                PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS=config.PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS)
+
+
+def render_profile_cards(user: User):
+    return render_template("user/profile_cards.html", **profile_context(user))
+
+
+def render_user_row(user: User):
+    return render_template("user/user_row.html", user=user, deactivated=not user.active)
+
+
+# The rules are rendered as a list, so the message is marked safe for the alert
+def password_rules_message(password_rules_broken: list):
+    return Markup(f"Please ensure your password meets the following rules: {render_template('components/list.html', list=password_rules_broken)}")
+
 # ==============================================================================================================================================================
 #                                                                      View Routes
 # ==============================================================================================================================================================
@@ -24,11 +57,12 @@ import uuid
 def get_user_list():
     roles = []
     if current_user.can("create_or_edit_user"):
-        roles = Role.query.all()
+        roles = get_all_roles()
     active_users = User.query.filter_by(active=True).all()
     deactivated_users = []
     if current_user.can("manage_deactivated_users"):
         deactivated_users = User.query.filter_by(active=False).all()
+    attach_roles(active_users + deactivated_users)
     return render_template("user/user_list.html",
                            active_users=active_users,
                            deactivated_users=deactivated_users,
@@ -47,23 +81,12 @@ def get_user_list():
 def get_user_profile(user_uuid: str):
     if not validate_uuid(user_uuid):
         abort(400)
+    # Roles first so the profile's role is already known when the user is loaded
+    roles = get_all_roles()
     user = get_user_by_uuid(user_uuid)
-    is_users_profile = str(current_user.uuid) == user_uuid
     if not user:
         abort(404)
-    roles = Role.query.all()
-    return render_template("user/profile.html",
-                           user=user,
-                           roles=roles,
-                           is_users_profile=is_users_profile,
-                           PASSWORD_MIN_CHARACTERS=config.PASSWORD_MIN_CHARACTERS,
-                           PASSWORD_MAX_CHARACTERS=config.PASSWORD_MAX_CHARACTERS,
-                           PASSWORD_REQUIRE_LOWER_CASE=config.PASSWORD_REQUIRE_LOWER_CASE,
-                           PASSWORD_REQUIRE_UPPER_CASE=config.PASSWORD_REQUIRE_UPPER_CASE,
-                           PASSWORD_REQUIRE_NUMERALS=config.PASSWORD_REQUIRE_NUMERALS,
-                           PASSWORD_REQUIRE_SPECIAL_CHARACTERS=config.PASSWORD_REQUIRE_SPECIAL_CHARACTERS,
-                           PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS=config.PASSWORD_LIST_OF_ALLOWED_SPECIAL_CHARACTERS
-                           )
+    return render_template("user/profile.html", **profile_context(user, roles))
 
 @app.post('/users/<user_uuid>')
 @login_required
@@ -87,15 +110,14 @@ def post_update_user(user_uuid: str):
     if user_password and len(user_password) > 0 and (current_user.uuid == existing_user.uuid or current_user.can("update_passwords")):
         password_rules_broken = check_password_requirements(user_password)
         if len(password_rules_broken) > 0:
-            flash(f"Please ensure your password meets the following rules: {render_template('components/list.html', list=password_rules_broken)}", "error")
-            return redirect(url_for("get_user_list"))
+            return respond(url_for("get_user_list"), password_rules_message(password_rules_broken), "error", status=400)
         existing_user.update_password(user_password)
 
     # Ensure the role exists and is active
     existing_role = get_role_by_uuid(user_role)
     if (not existing_role) or (not existing_role.active):
-        flash(f"The role you selected for the new user could not be found, longer exists or is not active. Please try again.", "error")
-        return redirect(url_for("get_user_profile", user_uuid=user_uuid))
+        return respond(url_for("get_user_profile", user_uuid=user_uuid),
+                       f"The role you selected for the new user could not be found, longer exists or is not active. Please try again.", "error", status=400)
 
     # Ensure the user is not giving someone a role they shouldn't be able to
     if (existing_role.hidden or existing_role.system) and not current_user.role.system:
@@ -109,12 +131,12 @@ def post_update_user(user_uuid: str):
 
     # If a DB error occured tell the user
     if not save():
-        flash(f"A database error occured while creating the user. Please try again otherwise contact an admin.", "error")
-        return redirect(url_for("get_user_profile", user_uuid=user_uuid))
+        return respond(url_for("get_user_profile", user_uuid=user_uuid),
+                       f"A database error occured while creating the user. Please try again otherwise contact an admin.", "error", status=500)
 
     # Success!
-    flash(f"User updated successfully!", "success")
-    return redirect(url_for("get_user_profile", user_uuid=user_uuid))
+    return respond(url_for("get_user_profile", user_uuid=user_uuid), f"User updated successfully!", "success",
+                   lambda: render_profile_cards(existing_user))
 
 @app.post('/users/create')
 @login_required
@@ -128,47 +150,47 @@ def post_create_user():
     if (not user_first_name) or (not user_last_name) or (not user_email) or (not user_role) or (not user_password) or (not validate_address(user_email)):
         return abort(400)
 
-    # Check for existing user
-    existing_user = get_user_by_email(user_email)
-    if existing_user:
-        error_string = f'A user with the email address "{user_email}" already exists. '
-        if not existing_user.active:
-            error_string = f'A user with the email address "{user_email}" already exists and is deactivated. '
-            if not current_user.can("manage_deactivated_users"):
-                error_string += 'You will need an admin or someone with the Manage Disabled Users permission to activate the account.'
-        flash(error_string, "error")
-        return redirect(url_for("get_user_list"))
-
     # Make sure password rules are followed
     password_rules_broken = check_password_requirements(user_password)
     if len(password_rules_broken) > 0:
-        flash(f"Please ensure your password meets the following rules: {render_template('components/list.html', list=password_rules_broken)}", "error")
-        return redirect(url_for("get_user_list"))
+        return respond(url_for("get_user_list"), password_rules_message(password_rules_broken), "error", status=400)
 
     # Ensure the role exists and is active
     existing_role = get_role_by_uuid(user_role)
     if (not existing_role) or (not existing_role.active):
-        flash(f"The role you selected for the new user could not be found, longer exists or is not active. Please try again.", "error")
-        return redirect(url_for("get_user_list"))
+        return respond(url_for("get_user_list"),
+                       f"The role you selected for the new user could not be found, longer exists or is not active. Please try again.", "error", status=400)
 
     # Ensure the user is not giving someone a role they shouldn't be able to
     if (existing_role.hidden or existing_role.system) and not current_user.role.system:
         return abort(403)
 
-    # Create the user
-    is_created = create_if_not_exists(User(user_email, user_first_name, user_last_name, user_password, existing_role))
+    # Create the user. The insert is skipped if the email is taken, so the existing user is only looked up to explain why.
+    new_user = create_if_not_exists(User(user_email, user_first_name, user_last_name, user_password, existing_role))
 
     # If a DB error occured tell the user
-    if not is_created:
-        flash(f"A database error occured while creating the user. Please try again otherwise contact an admin.", "error")
-        return redirect(url_for("get_user_list"))
+    if new_user is False:
+        return respond(url_for("get_user_list"), "A database error occured while creating the user. Please try again otherwise contact an admin.",
+                       "error", status=500)
+
+    if not new_user:
+        existing_user = get_user_by_email(user_email)
+        if not existing_user:
+            return respond(url_for("get_user_list"), "The user could not be created as it conflicts with an existing user. Please try again "
+                           "otherwise contact an admin.", "error", status=409)
+        error_string = f'A user with the email address "{user_email}" already exists. '
+        if not existing_user.active:
+            error_string = f'A user with the email address "{user_email}" already exists and is deactivated. '
+            if not current_user.can("manage_deactivated_users"):
+                error_string += 'You will need an admin or someone with the Manage Disabled Users permission to activate the account.'
+        return respond(url_for("get_user_list"), error_string, "error", status=409)
 
     # Success!
-    flash(f"User created successfully!", "success")
-    return redirect(url_for("get_user_list"))
+    return respond(url_for("get_user_list"), f"User created successfully!", "success", lambda: render_user_row(new_user))
 
 
 @app.get('/password-reset')
+@priority(PRIORITY_CRITICAL)
 def get_password_reset_screen():
     user_uuid = request.args.get("uuid")
     reset_code = request.args.get("reset-code")
@@ -200,6 +222,8 @@ def get_password_reset_screen():
                             )
 
 @app.post('/password-reset')
+@priority(PRIORITY_CRITICAL)
+@rate_limit(config.RATE_LIMIT_PASSWORD_RESET_IP, by="ip")
 def post_complete_password_reset():
     user_uuid = request.form.get("uuid")
     reset_code = request.form.get("reset-code")
@@ -234,8 +258,11 @@ def post_complete_password_reset():
     flash("Your password has been successfully updated.", "success")
     return redirect(url_for("get_login_page"))
 
-# API route to perform a password reset Note: might want to rate limit this.
+# API route to perform a password reset
 @app.post('/send-password-reset')
+@priority(PRIORITY_CRITICAL)
+@rate_limit(config.RATE_LIMIT_PASSWORD_RESET_IP, by="ip")
+@rate_limit(config.RATE_LIMIT_PASSWORD_RESET_ACCOUNT, by="account")
 def post_send_password_reset():
     email_address = request.form.get("email")
     if email_address and validate_address(email_address):
@@ -276,13 +303,12 @@ def post_toggle_user_active(user_uuid: str):
     user.active = not user.active
     
     if not save():
-        flash(f"A database error occurred while updating the user. Please try again otherwise contact an admin.", "error")
-        return redirect(url_for("get_user_profile", user_uuid=user_uuid))
+        return respond(url_for("get_user_profile", user_uuid=user_uuid),
+                       f"A database error occurred while updating the user. Please try again otherwise contact an admin.", "error", status=500)
     
     # Success message
     status = "activated" if user.active else "deactivated"
-    flash(f"User {status} successfully!", "success")
-    return redirect(url_for("get_user_profile", user_uuid=user_uuid))
+    return respond(url_for("get_user_profile", user_uuid=user_uuid), f"User {status} successfully!", "success", lambda: render_profile_cards(user))
 
 
 # ==============================================================================================================================================================
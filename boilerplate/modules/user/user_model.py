@@ -1,16 +1,25 @@
-from boilerplate.db import db
-from boilerplate.modules.role.role_model import Role, get_role_by_name
+from boilerplate.db import db, insert_if_not_exists
+from boilerplate.modules.role.role_model import Role, get_role_by_name, get_roles_by_uuid, to_uuid
+from boilerplate.utils.loader import Loader
 from boilerplate.modules.role.role_actions import action_exists
 from boilerplate.utils.email import send_password_reset_email
-from datetime import datetime
+from boilerplate.utils.scheduler import scheduled
+from boilerplate.utils.search import SearchIndex
+from datetime import datetime, timedelta
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.sql import func
+from sqlalchemy import inspect, select
+from sqlalchemy.orm.attributes import set_committed_value
 from flask import url_for
 import boilerplate.config as config
+import boilerplate.utils.cache as cache
+import boilerplate.utils.stats as stats
+import boilerplate.utils.lumberjack as log
 import bcrypt
 import base64
 import uuid
-from dataclasses import dataclass, asdict
+from boilerplate.utils.json_provider import model_dict
+from dataclasses import dataclass
 
 
 # ==============================================================================================================================================================
@@ -63,7 +72,7 @@ class User(db.Model):
         return False
 
     def dict(self):
-        return asdict(self)
+        return model_dict(self)
 
     def get_id(self):
         return self.uuid
@@ -111,13 +120,46 @@ class User(db.Model):
             return True
         return False
 
+# Any committed change to a user is published so every worker can drop what it has cached about users. Logins and password resets only touch
+# columns no cached response or ETag is built from, so they don't throw everything away.
+cache.publish_on_commit(User, "users", ignore=("last_login", "password", "reset_code", "reset_time"))
+
+# Names weigh more than emails. Emails are indexed up to the @ as nearly every user shares a handful of domains, which would match most of the table.
+user_search = SearchIndex("user_search", User, {
+    "first_name": User.first_name,
+    "last_name": User.last_name,
+    "email": func.substr(User.email, 1, func.instr(User.email, "@") - 1),
+}, weights=(4, 4, 1))
+
+# Active and deactivated users and users per role, kept by the aggregates table (see utils/stats.py) so the role page and /api/v1/stats never count
+# the user table.
+def user_aggregate_keys(user):
+    return ("users.active" if user.active else "users.deactivated", f"users.role.{to_uuid(user.role_uuid)}")
+
+stats.count_rows(User, user_aggregate_keys, ("active", "role_uuid"), prefix="users.")
+
 # ==============================================================================================================================================================
 #                                                      Anonymous User Class & Methods Definition
 # ==============================================================================================================================================================
+# In memory stand in for the role of a logged out visitor. It is never stored, grants no actions and costs no database query to look up.
+class AnonymousRole():
+    id = None
+    uuid = None
+    active = True
+    hidden = True
+    system = False
+    name = "Anonymous"
+    description = "A visitor who is not logged in"
+    actions = ()
+
+
+anonymous_role = AnonymousRole()
+
+
 class AnonymousUser():
     @property
     def role(self):
-        return get_role_by_name("Anonymous")
+        return anonymous_role
 
     @property
     def is_active(self):
@@ -137,19 +179,45 @@ class AnonymousUser():
     def can(self, *args):
         return False
 
+
+# The anonymous principal shared by every request that never needs the logged in user (see classify_request in login_controller.py)
+anonymous_user = AnonymousUser()
+
 # ==============================================================================================================================================================
 #                                                             Non-Class Utility Functions
 # ==============================================================================================================================================================
+# Request scoped loader behind get_user_by_uuid. load_user fetches the logged in user through it, so later lookups of that user are free.
+user_by_uuid = Loader("user_by_uuid", User, "uuid", normalize=to_uuid)
+
 def get_user_by_uuid(user_uuid):
-    if isinstance(user_uuid, str):
-        user_uuid = uuid.UUID(user_uuid)
-    return User.query.filter_by(uuid=user_uuid).first()
+    user = user_by_uuid.load(user_uuid)
+    if user is not None:
+        attach_roles([user])
+    return user
+
+# User.role joins on role.uuid rather than the role's primary key, so the identity map can't answer it and every user.role is a query. This loads
+# the roles of all the given users in one IN query (through the role loader) and attaches them as if they had been lazy loaded.
+def attach_roles(users):
+    unloaded = [user for user in users if "role" in inspect(user).unloaded]
+    roles = get_roles_by_uuid(user.role_uuid for user in unloaded)
+    for user in unloaded:
+        if user.role_uuid in roles:
+            set_committed_value(user, "role", roles[user.role_uuid])
+    return users
 
 def get_user_by_email(user_email):
     return User.query.filter_by(email=user_email).first()
 
+# Users matching every word of the query, best first. Anything after an @ has to appear in the email's domain.
+def search_users(query: str, include_deactivated: bool = False, limit: int = 20, offset: int = 0):
+    query, _, domain = query.partition("@")
+    filters = [] if include_deactivated else [User.active == True]
+    if domain.strip():
+        filters.append(User.email.icontains(f"@{domain.strip()}", autoescape=True))
+    return user_search.search(query, *filters, limit=limit, offset=offset)
+
 def hash_password(password: str):
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(config.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed
 
@@ -197,6 +265,21 @@ def send_password_reset(email: str):
         return "success"
     return "fail"
 
+# Expired codes already fail validation, this just stops them lingering in the database
+@scheduled("clear_expired_reset_codes", every=config.RESET_CODE_CLEANUP_SECONDS)
+def clear_expired_reset_codes():
+    expired = datetime.utcnow() - timedelta(minutes=config.PASSWORD_RESET_CODE_VALIDITY)
+    try:
+        cleared = User.query.filter(User.reset_code != "NORESET", User.reset_time < expired).update(
+            {'reset_code': "NORESET", 'reset_time': datetime.fromtimestamp(0)}, synchronize_session=False)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    if cleared:
+        log.info(f"Cleared {cleared} expired password reset codes")
+    return cleared
+
 def replace_all_instances_of_role(existing_role: Role, new_role: Role):
     try:
         users = User.query.filter_by(role_uuid=existing_role.uuid).update({'role_uuid': new_role.uuid})
@@ -206,26 +289,49 @@ def replace_all_instances_of_role(existing_role: Role, new_role: Role):
         raise
 
 
+# Number of users in each role, ex. {role.uuid: 3}
+def count_users_by_role(roles):
+    counts = stats.get_counts(f"users.role.{role.uuid}" for role in roles)
+    return {role.uuid: counts[f"users.role.{role.uuid}"] for role in roles}
+
+
+# The first few users of each role, for the role cards, in one query however many roles are shown. The rest are a search away on the users page.
+def get_role_members(roles, limit: int):
+    members = {role.uuid: [] for role in roles}
+    if not members:
+        return members
+    number = func.row_number().over(partition_by=User.role_uuid, order_by=User.id).label("number")
+    numbered = select(User.id, number).where(User.role_uuid.in_(list(members))).subquery()
+    for user in User.query.join(numbered, User.id == numbered.c.id).filter(numbered.c.number <= limit).order_by(User.id):
+        members[user.role_uuid].append(user)
+    return members
+
+
+# Asks the user table rather than the counts, which reconciliation may not have caught up with
+def role_has_users(role: Role):
+    return db.session.query(User.id).filter_by(role_uuid=role.uuid).first() is not None
+
+
+# Will create a user if no user has the same email. Returns the stored user, None when the insert was skipped (ex. the email is taken) or
+# False when the database failed.
 def create_if_not_exists(user: User):
-    db_users = db.session.query(User).filter_by(email=user.email).all()
-    if len(db_users) == 0:
-        try:
-            db.session.add(user)
-            db.session.commit()
-            return True
-        except IntegrityError:
-            db.session.rollback()
-            # Thar be threading afoot. Ignoring integrity errors here, other threads already having created the user.
-            return False
+    try:
+        created = insert_if_not_exists(User, [user])
+    except SQLAlchemyError as error:
+        log.error(f"Could not create the user {user.email}: {error}")
+        return False
+    return created[0] if created else None
 
 
 # Generates a default user granting access to the app should there be no users in the database
 def seed_user_if_required():
     if config.DB_SEED:
-        all_users = db.session.query(User).all()
-        admin_role = get_role_by_name("System Admin")
-        default_role = get_role_by_name("Default Role")
-        if len(all_users) == 0:
-            create_if_not_exists(User("admin@default.com", "Admin", "User", "iloveflask!", admin_role))
-            create_if_not_exists(User("default@default.com", "Default", "User", "iloveflask!", default_role))
-            create_if_not_exists(User("deactive@default.com", "Deactive", "User", "iloveflask!", default_role, active=False))
+        if db.session.query(User.id).first() is None:
+            admin_role = get_role_by_name("System Admin")
+            default_role = get_role_by_name("Default Role")
+            # One statement however many workers seed at once. Users another worker created first are skipped.
+            insert_if_not_exists(User, [
+                User("admin@default.com", "Admin", "User", "iloveflask!", admin_role),
+                User("default@default.com", "Default", "User", "iloveflask!", default_role),
+                User("deactive@default.com", "Deactive", "User", "iloveflask!", default_role, active=False),
+            ])
@@ -71,3 +71,121 @@ function toggleInitialVisability() {
     // Toggle the initial state for next time this function is called
     initialState = !initialState;
 }
+
+/**
+ * Posts a form in the background and swaps what changed into the page instead of reloading it
+ * The server answers with the rendered fragments (see utils/fragments.py) and the alert to show. A redirect, such as to the login page after the
+ * session has expired, is followed. The form is never posted again by itself, as the server may already have made the change (ex. a second
+ * toggle-active post flips the user back), so it is only submitted normally when the browser is offline and the post can't have been sent.
+ * Otherwise a failed post shows an error and reloads the page to show what the server has.
+ * @param {HTMLFormElement} form - The form to post. A data-modal attribute names a modal to close once the post succeeds
+ * @returns {Promise<boolean>} Whether the post succeeded
+ */
+async function submitFragmentForm(form) {
+    let response;
+    try {
+        response = await fetch(form.action, {
+            method: "POST",
+            body: new FormData(form),
+            headers: {"X-Fragment": "true", "Accept": "application/json"},
+            credentials: "same-origin"
+        });
+    } catch (error) {
+        if (!navigator.onLine) {
+            form.submit();
+        } else {
+            reloadAfterError();
+        }
+        return false;
+    }
+
+    // Anything but JSON means we were sent somewhere else, so go there without posting the form again
+    const contentType = response.headers.get("Content-Type") || "";
+    if (response.redirected) {
+        window.location.assign(response.url);
+        return false;
+    }
+    if (!contentType.includes("application/json")) {
+        reloadAfterError();
+        return false;
+    }
+
+    const data = await response.json();
+    if ("html" in data) {
+        swapFragments(data.html, data.removed);
+        showAlert(data.alert);
+    } else {
+        // An error response (see errors.py) rather than a fragment
+        showAlertText(data.message, "danger");
+    }
+
+    // Close the form's modal once the change has been made
+    if (response.ok && form.dataset.modal) {
+        const modal = bootstrap.Modal.getInstance(document.getElementById(form.dataset.modal));
+        if (modal) modal.hide();
+    }
+    return response.ok;
+}
+
+/**
+ * Tells the user a post may not have gone through and reloads the page, once they have had a moment to read it, to show whether it did
+ */
+function reloadAfterError() {
+    showAlertText("The change could not be confirmed. The page will reload to show its current state.", "danger");
+    setTimeout(() => location.reload(), 2000);
+}
+
+/**
+ * Replaces each element in the HTML with the element on the page that has the same id
+ * Elements that aren't on the page yet are added to the end of the element named by their data-append-to attribute or the start of the one
+ * named by data-prepend-to
+ * @param {string} html - The rendered fragments
+ * @param {Array} removed - IDs of elements to remove from the page
+ */
+function swapFragments(html, removed) {
+    const template = document.createElement("template");
+    template.innerHTML = html;
+    for (const element of Array.from(template.content.children)) {
+        const existing = element.id ? document.getElementById(element.id) : null;
+        if (existing) {
+            existing.replaceWith(element);
+        } else if (element.dataset.appendTo && document.getElementById(element.dataset.appendTo)) {
+            document.getElementById(element.dataset.appendTo).append(element);
+        } else if (element.dataset.prependTo && document.getElementById(element.dataset.prependTo)) {
+            document.getElementById(element.dataset.prependTo).prepend(element);
+        }
+    }
+    for (const id of removed || []) {
+        const element = document.getElementById(id);
+        if (element) element.remove();
+    }
+}
+
+/**
+ * Shows a rendered alert above the page content, where flashed messages appear
+ * @param {string} alertHtml - The alert rendered by the server. Nothing is shown when it is empty
+ */
+function showAlert(alertHtml) {
+    if (!alertHtml) return;
+    const section = document.querySelector("main section");
+    section.insertAdjacentHTML("afterbegin", alertHtml);
+}
+
+/**
+ * Shows a plain text message as an alert
+ * @param {string} message - The text to show
+ * @param {string} alertClass - The Bootstrap alert class, ex. "danger"
+ */
+function showAlertText(message, alertClass) {
+    const alert = document.createElement("div");
+    alert.className = `alert alert-${alertClass} alert-dismissible fade show mt-2 ms-2 me-2 text-start`;
+    alert.setAttribute("role", "alert");
+    alert.textContent = message;
+    const close = document.createElement("button");
+    close.type = "button";
+    close.className = "btn-close";
+    close.setAttribute("data-bs-dismiss", "alert");
+    close.setAttribute("aria-label", "Close");
+    alert.append(close);
+    document.querySelector("main section").prepend(alert);
+}
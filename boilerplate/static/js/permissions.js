@@ -146,6 +146,7 @@ function selectAllCheckboxes() {
 /**
  * Submits the permissions form after updating checkbox values
  * Converts checked checkboxes to "true" and unchecked to "false" for form submission
+ * The created or edited role's card is swapped into the list in place (see submitFragmentForm in main.js)
  */
 function submitPermissionsForm() {
     // Get all checkboxes in the form
@@ -160,9 +161,8 @@ function submitPermissionsForm() {
             } else {
                 checkbox.value = "false";
             }
-            // Note: This will submit the form for every checkbox - likely a bug, should be after the loop
-            document.forms["permissions-form"].submit();
         }
+        submitFragmentForm(document.forms["permissions-form"]);
     }
 }
 
@@ -285,8 +285,8 @@ function confirmDeleteRole() {
         // If not matching, add validation error styling
         document.getElementById("delete-role-confirm").classList.add("is-invalid")
     } else {
-        // If matching, submit the delete form
-        document.getElementById("delete-role-form").submit();
+        // If matching, submit the delete form. The role's card is removed from the list in place.
+        submitFragmentForm(document.getElementById("delete-role-form"));
     }
 }
 
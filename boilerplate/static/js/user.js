@@ -1,13 +1,17 @@
 /**
  * Validates the create-user-form and submits it if all fields are valid and password requirements are met
  * Uses HTML5 form validation and checks if the password validity flag is set to "true"
+ * The new user's row is added to the list in place (see submitFragmentForm in main.js)
  */
-function submitUserForm() {
+async function submitUserForm() {
+    const form = document.forms["create-user-form"];
     // Check if all required form fields are valid
-    if (document.forms["create-user-form"].reportValidity()) {
+    if (form.reportValidity()) {
         // Ensure the password meets all requirements before submitting
         if (document.getElementById("passed-validity").value === "true") {
-            document.forms["create-user-form"].submit();
+            if (await submitFragmentForm(form)) {
+                form.reset();
+            }
         }
     }
 }
@@ -17,7 +21,7 @@ function submitUserForm() {
  * Allows form submission if password requirements are met or if both password fields are empty
  * @description This allows users to update their profile without changing their password
  */
-function submitUserUpdate() {
+async function submitUserUpdate() {
     // Check if all required form fields are valid
     if (document.forms["update-user-form"].reportValidity()) {
         // Get references to the password input elements
@@ -40,21 +44,89 @@ function submitUserUpdate() {
 
         // Submit the form if password requirements are met OR both password fields are empty
         if ((document.getElementById("passed-validity").value === "true") || (isPasswordFieldEmpty && isPasswordConfirmFieldEmpty)){
-            document.forms["update-user-form"].submit();
+            // The updated profile cards replace the old ones and come back showing the details rather than the form
+            if (await submitFragmentForm(document.forms["update-user-form"])) {
+                initialState = true;
+            }
         }
     }
 }
 
 /**
  * Toggles the active status of a user by sending a POST request to the backend
- * Creates a temporary form and submits it to the toggle-active endpoint
+ * Creates a temporary form and posts it to the toggle-active endpoint, which sends back the updated profile cards
  * @param {string} userUuid - The UUID of the user to toggle (activate/deactivate)
  */
-function toggleUserActive(userUuid) {
+async function toggleUserActive(userUuid) {
     // Create a form element to submit the POST request
     const form = document.createElement('form');
     form.method = 'POST';
     form.action = `/users/${userUuid}/toggle-active`;
     document.body.appendChild(form);
-    form.submit();
+    await submitFragmentForm(form);
+    form.remove();
+}
+
+// Pending typeahead lookup, replaced by each keystroke
+let userSearchTimer = null;
+let userSearchRequest = null;
+
+/**
+ * Looks up users matching the search box through /api/v1/users/search and lists them under it
+ * Waits for a pause in typing and cancels a lookup still in flight, so only the last query is shown
+ * @param {HTMLInputElement} input - The search box. Its data-search-url and data-profile-url attributes give the endpoint and profile links
+ */
+function searchUsers(input) {
+    clearTimeout(userSearchTimer);
+    if (userSearchRequest) userSearchRequest.abort();
+    const query = input.value.trim();
+    if (!query) {
+        showUserSearchResults(input, []);
+        return;
+    }
+    userSearchTimer = setTimeout(async function () {
+        userSearchRequest = new AbortController();
+        try {
+            const response = await fetch(`${input.dataset.searchUrl}?q=${encodeURIComponent(query)}`, {
+                headers: {"Accept": "application/json"},
+                credentials: "same-origin",
+                signal: userSearchRequest.signal
+            });
+            if (!response.ok) return;
+            const data = await response.json();
+            showUserSearchResults(input, data.results);
+        } catch (error) {
+            // Cancelled by a newer lookup, or offline. The table filter still works either way.
+        }
+    }, 150);
+}
+
+/**
+ * Replaces the typeahead list with links to the given users' profiles and hides it when there are none
+ * @param {HTMLInputElement} input - The search box the list belongs to
+ * @param {Array} users - Users as returned by /api/v1/users/search
+ */
+function showUserSearchResults(input, users) {
+    const list = document.getElementById(input.getAttribute("aria-controls"));
+    list.replaceChildren();
+    for (const user of users) {
+        const link = document.createElement("a");
+        link.className = "list-group-item list-group-item-action";
+        link.href = `${input.dataset.profileUrl}/${user.uuid}`;
+        const name = document.createElement("strong");
+        name.textContent = `${user.first_name} ${user.last_name}`;
+        const email = document.createElement("small");
+        email.className = "text-muted ms-2";
+        email.textContent = user.email;
+        link.append(name, email);
+        if (!user.active) {
+            const badge = document.createElement("span");
+            badge.className = "badge text-bg-secondary ms-2";
+            badge.textContent = "Deactivated";
+            link.append(badge);
+        }
+        list.append(link);
+    }
+    list.classList.toggle("d-none", users.length === 0);
+    input.setAttribute("aria-expanded", users.length > 0);
 }
\ No newline at end of file
@@ -0,0 +1,180 @@
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from flask import url_for
+import hashlib
+import shutil
+import gzip
+import json
+import os
+
+# Brotli is optional. Without it only the .gz siblings are written.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+STATIC_FOLDER = app.static_folder
+DIST_FOLDER = os.path.join(STATIC_FOLDER, config.ASSETS_DIST_FOLDER)
+MANIFEST_PATH = os.path.join(DIST_FOLDER, "manifest.json")
+ASSET_EXTENSIONS = (".css", ".js")
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# Maps source paths relative to the static folder (ex. "css/main.css") to their fingerprinted path (ex. "dist/css/main.3f2a9c1b7d4e.css")
+manifest = {}
+
+# ==============================================================================================================================================================
+#                                                                      Minifiers
+# ==============================================================================================================================================================
+# These are deliberately conservative. They only remove comments and whitespace and leave strings (including the inline SVG data URIs in the
+# stylesheets and JS template literals) untouched. Newlines are kept in JS so automatic semicolon insertion behaves exactly as before.
+
+def minify_css(source: str):
+    output = []
+    index = 0
+    length = len(source)
+    while index < length:
+        char = source[index]
+        if char in ("'", '"'):
+            end = index + 1
+            while end < length and source[end] != char:
+                end += 2 if source[end] == "\\" else 1
+            output.append(source[index:end + 1])
+            index = end + 1
+        elif source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            index = length if end == -1 else end + 2
+        elif char.isspace():
+            while index < length and source[index].isspace():
+                index += 1
+            previous = output[-1][-1:] if output else ""
+            following = source[index:index + 1]
+            if previous and previous not in "{};:,>" and following not in "{};,>":
+                output.append(" ")
+        else:
+            if char == "}" and output and output[-1] == ";":
+                output.pop()
+            output.append(char)
+            index += 1
+    return "".join(output).strip()
+
+
+def minify_js(source: str):
+    output = []
+    index = 0
+    length = len(source)
+    line_start = True
+    while index < length:
+        char = source[index]
+        if line_start:
+            while index < length and source[index] in " \t\r":
+                index += 1
+            if source.startswith("//", index):
+                end = source.find("\n", index)
+                index = length if end == -1 else end + 1
+                continue
+            line_start = False
+            continue
+        if char in ("'", '"', "`"):
+            end = index + 1
+            while end < length and source[end] != char:
+                end += 2 if source[end] == "\\" else 1
+            output.append(source[index:end + 1])
+            index = end + 1
+        elif source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            index = length if end == -1 else end + 2
+        elif char == "\n":
+            while output and output[-1] in (" ", "\t", "\r"):
+                output.pop()
+            if output and output[-1] != "\n":
+                output.append("\n")
+            line_start = True
+            index += 1
+        else:
+            output.append(char)
+            index += 1
+    return "".join(output).strip() + "\n"
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def load_manifest():
+    global manifest
+    try:
+        with open(MANIFEST_PATH, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        manifest = {}
+    return manifest
+
+
+def fingerprint(content: bytes):
+    return hashlib.sha256(content).hexdigest()[:12]
+
+
+# Writes the minified, fingerprinted copy of every css/js asset along with its precompressed siblings and returns the new manifest.
+def build_assets():
+    if os.path.isdir(DIST_FOLDER):
+        shutil.rmtree(DIST_FOLDER)
+    new_manifest = {}
+    for directory, _, files in os.walk(STATIC_FOLDER):
+        if os.path.commonpath([directory, DIST_FOLDER]) == DIST_FOLDER:
+            continue
+        for file_name in sorted(files):
+            if not file_name.endswith(ASSET_EXTENSIONS):
+                continue
+            source_path = os.path.join(directory, file_name)
+            relative_path = os.path.relpath(source_path, STATIC_FOLDER).replace(os.sep, "/")
+            with open(source_path, "r", encoding="utf-8") as source_file:
+                source = source_file.read()
+            minified = minify_css(source) if file_name.endswith(".css") else minify_js(source)
+            content = minified.encode("utf-8")
+
+            base, extension = os.path.splitext(relative_path)
+            hashed_path = f"{config.ASSETS_DIST_FOLDER}/{base}.{fingerprint(content)}{extension}"
+            output_path = os.path.join(STATIC_FOLDER, hashed_path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "wb") as output_file:
+                output_file.write(content)
+            with open(output_path + ".gz", "wb") as output_file:
+                output_file.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli:
+                with open(output_path + ".br", "wb") as output_file:
+                    output_file.write(brotli.compress(content, quality=11))
+            new_manifest[relative_path] = hashed_path
+
+    os.makedirs(DIST_FOLDER, exist_ok=True)
+    with open(MANIFEST_PATH, "w") as manifest_file:
+        json.dump(new_manifest, manifest_file, indent=2, sort_keys=True)
+    return new_manifest
+
+
+# Resolves a static asset to its fingerprinted copy when a manifest has been built, otherwise to the original file.
+@app.template_global()
+def static_url(filename: str):
+    if config.ASSETS_USE_MANIFEST:
+        filename = manifest.get(filename, filename)
+    return url_for("static", filename=filename)
+
+# ==============================================================================================================================================================
+#                                                                     CLI Commands
+# ==============================================================================================================================================================
+# Usage: flask --app boilerplate build-assets
+@app.cli.command("build-assets")
+def build_assets_command():
+    built = build_assets()
+    load_manifest()
+    for source, hashed in sorted(built.items()):
+        print(f"{source} -> {hashed}", flush=True)
+    if not brotli:
+        log.warning("The brotli package is not installed. Only gzip precompressed assets were written.")
+    print(f"Built {len(built)} assets into {DIST_FOLDER}", flush=True)
+
+
+load_manifest()
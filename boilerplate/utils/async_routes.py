@@ -0,0 +1,16 @@
+import boilerplate.config as config
+from functools import wraps
+
+# ==============================================================================================================================================================
+#                                                                      Decorators
+# ==============================================================================================================================================================
+# Swaps a view for its async variant when serving over ASGI (see boilerplate/asgi.py). There the variant's database calls run on the server's event
+# loop through an async session (see db.async_session). Under WSGI each async view would get an event loop and a database connection of its own,
+# so the sync view is kept. The variant takes the view's name, so the endpoint is the same either way. Place it directly above the view, under
+# every other decorator.
+def async_variant(async_function):
+    def decorator(function):
+        if config.SERVER_INTERFACE != "asgi":
+            return function
+        return wraps(function)(async_function)
+    return decorator
@@ -0,0 +1,487 @@
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+import builtins
+import threading
+import sqlite3
+import pickle
+import select
+import socket
+import time
+import os
+
+# ==============================================================================================================================================================
+#                                                                      Exceptions
+# ==============================================================================================================================================================
+class CacheBackendError(Exception):
+    def __init__(self, message, *args):
+        super().__init__(args)
+        self.message = message
+
+    def __str__(self):
+        return f'The cache backend returned an error: {self.message}'
+
+class UnknownCacheBackendError(Exception):
+    def __init__(self, name, *args):
+        super().__init__(args)
+        self.name = name
+
+    def __str__(self):
+        return f'The cache backend "{self.name}" is not a known backend. Please set CACHE_BACKEND to one of "memory", "sqlite" or "redis".'
+
+
+# ==============================================================================================================================================================
+#                                                                   Cache Backends
+# ==============================================================================================================================================================
+# Every backend offers the same small interface: get/set/delete/clear/purge_expired for cached values (with a TTL in seconds and LRU eviction) and incr/counter for
+# the generation counters used by the invalidation bus below. Counters are kept apart from cached values so they are never evicted.
+
+# In process cache. Fastest option but each gunicorn worker has its own copy so it only sees invalidations published by its own process.
+class MemoryCache():
+    def __init__(self, max_entries: int = config.CACHE_MAX_ENTRIES, default_ttl: int = config.CACHE_DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires and expires < time.time():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else 0
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [key for key, (_, expires) in self.entries.items() if expires and expires < now]
+            for key in expired:
+                del self.entries[key]
+        return len(expired)
+
+    def incr(self, key: str):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def counter(self, key: str):
+        return self.counters.get(key, 0)
+
+
+# SQLite file cache. Shared by every worker on the same host without needing an extra service, which makes it the default for the docker-compose setup.
+# Recency is only kept roughly, to the nearest touch_seconds, and each worker trims the cache back to max_entries every evict_every sets, so a hit
+# is a read and a set is one write.
+class SQLiteCache():
+    def __init__(self, path: str = config.CACHE_SQLITE_PATH, max_entries: int = config.CACHE_MAX_ENTRIES, default_ttl: int = config.CACHE_DEFAULT_TTL,
+                 touch_seconds: float = config.CACHE_TOUCH_SECONDS, evict_every: int = config.CACHE_EVICT_EVERY):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.touch_seconds = touch_seconds
+        self.evict_every = max(1, evict_every)
+        self.sets = 0
+        self.local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed)")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_counter (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    # Connections are kept per thread and per process. A connection inherited through a fork must never be reused by the child.
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str, default=None):
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute("SELECT value, expires, accessed FROM cache_entry WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires and expires < now:
+            connection.execute("DELETE FROM cache_entry WHERE key = ? AND expires = ?", (key, expires))
+            return default
+        if now - accessed >= self.touch_seconds:
+            connection.execute("UPDATE cache_entry SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(value)
+
+    def set(self, key: str, value, ttl: int = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        expires = now + ttl if ttl else 0
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO cache_entry (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                           (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires, now))
+        # Not locked. Two threads counting the same set only moves the next eviction along by one.
+        self.sets += 1
+        if self.sets >= self.evict_every:
+            self.sets = 0
+            self.evict()
+
+    # Drops everything but the max_entries most recently used entries, walking the accessed index from the newest end
+    def evict(self):
+        return self._connection().execute("DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                                          (self.max_entries,)).rowcount
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entry")
+
+    # Expired entries are otherwise only removed when they are read again
+    def purge_expired(self):
+        return self._connection().execute("DELETE FROM cache_entry WHERE expires > 0 AND expires < ?", (time.time(),)).rowcount
+
+    def incr(self, key: str):
+        connection = self._connection()
+        return connection.execute("INSERT INTO cache_counter (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value",
+                                  (key,)).fetchone()[0]
+
+    def counter(self, key: str):
+        row = self._connection().execute("SELECT value FROM cache_counter WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+
+# Redis protocol cache. Speaks RESP directly over a socket so no client library is required. Works with Redis 4+, Valkey, KeyDB or any stand-in
+# that understands GET, SET (with PX), DEL, INCR, SCAN and UNLINK. Eviction is left to the server's maxmemory-policy (use allkeys-lru).
+class RedisCache():
+    # Commands that do the same thing when sent twice. Anything else (ex. INCR) may already have been applied when the connection dropped, so
+    # it is never sent again.
+    retryable = frozenset({"GET", "SET", "DEL", "SCAN", "UNLINK"})
+
+    def __init__(self, url: str = config.CACHE_REDIS_URL, prefix: str = config.CACHE_KEY_PREFIX, default_ttl: int = config.CACHE_DEFAULT_TTL):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.database = int(parsed.path.strip("/") or 0)
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.local = threading.local()
+
+    def _connection(self):
+        stream = getattr(self.local, "stream", None)
+        if stream is not None and self.local.pid == os.getpid() and self._closed_by_server():
+            self._disconnect()
+            stream = None
+        if stream is None or self.local.pid != os.getpid():
+            connection = socket.create_connection((self.host, self.port), timeout=2)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.local.socket = connection
+            self.local.stream = stream = connection.makefile("rb")
+            self.local.pid = os.getpid()
+            if self.password:
+                self._send(stream, "AUTH", self.password)
+            if self.database:
+                self._send(stream, "SELECT", self.database)
+        return stream
+
+    # The server never sends anything unasked, so an idle connection with something to read has been closed (ex. by its idle timeout). Checked
+    # before sending so a command that can't be retried isn't lost to a connection that was already gone.
+    def _closed_by_server(self):
+        readable, _, _ = select.select([self.local.socket], [], [], 0)
+        return bool(readable)
+
+    def _disconnect(self):
+        connection = getattr(self.local, "socket", None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+        self.local.socket = None
+        self.local.stream = None
+
+    def _send(self, stream, *args):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            payload.append(f"${len(arg)}\r\n".encode() + arg + b"\r\n")
+        self.local.socket.sendall(b"".join(payload))
+        return self._read_reply(stream)
+
+    def _read_reply(self, stream):
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("The cache server closed the connection.")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise CacheBackendError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            data = stream.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length == -1:
+                return None
+            return [self._read_reply(stream) for _ in range(length)]
+        raise CacheBackendError(f"Unexpected reply from the cache server: {line!r}")
+
+    # Runs a command, reconnecting and sending it again once if the connection went away while it ran (server restart, etc.) and it is safe to
+    # repeat (reads, SET, DEL and UNLINK, never INCR)
+    def _command(self, *args):
+        try:
+            return self._send(self._connection(), *args)
+        except (OSError, ConnectionError):
+            self._disconnect()
+            if args[0] not in self.retryable:
+                raise
+            return self._send(self._connection(), *args)
+
+    def get(self, key: str, default=None):
+        value = self._command("GET", self.prefix + key)
+        if value is None:
+            return default
+        return pickle.loads(value)
+
+    def set(self, key: str, value, ttl: int = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        args = ["SET", self.prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        self._command(*args)
+
+    def delete(self, key: str):
+        self._command("DEL", self.prefix + key)
+
+    # Unlinks the cached values under the prefix, a batch at a time. The generation counters and anything else in the database are left alone.
+    def clear(self):
+        pattern = "".join("\\" + character if character in "*?[]\\" else character for character in self.prefix) + "*"
+        counters = (self.prefix + "counter:").encode()
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            keys = [key for key in keys if not key.startswith(counters)]
+            if keys:
+                self._command("UNLINK", *keys)
+            if cursor == b"0":
+                return
+
+    # The server expires keys itself
+    def purge_expired(self):
+        return 0
+
+    def incr(self, key: str):
+        return self._command("INCR", self.prefix + "counter:" + key)
+
+    def counter(self, key: str):
+        value = self._command("GET", self.prefix + "counter:" + key)
+        return int(value) if value is not None else 0
+
+
+# Creates the backend named in config. Unknown names fail loudly at boot rather than silently falling back to a per worker cache.
+def create_backend(name: str = None):
+    name = name or config.CACHE_BACKEND
+    if name == "memory":
+        return MemoryCache()
+    if name == "sqlite":
+        return SQLiteCache()
+    if name == "redis":
+        return RedisCache()
+    raise UnknownCacheBackendError(name)
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+backend = create_backend()
+
+# Invalidation bus state for this worker
+subscribers = {}
+seen_generations = {}
+last_poll = 0.0
+
+# Maps model classes to the channel that is published when a commit changes them and the columns whose changes don't count. Filled in by
+# publish_on_commit.
+model_channels = {}
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# A cache must never take the app down with it. Backend failures are logged and treated as a miss.
+def get(key: str, default=None):
+    try:
+        return backend.get(key, default)
+    except (CacheBackendError, OSError, sqlite3.Error, pickle.UnpicklingError) as error:
+        log.warning(f"Cache get failed for key {key}: {error}")
+        return default
+
+def set(key: str, value, ttl: int = None):
+    try:
+        backend.set(key, value, ttl)
+        return True
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Cache set failed for key {key}: {error}")
+        return False
+
+def delete(key: str):
+    try:
+        backend.delete(key)
+        return True
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Cache delete failed for key {key}: {error}")
+        return False
+
+# Atomically increments a shared counter and returns the new value, or None if the backend is unavailable.
+def incr(key: str):
+    try:
+        return backend.incr(key)
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Cache incr failed for key {key}: {error}")
+        return None
+
+def clear():
+    try:
+        backend.clear()
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Cache clear failed: {error}")
+
+# Removes expired entries and returns how many were removed
+def purge_expired():
+    try:
+        return backend.purge_expired()
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Cache purge failed: {error}")
+        return 0
+
+# ==============================================================================================================================================================
+#                                                                   Invalidation Bus
+# ==============================================================================================================================================================
+# Each channel (ex. "roles" or "users") has a generation counter in the shared backend. Publishing bumps the counter, so any worker can tell its copy
+# of the data is stale by comparing generations. Caches can either fold generation(channel) into their keys or subscribe a callback to be told.
+
+def generation(channel: str):
+    try:
+        return backend.counter(f"generation:{channel}")
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.warning(f"Could not read the cache generation for channel {channel}: {error}")
+        return -1
+
+def publish(channel: str):
+    try:
+        current = backend.incr(f"generation:{channel}")
+    except (CacheBackendError, OSError, sqlite3.Error) as error:
+        log.error(f"Could not publish a cache invalidation for channel {channel}: {error}")
+        return
+    notify(channel, current)
+
+def subscribe(channel: str, callback):
+    subscribers.setdefault(channel, []).append(callback)
+    seen_generations.setdefault(channel, generation(channel))
+
+# Fires the local subscribers of a channel if its generation moved since this worker last looked.
+def notify(channel: str, current: int):
+    if seen_generations.get(channel) == current:
+        return
+    seen_generations[channel] = current
+    for callback in subscribers.get(channel, []):
+        try:
+            callback(channel)
+        except Exception as error:
+            log.error(f"Cache invalidation subscriber for channel {channel} failed: {error}")
+
+# Checks every subscribed channel for changes made by other workers. Free when nothing is subscribed and throttled by CACHE_INVALIDATION_POLL_SECONDS.
+def poll_invalidations(force: bool = False):
+    global last_poll
+    if not subscribers:
+        return
+    now = time.monotonic()
+    if not force and now - last_poll < config.CACHE_INVALIDATION_POLL_SECONDS:
+        return
+    last_poll = now
+    for channel in list(subscribers):
+        notify(channel, generation(channel))
+
+@app.before_request
+def poll_cache_invalidations():
+    poll_invalidations()
+
+# Registers a model class so any committed insert, update or delete of it publishes the channel. Updates that only change ignored columns
+# (ex. bookkeeping like a last login time that nothing cached shows) don't publish.
+def publish_on_commit(model, channel: str, ignore: tuple = ()):
+    model_channels[model] = (channel, frozenset(ignore))
+
+
+def _mark_changed(session, model):
+    channel, _ = model_channels.get(model, (None, None))
+    if channel:
+        session.info.setdefault("cache_invalidations", builtins.set()).add(channel)
+
+
+def _only_ignored_changes(instance):
+    _, ignore = model_channels.get(type(instance), (None, frozenset()))
+    if not ignore:
+        return False
+    state = inspect(instance)
+    return not any(attribute.history.has_changes() for attribute in state.attrs if attribute.key not in ignore)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_changes(session, flush_context):
+    for instance in list(session.new) + list(session.deleted):
+        _mark_changed(session, type(instance))
+    for instance in session.dirty:
+        if not _only_ignored_changes(instance):
+            _mark_changed(session, type(instance))
+
+
+# Bulk query.update()/query.delete() calls skip the flush so they are caught here instead
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        for mapper in orm_execute_state.all_mappers:
+            _mark_changed(orm_execute_state.session, mapper.class_)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_changes(session):
+    for channel in session.info.pop("cache_invalidations", ()):
+        publish(channel)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop("cache_invalidations", None)
@@ -0,0 +1,153 @@
+from boilerplate.app import app
+import boilerplate.config as config
+from flask import request
+from jinja2.ext import Extension
+import zlib
+import re
+
+# Brotli and zstd are optional. Without them responses are only gzipped.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+COMPRESSIBLE_MIMETYPES = frozenset(mimetype.strip() for mimetype in config.COMPRESSION_MIMETYPES if mimetype.strip())
+# Whitespace around a line break, which is all that template indentation and blank lines are made of
+LINE_BREAK_WHITESPACE = re.compile(r"\s*\n\s*")
+# Elements whose whitespace is content
+PRESERVED_ELEMENTS = re.compile(r"(<pre\b.*?</pre>|<textarea\b.*?</textarea>)", re.IGNORECASE | re.DOTALL)
+
+# ==============================================================================================================================================================
+#                                                                       Encoders
+# ==============================================================================================================================================================
+# Each encoder compresses one response. flush() ends a chunk so the client can decode everything sent so far, which is what keeps a compressed
+# streamed response streaming.
+class GzipEncoder():
+    def __init__(self):
+        self.compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder():
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder():
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=config.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# In order of preference when the client accepts several equally
+encoders = {}
+if zstandard:
+    encoders["zstd"] = ZstdEncoder
+if brotli:
+    encoders["br"] = BrotliEncoder
+encoders["gzip"] = GzipEncoder
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def negotiate_encoding():
+    return request.accept_encodings.best_match(encoders)
+
+
+def compress_stream(chunks, encoder):
+    for chunk in chunks:
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+# A compressed body is a different representation, so a strong ETag can't stay strong. Weak comparison (used for If-None-Match) still matches it.
+def weaken_etag(response):
+    tag, weak = response.get_etag()
+    if tag and not weak:
+        response.set_etag(tag, weak=True)
+
+# ==============================================================================================================================================================
+#                                                                     Request Hooks
+# ==============================================================================================================================================================
+# Compresses dynamic responses. Static files are left alone: NGINX serves their precompressed siblings (see utils/assets.py).
+@app.after_request
+def compress_response(response):
+    if not config.COMPRESSION_ENABLED or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if response.status_code == 304:
+        if encoding:
+            weaken_etag(response)
+        return response
+    if not encoding or response.status_code < 200 or response.status_code == 204 or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoders[encoding]())
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config.COMPRESSION_MIN_SIZE:
+            return response
+        encoder = encoders[encoding]()
+        compressed = encoder.compress(data) + encoder.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    weaken_etag(response)
+    return response
+
+# ==============================================================================================================================================================
+#                                                                   Template Whitespace
+# ==============================================================================================================================================================
+# Collapses the indentation, trailing spaces and blank lines of HTML templates into single line breaks, keeping <pre> and <textarea> intact. It runs
+# once when a template is compiled, so rendering costs nothing extra.
+class CollapseWhitespace(Extension):
+    def preprocess(self, source, name, filename=None):
+        if not name or not name.endswith(".html"):
+            return source
+        parts = PRESERVED_ELEMENTS.split(source)
+        return "".join(part if index % 2 else LINE_BREAK_WHITESPACE.sub("\n", part) for index, part in enumerate(parts))
+
+
+# Drop the line breaks and indentation block tags leave behind
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+if config.HTML_COLLAPSE_WHITESPACE:
+    app.jinja_env.add_extension(CollapseWhitespace)
@@ -0,0 +1,270 @@
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+import boilerplate.utils.cache as cache
+from boilerplate.modules.role.role_decorators import require_system_role
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
+from flask import request, abort
+from flask_login import login_required
+import tracemalloc
+import psutil
+import time
+import gc
+import os
+import re
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+TRACEMALLOC_KEY = "diagnostics:tracemalloc"
+TRACEMALLOC_CHANNEL = "diagnostics"
+GROUP_BY = ("lineno", "filename", "traceback")
+# <timestamp>-<pid>.snapshot
+SNAPSHOT_NAME = re.compile(r"^(\d{8}-\d{6}-\d{3})-(\d+)\.snapshot$")
+MB = 1024 * 1024
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+last_sample = 0.0
+# Allocations made by tracemalloc itself and by the import system are noise when hunting leaks
+snapshot_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# ==============================================================================================================================================================
+#                                                                   Worker Memory
+# ==============================================================================================================================================================
+def memory_sample(pid: int = None):
+    process = psutil.Process(pid)
+    info = process.memory_full_info()
+    return {"time": int(time.time()), "rss_mb": round(info.rss / MB, 1), "uss_mb": round(info.uss / MB, 1)}
+
+
+# Every worker records its own memory in the shared cache at most once every DIAGNOSTICS_SAMPLE_SECONDS, keeping the last DIAGNOSTICS_HISTORY samples.
+# Reading USS walks the process's page tables, so it is only done when a sample is due.
+def record_memory_sample(force: bool = False):
+    global last_sample
+    now = time.monotonic()
+    if not force and now - last_sample < config.DIAGNOSTICS_SAMPLE_SECONDS:
+        return
+    last_sample = now
+    key = f"diagnostics:memory:{os.getpid()}"
+    try:
+        sample = memory_sample()
+    except psutil.Error as error:
+        log.warning(f"Could not sample worker memory: {error}")
+        return
+    history = (cache.get(key, []) or [])[-(config.DIAGNOSTICS_HISTORY - 1):] + [sample]
+    cache.set(key, history, ttl=config.DIAGNOSTICS_SAMPLE_SECONDS * config.DIAGNOSTICS_HISTORY)
+
+
+# The serving worker plus its siblings when running under a gunicorn master. Anything else (flask run, tests) only reports itself.
+def worker_pids():
+    try:
+        parent = psutil.Process().parent()
+        if parent is not None and "gunicorn" in " ".join(parent.cmdline()):
+            return sorted(child.pid for child in parent.children())
+    except psutil.Error:
+        pass
+    return [os.getpid()]
+
+
+def worker_report():
+    workers = []
+    for pid in worker_pids():
+        try:
+            current = memory_sample(pid)
+        except psutil.Error:
+            continue
+        workers.append({"pid": pid, **current, "history": cache.get(f"diagnostics:memory:{pid}", []) or []})
+    return workers
+
+
+# Sizes of the usual suspects inside the serving worker
+def process_report():
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "pid": os.getpid(),
+        "gc_objects": len(gc.get_objects()),
+        "gc_frozen": gc.get_freeze_count(),
+        "gc_counts": gc.get_count(),
+        "jinja_cached_templates": len(app.jinja_env.cache) if app.jinja_env.cache is not None else 0,
+        "tracemalloc": {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_mb": round(traced / MB, 2),
+            "peak_mb": round(peak / MB, 2),
+        },
+    }
+
+# ==============================================================================================================================================================
+#                                                                     Tracemalloc
+# ==============================================================================================================================================================
+# Tracing is switched on and off for every worker at once. The wanted state lives in the shared cache and each worker applies it when it is told
+# about the change through the invalidation bus.
+def apply_tracemalloc_state(channel: str = None):
+    state = cache.get(TRACEMALLOC_KEY) or {"enabled": False}
+    if state["enabled"] and not tracemalloc.is_tracing():
+        tracemalloc.start(state.get("frames", config.DIAGNOSTICS_TRACEMALLOC_FRAMES))
+        log.info(f"tracemalloc started with {tracemalloc.get_traceback_limit()} frames")
+    elif not state["enabled"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        log.info("tracemalloc stopped")
+
+
+def set_tracemalloc(enabled: bool, frames: int = None):
+    cache.set(TRACEMALLOC_KEY, {"enabled": enabled, "frames": frames or config.DIAGNOSTICS_TRACEMALLOC_FRAMES}, ttl=365 * 24 * 60 * 60)
+    cache.publish(TRACEMALLOC_CHANNEL)
+    apply_tracemalloc_state()
+
+
+def list_snapshots():
+    snapshots = []
+    try:
+        names = sorted(os.listdir(config.DIAGNOSTICS_FOLDER), reverse=True)
+    except OSError:
+        return snapshots
+    for name in names:
+        match = SNAPSHOT_NAME.match(name)
+        if match:
+            snapshots.append({"name": name, "created": match.group(1), "pid": int(match.group(2))})
+    return snapshots
+
+
+# Dumps a snapshot of the serving worker to disk so any worker can later read or diff it. Only the newest DIAGNOSTICS_MAX_SNAPSHOTS are kept.
+def take_snapshot():
+    snapshot = tracemalloc.take_snapshot().filter_traces(snapshot_filters)
+    os.makedirs(config.DIAGNOSTICS_FOLDER, exist_ok=True)
+    now = time.time()
+    name = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}-{os.getpid()}.snapshot"
+    snapshot.dump(os.path.join(config.DIAGNOSTICS_FOLDER, name))
+    for stale in list_snapshots()[config.DIAGNOSTICS_MAX_SNAPSHOTS:]:
+        try:
+            os.remove(os.path.join(config.DIAGNOSTICS_FOLDER, stale["name"]))
+        except FileNotFoundError:
+            pass
+    return name, snapshot
+
+
+def load_snapshot(name: str):
+    if not SNAPSHOT_NAME.match(name):
+        return None
+    try:
+        return tracemalloc.Snapshot.load(os.path.join(config.DIAGNOSTICS_FOLDER, name))
+    except OSError:
+        return None
+
+
+def format_statistics(statistics, limit: int):
+    formatted = []
+    for statistic in statistics[:limit]:
+        entry = {
+            "location": [f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback],
+            "size_kb": round(statistic.size / 1024, 1),
+            "count": statistic.count,
+        }
+        if hasattr(statistic, "size_diff"):
+            entry["size_diff_kb"] = round(statistic.size_diff / 1024, 1)
+            entry["count_diff"] = statistic.count_diff
+        formatted.append(entry)
+    return formatted
+
+
+def statistics_arguments():
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in GROUP_BY:
+        abort(400, f"group_by must be one of {', '.join(GROUP_BY)}.")
+    limit = request.args.get("limit", "25")
+    if not limit.isdigit() or int(limit) < 1:
+        abort(400, "limit must be a positive integer.")
+    return group_by, int(limit)
+
+# ==============================================================================================================================================================
+#                                                                     Request Hooks
+# ==============================================================================================================================================================
+@app.after_request
+def sample_worker_memory(response):
+    record_memory_sample()
+    return response
+
+
+cache.subscribe(TRACEMALLOC_CHANNEL, apply_tracemalloc_state)
+# A worker started after tracing was switched on (ex. one recycled by the RSS ceiling) starts tracing straight away
+apply_tracemalloc_state()
+
+# ==============================================================================================================================================================
+#                                                                    Endpoint Routes
+# ==============================================================================================================================================================
+@app.get('/api/v1/diagnostics/memory')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_memory_report():
+    record_memory_sample(force=True)
+    return {"process": process_report(), "workers": worker_report()}
+
+# Body: {"enabled": true, "frames": 10}
+@app.post('/api/v1/diagnostics/tracemalloc')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def post_tracemalloc_state():
+    body = request.get_json(silent=True) or {}
+    frames = body.get("frames")
+    if not isinstance(body.get("enabled"), bool):
+        abort(400, "enabled must be true or false.")
+    if frames is not None and (not isinstance(frames, int) or frames < 1):
+        abort(400, "frames must be a positive integer.")
+    set_tracemalloc(body["enabled"], frames)
+    return process_report()["tracemalloc"]
+
+@app.get('/api/v1/diagnostics/snapshots')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_snapshot_list():
+    return list_snapshots()
+
+@app.post('/api/v1/diagnostics/snapshots')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def post_snapshot():
+    group_by, limit = statistics_arguments()
+    if not tracemalloc.is_tracing():
+        abort(400, "tracemalloc is not running. Start it with POST /api/v1/diagnostics/tracemalloc first.")
+    name, snapshot = take_snapshot()
+    return {"name": name, "pid": os.getpid(), "top": format_statistics(snapshot.statistics(group_by), limit)}, 201
+
+@app.get('/api/v1/diagnostics/snapshots/<name>')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_snapshot(name: str):
+    group_by, limit = statistics_arguments()
+    snapshot = load_snapshot(name)
+    if snapshot is None:
+        abort(404)
+    return {"name": name, "top": format_statistics(snapshot.statistics(group_by), limit)}
+
+# Growth from the older snapshot to the newer one. Both must come from the same worker for the diff to mean anything.
+@app.get('/api/v1/diagnostics/snapshots/<name>/diff/<other>')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_snapshot_diff(name: str, other: str):
+    group_by, limit = statistics_arguments()
+    older, newer = sorted([name, other])
+    older_match, newer_match = SNAPSHOT_NAME.match(older), SNAPSHOT_NAME.match(newer)
+    if not older_match or not newer_match:
+        abort(404)
+    if older_match.group(2) != newer_match.group(2):
+        abort(400, "Snapshots were taken by different workers and cannot be compared.")
+    older_snapshot, newer_snapshot = load_snapshot(older), load_snapshot(newer)
+    if older_snapshot is None or newer_snapshot is None:
+        abort(404)
+    return {"from": older, "to": newer, "top": format_statistics(newer_snapshot.compare_to(older_snapshot, group_by), limit)}
@@ -0,0 +1,58 @@
+from boilerplate.app import app
+import boilerplate.utils.cache as cache
+from flask import request
+from functools import wraps
+import hashlib
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Clients may keep the response but must revalidate it every time, which costs them a 304 while nothing has changed
+CACHE_CONTROL = "private, no-cache"
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# The tag covers the endpoint, its arguments and query string as well as the data version, so each URL gets its own tag.
+def make_etag(version):
+    identity = f"{request.endpoint}|{sorted(request.view_args.items())}|{request.query_string.decode('latin-1')}|{version}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+# Version function for data published on an invalidation channel (see utils/cache.py). Returns None, and so disables the ETag, when the cache
+# backend can't be read.
+def channel_version(*channels: str):
+    def version(*args, **kwargs):
+        generations = [cache.generation(channel) for channel in channels]
+        if any(generation < 0 for generation in generations):
+            return None
+        return ":".join(str(generation) for generation in generations)
+    return version
+
+# ==============================================================================================================================================================
+#                                                                      Decorators
+# ==============================================================================================================================================================
+# Answers If-None-Match with a 304 when the data behind an endpoint has not changed. version_function receives the view's arguments and must be
+# cheap: it runs before the view, so a matching request never reaches the view's query or serializer. Place it after the login and permission
+# decorators so a 304 is never given to a viewer who could not see the data.
+def etag(version_function):
+    def decorator(function):
+        view = app.ensure_sync(function)
+
+        @wraps(function)
+        def decorated_function(*args, **kwargs):
+            version = version_function(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+            tag = make_etag(version)
+            if request.if_none_match.contains_weak(tag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,32 @@
+from flask import request, flash, redirect, render_template, current_app
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Sent by submitFragmentForm in main.js
+FRAGMENT_HEADER = "X-Fragment"
+# Flash categories to Bootstrap alert classes, as base.html shows them
+ALERT_CLASSES = {"success": "success", "error": "danger", "message": "primary"}
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def wants_fragment():
+    return request.headers.get(FRAGMENT_HEADER) == "true"
+
+
+# Answers a form post. A plain form submission gets the usual flash and redirect (post/redirect/get) and the browser reloads the whole page. When
+# the page's script posted it, only what changed is sent back: the rendered fragments, each carrying the id of the element it replaces, the ids of
+# elements to remove and the alert to show. Clients that ask for HTML rather than JSON get the alert and fragments alone.
+#   render: Called only for fragment requests, so the redirect path never renders anything
+def respond(location: str, message: str = None, category: str = "success", render=None, removed: list = None, status: int = 200):
+    if not wants_fragment():
+        if message:
+            flash(message, category)
+        return redirect(location)
+
+    html = render() if render is not None else ""
+    alert = render_template("components/alert.html", message=message, alert_class=ALERT_CLASSES.get(category, "primary")) if message else ""
+    if request.accept_mimetypes.best_match(("text/html", "application/json")) == "application/json":
+        return {"html": html, "alert": alert, "removed": removed or [], "category": category}, status
+    return current_app.response_class(alert + html, status, mimetype="text/html")
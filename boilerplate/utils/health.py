@@ -0,0 +1,80 @@
+from boilerplate.app import app
+from boilerplate.db import db
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from sqlalchemy import text
+import json
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+LIVENESS_PATH = "/healthz"
+READINESS_PATH = "/readyz"
+PROBE_HEADERS = [("Cache-Control", "no-store")]
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# Database checks run on this thread so a hung connection can be timed out. While one check is stuck the next ones queue behind it and time out
+# too, which is the right answer: the worker is not ready.
+readiness_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readiness")
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def pool_status(engine):
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    return status
+
+
+def check_database():
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return pool_status(engine)
+
+
+def readiness():
+    try:
+        pool = readiness_executor.submit(check_database).result(timeout=config.HEALTH_READY_TIMEOUT)
+    except TimeoutError:
+        log.error(f"Readiness check timed out after {config.HEALTH_READY_TIMEOUT}s waiting for the database")
+        return 503, {"status": "unavailable", "database": "timeout"}
+    except Exception as error:
+        log.error(f"Readiness check failed: {error}")
+        return 503, {"status": "unavailable", "database": "error"}
+    return 200, {"status": "ready", "database": "ok", "pool": pool}
+
+# ==============================================================================================================================================================
+#                                                                      Middleware
+# ==============================================================================================================================================================
+# Answers the probe paths before Flask sees the request. Probes never reach routing, the before/after request hooks (session timeout, expired
+# account checks, cache polling), Flask-Login or the session interface, so they cannot set a cookie and a liveness probe costs microseconds.
+class HealthCheckMiddleware():
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO")
+        if path != LIVENESS_PATH and path != READINESS_PATH:
+            return self.wsgi_app(environ, start_response)
+        if environ.get("REQUEST_METHOD") not in ("GET", "HEAD"):
+            start_response("405 METHOD NOT ALLOWED", [("Allow", "GET, HEAD"), ("Content-Length", "0")])
+            return [b""]
+        if path == LIVENESS_PATH:
+            status, content_type, body = "200 OK", "text/plain", b"ok"
+        else:
+            code, report = readiness()
+            status = "200 OK" if code == 200 else "503 SERVICE UNAVAILABLE"
+            content_type, body = "application/json", json.dumps(report).encode("utf-8")
+        start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))] + PROBE_HEADERS)
+        return [b""] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+
+app.wsgi_app = HealthCheckMiddleware(app.wsgi_app)
@@ -0,0 +1,60 @@
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+import boilerplate.utils.cache as cache
+import boilerplate.utils.rate_limit as rate_limit
+import boilerplate.errors as errors
+from boilerplate.utils.scheduler import scheduled, every_tick
+import glob
+import time
+import os
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# Deletes files matching the patterns that haven't been modified in HOUSEKEEPING_MAX_AGE_DAYS and returns how many were deleted
+def remove_old_files(*patterns: str):
+    cutoff = time.time() - config.HOUSEKEEPING_MAX_AGE_DAYS * 24 * 60 * 60
+    removed = 0
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError as error:
+                log.warning(f"Housekeeping could not remove {path}: {error}")
+    return removed
+
+
+# Deletes the files that exist and returns how many were deleted
+def remove_files(paths: list):
+    removed = 0
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        except OSError as error:
+            log.warning(f"Housekeeping could not remove {path}: {error}")
+    return removed
+
+# ==============================================================================================================================================================
+#                                                                    Scheduled Jobs
+# ==============================================================================================================================================================
+# Clears out what the app leaves behind: expired cache entries (the SQLite cache only drops them when they're read again), refilled rate limit
+# buckets, old profiler captures and tracemalloc snapshots, and rotated logs left over from a larger LOGGING_MAX_LOGS.
+@scheduled("housekeeping", cron=config.HOUSEKEEPING_CRON)
+def housekeeping():
+    cache_entries = cache.purge_expired()
+    rate_limit.prune()
+    files = remove_old_files(os.path.join(config.PROFILER_FOLDER, "*.pstats"), os.path.join(config.PROFILER_FOLDER, "*.folded"),
+                             os.path.join(config.DIAGNOSTICS_FOLDER, "*.snapshot"))
+    stale_logs = [f"{config.LOGGING_FILE}.{number}" for number in range(config.LOGGING_MAX_LOGS + 1, config.LOGGING_MAX_LOGS + 100)]
+    logs = remove_files(stale_logs)
+    log.info(f"Housekeeping removed {cache_entries} expired cache entries, {files} old captures and {logs} stale logs")
+
+
+# Error log sampling windows are kept by each worker, so every worker writes its own summaries rather than waiting for its next error
+@every_tick
+def flush_error_samples():
+    errors.flush_error_samples(time.monotonic())
@@ -0,0 +1,95 @@
+import boilerplate.config as config
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+from datetime import date
+import dataclasses
+import decimal
+import uuid
+import json
+
+# orjson is optional. Without it the standard library encoder is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+BACKEND = "orjson" if orjson is not None and config.JSON_BACKEND in ("auto", "orjson") else "stdlib"
+# Datetimes and dataclasses are handed to default() so both encoders write them the same way: HTTP dates like Flask always has, and only the
+# fields a model declares.
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# Declared field names of each dataclass model, looked up once per class
+model_fields = {}
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def model_field_names(model_class):
+    names = model_fields.get(model_class)
+    if names is None:
+        names = model_fields[model_class] = tuple(field.name for field in dataclasses.fields(model_class))
+    return names
+
+
+# The declared fields of a dataclass model read straight off the instance. Unlike dataclasses.asdict() nothing is deep copied, nested values are
+# left to the encoder.
+def model_dict(instance):
+    return {name: getattr(instance, name) for name in model_field_names(type(instance))}
+
+
+def default(value):
+    if type(value) in model_fields:
+        return model_dict(value)
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return model_dict(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# ==============================================================================================================================================================
+#                                                                    JSON Provider
+# ==============================================================================================================================================================
+# Flask's default provider with cheaper model serialization and orjson when it is installed. Output matches the default provider apart from
+# non-ASCII characters, which are written as UTF-8 rather than escaped.
+class ModelJSONProvider(DefaultJSONProvider):
+    default = staticmethod(default)
+    ensure_ascii = False
+    backend = BACKEND
+
+    def encode(self, obj, indent: bool = False):
+        if self.backend == "orjson":
+            options = ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0) | (orjson.OPT_INDENT_2 if indent else 0)
+            try:
+                return orjson.dumps(obj, default=self.default, option=options)
+            except orjson.JSONEncodeError:
+                # ex. an integer wider than 64 bits. The standard library encodes it or raises the usual TypeError.
+                pass
+        layout = {"indent": 2} if indent else {"separators": (",", ":")}
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys, **layout).encode("utf-8")
+
+    def dumps(self, obj, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return self.encode(obj).decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.encode(obj, indent) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,121 @@
+from boilerplate.app import app
+from boilerplate.utils.urls import endpoint_access
+from boilerplate.utils.proxies import from_trusted_proxy
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from flask import request
+import threading
+import time
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Route priorities, declared with @priority. Routes without one are normal.
+PRIORITY_CRITICAL = "critical"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+# Set by NGINX to the time it accepted the request, as "t=<seconds since the epoch>" (see nginx/nginx.production.conf)
+REQUEST_START_HEADER = "X-Request-Start"
+# NGINX gives up on a request it hasn't had an answer to after proxy_read_timeout (60 seconds by default), so a longer delay is a bad clock
+# or a bad header rather than a queue
+MAX_PLAUSIBLE_DELAY = 60.0
+SHED_BODY = "The server is busy. Please try again shortly.\n"
+
+# ==============================================================================================================================================================
+#                                                                      Decorators
+# ==============================================================================================================================================================
+# Declares how a route is treated when its worker is overloaded. Critical routes (ex. login) are always admitted, normal routes are admitted
+# unless they have already waited longer than anyone would, and low priority routes (ex. bulk listings, diagnostics) are rejected first. Read
+# through the route manifest (see utils/urls.py).
+def priority(level: str):
+    def decorator(function):
+        function.priority = level
+        return function
+    return decorator
+
+# ==============================================================================================================================================================
+#                                                                    Queue Monitor
+# ==============================================================================================================================================================
+# CoDel's standing queue test applied to request queueing delay. A burst that drains quickly is fine, but once every request for a full interval
+# has waited longer than the target a queue has built up that the worker can't clear. The worker stays overloaded until a request gets through
+# under the target again.
+class QueueMonitor():
+    def __init__(self, target: float, interval: float):
+        self.target = target
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.above_target_until = 0.0
+        self.overloaded = False
+
+    def observe(self, delay: float, now: float):
+        with self.lock:
+            if delay < self.target:
+                if self.overloaded:
+                    log.info(f"Queueing delay back under {self.target * 1000:.0f} ms, no longer shedding load")
+                self.above_target_until = 0.0
+                self.overloaded = False
+            elif not self.above_target_until:
+                self.above_target_until = now + self.interval
+            elif now >= self.above_target_until and not self.overloaded:
+                log.warning(f"Queueing delay over {self.target * 1000:.0f} ms for {self.interval * 1000:.0f} ms, shedding low priority requests")
+                self.overloaded = True
+            return self.overloaded
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# One per worker process. Threads in the worker share it as they share the queue in front of them.
+monitor = QueueMonitor(config.LOAD_SHED_TARGET_MS / 1000, config.LOAD_SHED_INTERVAL_MS / 1000)
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# Seconds the request waited between NGINX accepting it and a worker thread picking it up. None without the header (ex. in development),
+# when it didn't come from a trusted proxy (see utils/proxies.py) or when the delay can't be real. A start slightly in the future is NGINX's
+# clock running ahead of ours and counts as no wait.
+def queueing_delay(now: float):
+    header = request.headers.get(REQUEST_START_HEADER)
+    if not header or not from_trusted_proxy():
+        return None
+    try:
+        started = float(header.removeprefix("t="))
+    except ValueError:
+        return None
+    delay = now - started
+    if not -MAX_PLAUSIBLE_DELAY <= delay <= MAX_PLAUSIBLE_DELAY:
+        return None
+    return max(0.0, delay)
+
+
+def endpoint_priority(endpoint: str):
+    access = endpoint_access.get(endpoint)
+    return access['priority'] if access is not None else PRIORITY_NORMAL
+
+
+def should_shed(level: str, delay: float, overloaded: bool):
+    if level == PRIORITY_CRITICAL:
+        return False
+    if level == PRIORITY_LOW and overloaded:
+        return True
+    return delay * 1000 >= config.LOAD_SHED_MAX_DELAY_MS
+
+
+def shed_response():
+    return app.response_class(SHED_BODY, 503, {"Retry-After": str(config.LOAD_SHED_RETRY_AFTER), "Cache-Control": "no-store"}, mimetype="text/plain")
+
+# ==============================================================================================================================================================
+#                                                                     Request Hooks
+# ==============================================================================================================================================================
+# Registered before the login hooks so a shed request never loads the user or touches the session
+@app.before_request
+def shed_load():
+    if not config.LOAD_SHED_ENABLED:
+        return
+    now = time.time()
+    delay = queueing_delay(now)
+    if delay is None:
+        return
+    overloaded = monitor.observe(delay, now)
+    if should_shed(endpoint_priority(request.endpoint), delay, overloaded):
+        return shed_response()
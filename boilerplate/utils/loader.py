@@ -0,0 +1,84 @@
+from boilerplate.app import app
+from boilerplate.db import db
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# ==============================================================================================================================================================
+#                                                                   Request Loaders
+# ==============================================================================================================================================================
+# Memoizes lookups by a unique non primary key column (ex. uuid or name) for the length of one request. SQLAlchemy's identity map only
+# short-circuits primary key lookups, so without this every get_*_by_uuid call is a query even when the row was loaded a moment earlier.
+# load_many() fetches every key it has not seen yet in a single IN query. Misses are remembered too, so each key costs at most one query per request.
+# Outside a request (CLI commands, seeding) every call goes straight to the database.
+class Loader():
+    def __init__(self, name: str, model, column: str, normalize=None):
+        self.name = name
+        self.model = model
+        self.column = column
+        self.normalize = normalize or (lambda key: key)
+
+    def _cache(self):
+        if not has_request_context():
+            return None
+        if "loaders" not in g:
+            g.loaders = {}
+        return g.loaders.setdefault(self.name, {})
+
+    def fetch(self, keys: list):
+        column = getattr(self.model, self.column)
+        query = db.session.query(self.model)
+        rows = query.filter(column == keys[0]).all() if len(keys) == 1 else query.filter(column.in_(keys)).all()
+        return {getattr(row, self.column): row for row in rows}
+
+    def load_many(self, keys):
+        keys = list(dict.fromkeys(self.normalize(key) for key in keys))
+        cache = self._cache()
+        if cache is None:
+            return self.fetch(keys) if keys else {}
+        missing = [key for key in keys if key not in cache]
+        if missing:
+            found = self.fetch(missing)
+            for key in missing:
+                cache[key] = found.get(key)
+        return {key: cache[key] for key in keys if cache[key] is not None}
+
+    def load(self, key):
+        key = self.normalize(key)
+        return self.load_many([key]).get(key)
+
+    # Records rows that were loaded some other way (ex. Role.query.all()) so later lookups for them are free.
+    def prime(self, rows):
+        cache = self._cache()
+        if cache is None:
+            return
+        for row in rows:
+            cache[getattr(row, self.column)] = row
+
+
+def clear_loaders():
+    if has_request_context():
+        g.pop("loaders", None)
+
+# ==============================================================================================================================================================
+#                                                                     Invalidation
+# ==============================================================================================================================================================
+# Anything written or rolled back may have created, renamed or deleted a row a loader remembers, so every loader starts over. Loaded objects that
+# were only modified stay correct without this as they are the same instances the session holds.
+@event.listens_for(Session, "after_flush")
+def _clear_loaders_after_flush(session, flush_context):
+    clear_loaders()
+
+@event.listens_for(Session, "after_rollback")
+def _clear_loaders_after_rollback(session):
+    clear_loaders()
+
+# Bulk inserts, updates and deletes (ex. insert_if_not_exists in db.py) are executed without a flush
+@event.listens_for(Session, "do_orm_execute")
+def _clear_loaders_before_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        clear_loaders()
+
+@app.teardown_request
+def _clear_loaders_after_request(exception=None):
+    clear_loaders()
@@ -8,9 +8,6 @@ import sys
 #                                                                      Configuration
 # ==============================================================================================================================================================
 
-# Create the logging handler from values in config
-log_handler = RotatingFileHandler(config.LOGGING_FILE, maxBytes=1000*config.LOGGING_MAX_SIZE_KB, backupCount=config.LOGGING_MAX_LOGS)
-
 # Set the logging level for the log
 log_level = logging.WARNING
 if config.DEBUG_MODE or config.LOGGING_LEVEL == "DEBUG":
@@ -21,18 +18,29 @@ elif config.LOGGING_LEVEL == "ERROR":
     log_level = logging.ERROR
 elif config.LOGGING_LEVEL == "CRITICAL":
     log_level = logging.CRITICAL
-log_handler.setLevel(log_level)
 
-# Create the logging format and initialize the handler
-pid = os.getpid()
-formatter = logging.Formatter(f'%(asctime)s - PID:{pid} - %(levelname)s - %(message)s')
-log_handler.setFormatter(formatter)
 logger = logging.getLogger('main_logger')
 logger.setLevel(log_level)
-logger.addHandler(log_handler)
-
-# Log workers as they boot.
-logger.info(f'Booting Worker')
+log_handler = None
+pid = None
+
+# Creates the logging handler from values in config. Called again in each gunicorn worker after a preloaded fork so every worker logs its own PID
+# and owns its own file handle rather than sharing the one opened by the master.
+def configure_handler():
+    global log_handler, pid
+    if log_handler is not None:
+        logger.removeHandler(log_handler)
+        log_handler.close()
+    pid = os.getpid()
+    log_handler = RotatingFileHandler(config.LOGGING_FILE, maxBytes=1000*config.LOGGING_MAX_SIZE_KB, backupCount=config.LOGGING_MAX_LOGS)
+    log_handler.setLevel(log_level)
+    log_handler.setFormatter(logging.Formatter(f'%(asctime)s - PID:{pid} - %(levelname)s - %(message)s'))
+    logger.addHandler(log_handler)
+
+    # Log workers as they boot.
+    logger.info(f'Booting Worker')
+
+configure_handler()
 
 # ==============================================================================================================================================================
 #                                                                       Functions
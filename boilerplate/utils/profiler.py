@@ -0,0 +1,268 @@
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+import boilerplate.utils.cache as cache
+from boilerplate.modules.role.role_decorators import require_system_role
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
+from flask import g, request, abort, send_from_directory
+from flask_login import login_required
+from collections import Counter
+import threading
+import secrets
+import cProfile
+import time
+import sys
+import os
+import re
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+ARMS_KEY = "profiler:arms"
+ARMS_CHANNEL = "profiler"
+PROFILE_KINDS = {"cprofile": "pstats", "sample": "folded"}
+# <timestamp>-<pid>-<duration>ms-<endpoint>.<pstats|folded>
+PROFILE_NAME = re.compile(r"^(\d{8}-\d{6}-\d{3})-(\d+)-(\d+)ms-([\w.]+)\.(pstats|folded)$")
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# This worker's copy of the armed endpoints, keyed by endpoint name. Kept in sync with the shared cache through the invalidation bus so every worker
+# sees an arm no matter which one received it. While it is empty unprofiled requests only pay for one dictionary truth test.
+arms = {}
+
+# ==============================================================================================================================================================
+#                                                                    Stack Sampler
+# ==============================================================================================================================================================
+# Low overhead statistical profiler. A background thread grabs the profiled thread's stack every PROFILER_SAMPLE_INTERVAL_MS and counts identical
+# stacks, which gives the collapsed stack format flame graph tools read ("outer;inner;leaf count" per line).
+class StackSampler():
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def load_arms(channel: str = None):
+    global arms
+    arms = cache.get(ARMS_KEY, {}) or {}
+    return arms
+
+
+def save_arms(new_arms: dict):
+    cache.set(ARMS_KEY, new_arms, ttl=max([arm["expires"] - time.time() for arm in new_arms.values()], default=1))
+    cache.publish(ARMS_CHANNEL)
+    load_arms()
+
+
+# Profiles the next `requests` requests to an endpoint, or with header=True every request that carries PROFILER_HEADER set to the returned token.
+def arm(endpoint: str, requests: int = 1, header: bool = False, kind: str = "cprofile", ttl: int = None):
+    new_arm = {
+        "id": secrets.token_hex(8),
+        "endpoint": endpoint,
+        "mode": "header" if header else "count",
+        "requests": requests,
+        "kind": kind,
+        "token": secrets.token_urlsafe(16) if header else None,
+        "expires": time.time() + (ttl or config.PROFILER_ARM_TTL),
+    }
+    new_arms = {name: existing for name, existing in load_arms().items() if existing["expires"] > time.time()}
+    new_arms[endpoint] = new_arm
+    save_arms(new_arms)
+    log.info(f"Profiler armed for {endpoint} ({new_arm['mode']}, {new_arm['kind']})")
+    return new_arm
+
+
+def disarm(endpoint: str):
+    current = load_arms()
+    if endpoint not in current:
+        return False
+    save_arms({name: existing for name, existing in current.items() if name != endpoint})
+    return True
+
+
+# Decides whether this request should be profiled. Count arms are shared between workers with a cache counter so exactly N requests are taken.
+def claim(endpoint_arm: dict):
+    if endpoint_arm["expires"] <= time.time():
+        return False
+    if endpoint_arm["mode"] == "header":
+        token = request.headers.get(config.PROFILER_HEADER)
+        return token is not None and secrets.compare_digest(token, endpoint_arm["token"])
+    taken = cache.incr(f"profiler:taken:{endpoint_arm['id']}")
+    if taken is None or taken > endpoint_arm["requests"]:
+        return False
+    if taken == endpoint_arm["requests"]:
+        disarm(endpoint_arm["endpoint"])
+    return True
+
+
+def list_profiles():
+    profiles = []
+    try:
+        names = sorted(os.listdir(config.PROFILER_FOLDER), reverse=True)
+    except OSError:
+        return profiles
+    for name in names:
+        match = PROFILE_NAME.match(name)
+        if not match:
+            continue
+        try:
+            size = os.path.getsize(os.path.join(config.PROFILER_FOLDER, name))
+        except OSError:
+            continue
+        created, pid, duration, endpoint, extension = match.groups()
+        profiles.append({
+            "name": name,
+            "created": created,
+            "pid": int(pid),
+            "duration_ms": int(duration),
+            "endpoint": endpoint,
+            "kind": "cprofile" if extension == "pstats" else "sample",
+            "size": size,
+        })
+    return profiles
+
+
+# Writes a profile and drops the oldest ones so the folder never holds more than PROFILER_MAX_PROFILES.
+def store_profile(endpoint: str, kind: str, duration_ms: int, write):
+    os.makedirs(config.PROFILER_FOLDER, exist_ok=True)
+    now = time.time()
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+    name = f"{timestamp}-{os.getpid()}-{duration_ms}ms-{endpoint}.{PROFILE_KINDS[kind]}"
+    write(os.path.join(config.PROFILER_FOLDER, name))
+    for stale in list_profiles()[config.PROFILER_MAX_PROFILES:]:
+        try:
+            os.remove(os.path.join(config.PROFILER_FOLDER, stale["name"]))
+        except FileNotFoundError:
+            pass
+    return name
+
+# ==============================================================================================================================================================
+#                                                                     Request Hooks
+# ==============================================================================================================================================================
+@app.before_request
+def start_profiling():
+    if not arms:
+        return
+    endpoint_arm = arms.get(request.endpoint)
+    if endpoint_arm is None or not claim(endpoint_arm):
+        return
+    if endpoint_arm["kind"] == "sample":
+        profiler = StackSampler(threading.get_ident(), config.PROFILER_SAMPLE_INTERVAL_MS / 1000)
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as error:
+            # Only one cProfile may run per interpreter on newer Pythons. Another thread is already being profiled, so skip this one.
+            log.warning(f"Could not profile {request.endpoint}: {error}")
+            return
+    g.profile = (profiler, endpoint_arm["kind"], request.endpoint, time.perf_counter())
+
+
+@app.teardown_request
+def stop_profiling(exception=None):
+    if "profile" not in g:
+        return
+    profiler, kind, endpoint, started = g.pop("profile")
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    if kind == "sample":
+        profiler.stop()
+        def write(path):
+            with open(path, "w") as profile_file:
+                profile_file.write(profiler.collapsed())
+    else:
+        profiler.disable()
+        write = profiler.dump_stats
+    try:
+        name = store_profile(endpoint, kind, duration_ms, write)
+        log.info(f"Profiled {endpoint} in {duration_ms}ms to {name}")
+    except OSError as error:
+        log.error(f"Could not store the profile for {endpoint}: {error}")
+
+
+cache.subscribe(ARMS_CHANNEL, load_arms)
+load_arms()
+
+# ==============================================================================================================================================================
+#                                                                    Endpoint Routes
+# ==============================================================================================================================================================
+@app.get('/api/v1/profiles')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_profile_list():
+    return list_profiles()
+
+@app.get('/api/v1/profiles/<name>')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def download_profile(name: str):
+    if not PROFILE_NAME.match(name):
+        abort(404)
+    return send_from_directory(os.path.abspath(config.PROFILER_FOLDER), name, as_attachment=True)
+
+@app.get('/api/v1/profiles/arms')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_profile_arms():
+    return [endpoint_arm for endpoint_arm in load_arms().values() if endpoint_arm["expires"] > time.time()]
+
+# Body: {"endpoint": "get_roles_list", "requests": 5, "header": false, "kind": "cprofile" | "sample", "ttl": 3600}
+@app.post('/api/v1/profiles/arms')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def post_profile_arm():
+    body = request.get_json(silent=True) or {}
+    endpoint = body.get("endpoint")
+    kind = body.get("kind", "cprofile")
+    requests = body.get("requests", 1)
+    ttl = body.get("ttl")
+    if endpoint not in app.view_functions or endpoint == "static":
+        abort(400, "Unknown endpoint.")
+    if kind not in PROFILE_KINDS:
+        abort(400, f"Kind must be one of {', '.join(PROFILE_KINDS)}.")
+    if not isinstance(requests, int) or requests < 1:
+        abort(400, "Requests must be a positive integer.")
+    if ttl is not None and (not isinstance(ttl, int) or ttl < 1):
+        abort(400, "TTL must be a positive number of seconds.")
+    return arm(endpoint, requests=requests, header=bool(body.get("header")), kind=kind, ttl=ttl), 201
+
+# The argument is not called "endpoint" as url_for() reserves that name
+@app.delete('/api/v1/profiles/arms/<endpoint_name>')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def delete_profile_arm(endpoint_name: str):
+    if not disarm(endpoint_name):
+        abort(404)
+    return {"endpoint": endpoint_name, "disarmed": True}
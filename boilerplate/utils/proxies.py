@@ -0,0 +1,70 @@
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from flask import request
+import ipaddress
+import threading
+import socket
+import time
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Host names in TRUSTED_PROXIES (ex. "nginx" on the docker network) are looked up again this often, as a restarted container may get a new address
+RESOLVE_SECONDS = 60
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# (TRUSTED_PROXIES as last read, networks it names, time it was read)
+trusted = ("", [], 0.0)
+trusted_lock = threading.Lock()
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def parse_proxies(proxies: str):
+    networks = []
+    for entry in proxies.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+            continue
+        except ValueError:
+            pass
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(entry, None)}
+        except OSError:
+            log.warning(f'The trusted proxy "{entry}" could not be resolved. Headers it sets are ignored until it can be.')
+            continue
+        networks.extend(ipaddress.ip_network(address) for address in addresses)
+    return networks
+
+
+def trusted_networks():
+    global trusted
+    proxies, networks, read_at = trusted
+    now = time.monotonic()
+    if proxies != config.TRUSTED_PROXIES or now - read_at >= RESOLVE_SECONDS:
+        with trusted_lock:
+            proxies, networks, read_at = trusted
+            if proxies != config.TRUSTED_PROXIES or now - read_at >= RESOLVE_SECONDS:
+                networks = parse_proxies(config.TRUSTED_PROXIES)
+                trusted = (config.TRUSTED_PROXIES, networks, now)
+    return networks
+
+
+# Whether the request came straight from a proxy allowed to set headers about the client (ex. X-Real-IP). Anyone who can reach gunicorn
+# directly can send those headers too, so they only count from these addresses. A unix socket has no peer address and only NGINX can reach it.
+def from_trusted_proxy():
+    peer = request.remote_addr
+    if not peer:
+        return True
+    try:
+        address = ipaddress.ip_address(peer)
+    except ValueError:
+        return False
+    if getattr(address, "ipv4_mapped", None):
+        address = address.ipv4_mapped
+    return any(address in network for network in trusted_networks())
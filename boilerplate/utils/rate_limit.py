@@ -0,0 +1,232 @@
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from boilerplate.utils.proxies import from_trusted_proxy
+from flask import request, current_app
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from functools import wraps
+import threading
+import hashlib
+import sqlite3
+import math
+import time
+import re
+import os
+
+# ==============================================================================================================================================================
+#                                                                      Exceptions
+# ==============================================================================================================================================================
+class InvalidRateLimitError(Exception):
+    def __init__(self, limit, *args):
+        super().__init__(args)
+        self.limit = limit
+
+    def __str__(self):
+        return f'The rate limit "{self.limit}" is not valid. Please write limits as "<requests>/<period>" (ex. "5/minute" or "20/15minutes").'
+
+class UnknownRateLimitBackendError(Exception):
+    def __init__(self, name, *args):
+        super().__init__(args)
+        self.name = name
+
+    def __str__(self):
+        return f'The rate limit backend "{self.name}" is not a known backend. Please set RATE_LIMIT_BACKEND to "memory" or "sqlite".'
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+LIMIT_FORMAT = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# ==============================================================================================================================================================
+#                                                                  Rate Limit Stores
+# ==============================================================================================================================================================
+# Every limit is a token bucket kept as a single number per key with the generic cell rate algorithm (GCRA). The key's "theoretical arrival time"
+# moves forward by period / requests for each request admitted, and a request is turned away while that would put it more than a whole period
+# ahead of now. That allows bursts of up to the limit and refills steadily, and a single compare and set updates it. acquire() returns 0 when the
+# request is admitted, otherwise the seconds until it would be.
+
+# In process store. Each gunicorn worker keeps its own buckets, so the limits are effectively multiplied by the number of workers.
+class MemoryRateLimitStore():
+    def __init__(self):
+        self.arrivals = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key: str, now: float, emission: float, period: float):
+        with self.lock:
+            arrival = max(self.arrivals.get(key, 0.0), now) + emission
+            if arrival - now > period:
+                return arrival - period - now
+            self.arrivals[key] = arrival
+            return 0.0
+
+    def prune(self, now: float):
+        with self.lock:
+            for key in [key for key, arrival in self.arrivals.items() if arrival < now]:
+                del self.arrivals[key]
+
+    def clear(self):
+        with self.lock:
+            self.arrivals.clear()
+
+
+# SQLite file store shared by every worker on the host, the same way as the SQLite cache backend. Each acquire is one atomic UPSERT.
+class SQLiteRateLimitStore():
+    def __init__(self, path: str = config.RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute("CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, arrival REAL NOT NULL)")
+
+    # Connections are kept per thread and per process. A connection inherited through a fork must never be reused by the child.
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def acquire(self, key: str, now: float, emission: float, period: float):
+        connection = self._connection()
+        values = {"key": key, "now": now, "emission": emission, "period": period}
+        admitted = connection.execute("INSERT INTO rate_limit (key, arrival) VALUES (:key, :now + :emission) ON CONFLICT(key) DO UPDATE "
+                                      "SET arrival = max(arrival, :now) + :emission WHERE max(arrival, :now) + :emission - :now <= :period "
+                                      "RETURNING arrival", values).fetchone()
+        if admitted is not None:
+            return 0.0
+        row = connection.execute("SELECT arrival FROM rate_limit WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] + emission - period - now) if row else 0.0
+
+    # A bucket whose arrival time has passed is full again, which is the same as having no row
+    def prune(self, now: float):
+        self._connection().execute("DELETE FROM rate_limit WHERE arrival < ?", (now,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM rate_limit")
+
+
+def create_store(name: str = None):
+    name = name or config.RATE_LIMIT_BACKEND
+    if name == "memory":
+        return MemoryRateLimitStore()
+    if name == "sqlite":
+        return SQLiteRateLimitStore()
+    raise UnknownRateLimitBackendError(name)
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+store = create_store()
+# Stale buckets are deleted every PRUNE_EVERY acquires in each worker
+PRUNE_EVERY = 1000
+acquires = 0
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+# "5/minute" or "20/15minutes" as (requests, period in seconds). An empty limit or 0 requests means no limit.
+def parse_limit(limit: str):
+    if not limit or not limit.strip() or limit.strip() == "0":
+        return None
+    match = LIMIT_FORMAT.match(limit)
+    if match is None:
+        raise InvalidRateLimitError(limit)
+    requests, multiplier, unit = match.groups()
+    if int(requests) == 0:
+        return None
+    return int(requests), int(multiplier or 1) * PERIODS[unit]
+
+
+# Behind NGINX the socket peer is NGINX itself, so the client address comes from the header it sets (see nginx/nginx.production.conf). From
+# anyone else the header could say anything, so their own address is used.
+def client_ip():
+    if config.RATE_LIMIT_CLIENT_IP_HEADER and from_trusted_proxy():
+        forwarded = request.headers.get(config.RATE_LIMIT_CLIENT_IP_HEADER)
+        if forwarded:
+            return forwarded.strip()
+    return request.remote_addr or "unknown"
+
+
+# The account a logged out request acts on (ex. the email a login is attempted for). Lower cased so "Admin@" and "admin@" share a bucket.
+def form_account():
+    email = request.form.get("email")
+    return email.strip().lower() if email else None
+
+
+# The logged in user, or the client address for anyone else
+def current_account():
+    user_id = current_user.get_id()
+    return str(user_id) if user_id is not None else client_ip()
+
+
+# What each limit can be keyed by. A key function returning None skips the limit for that request.
+KEY_FUNCTIONS = {
+    "ip": client_ip,
+    "account": form_account,
+    "user": current_account,
+    "route": lambda: "",
+}
+
+
+# Returns the seconds until the request would be admitted, or 0. A broken store never locks anyone out: failures are logged and the request admitted.
+def hit(name: str, value: str, requests: int, period: float):
+    global acquires
+    # Hashed so an attacker sending huge form values can't grow the keys
+    key = f"{name}:{hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()}"
+    now = time.time()
+    try:
+        wait = store.acquire(key, now, period / requests, period)
+        acquires += 1
+        if acquires % PRUNE_EVERY == 0:
+            store.prune(now)
+        return wait
+    except (sqlite3.Error, OSError) as error:
+        log.warning(f"Rate limit check failed for {name}: {error}")
+        return 0.0
+
+
+# Deletes buckets that have refilled (see housekeeping.py). Each worker also prunes every PRUNE_EVERY requests.
+def prune():
+    try:
+        store.prune(time.time())
+    except (sqlite3.Error, OSError) as error:
+        log.warning(f"Rate limit prune failed: {error}")
+
+
+def clear():
+    try:
+        store.clear()
+    except (sqlite3.Error, OSError) as error:
+        log.warning(f"Rate limit clear failed: {error}")
+
+# ==============================================================================================================================================================
+#                                                                      Decorators
+# ==============================================================================================================================================================
+# Limits a route to a number of requests per period for each IP, account (the "email" form field), logged in user or for the route as a whole.
+# Limits come from config.py (ex. @rate_limit(config.RATE_LIMIT_LOGIN_IP, by="ip")) and are checked before the view runs, so a throttled login
+# never reaches bcrypt. Stacked limits are checked outermost first and each one counts the request. Throttled requests get a 429 with Retry-After.
+def rate_limit(limit: str, by: str = "ip"):
+    parsed = parse_limit(limit)
+    key_function = KEY_FUNCTIONS[by]
+
+    def decorator(function):
+        if parsed is None:
+            return function
+        requests, period = parsed
+
+        @wraps(function)
+        def decorated_function(*args, **kwargs):
+            if config.RATE_LIMIT_ENABLED:
+                value = key_function()
+                if value is not None:
+                    wait = hit(f"{request.endpoint}:{by}", value, requests, period)
+                    if wait > 0:
+                        raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+            return current_app.ensure_sync(function)(*args, **kwargs)
+        # Read by the route manifest (see utils/urls.py)
+        decorated_function.rate_limits = (*getattr(function, "rate_limits", ()), f"{requests}/{period}s per {by}")
+        return decorated_function
+    return decorator
@@ -0,0 +1,335 @@
+from boilerplate.app import app
+from boilerplate.db import db
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from boilerplate.modules.role.role_decorators import require_system_role
+from boilerplate.utils.load_shedding import priority, PRIORITY_LOW
+from flask_login import login_required
+from sqlalchemy import update, or_
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+import threading
+import traceback
+import socket
+import click
+import time
+import os
+
+# ==============================================================================================================================================================
+#                                                                      Exceptions
+# ==============================================================================================================================================================
+class DuplicateJobError(Exception):
+    def __init__(self, name, *args):
+        super().__init__(args)
+        self.name = name
+
+    def __str__(self):
+        return f'The scheduled job "{self.name}" is a duplicate of an already registered job.'
+
+class InvalidScheduleError(Exception):
+    def __init__(self, schedule, *args):
+        super().__init__(args)
+        self.schedule = schedule
+
+    def __str__(self):
+        return f'The schedule "{self.schedule}" is not valid. Please give a job either a positive interval in seconds or a five field cron expression.'
+
+# ==============================================================================================================================================================
+#                                                                   Scheduler Models
+# ==============================================================================================================================================================
+# The single row every worker competes for. Whoever holds an unexpired lease is the leader and the only worker that runs jobs.
+class SchedulerLease(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(255), nullable=False)
+    expires = db.Column(db.Float, nullable=False)
+
+
+# When each job runs next and how its last run went. Kept in the database so a new leader carries on the same schedule.
+@dataclass
+class ScheduledJob(db.Model):
+    name: str
+    schedule: str
+    next_run: float
+    runs: int
+    failures: int
+    last_started: float
+    last_duration_ms: int
+    last_error: str
+
+    name = db.Column(db.String(100), primary_key=True)
+    schedule = db.Column(db.String(100), nullable=False)
+    next_run = db.Column(db.Float, nullable=False)
+    runs = db.Column(db.Integer, default=0, nullable=False)
+    failures = db.Column(db.Integer, default=0, nullable=False)
+    last_started = db.Column(db.Float, nullable=True)
+    last_duration_ms = db.Column(db.Integer, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+# ==============================================================================================================================================================
+#                                                                      Schedules
+# ==============================================================================================================================================================
+class IntervalSchedule():
+    def __init__(self, seconds: float):
+        if not seconds or seconds <= 0:
+            raise InvalidScheduleError(seconds)
+        self.seconds = seconds
+
+    # A newly registered job runs on the leader's next tick
+    def first_run(self, now: float):
+        return now
+
+    def next_run(self, now: float):
+        return now + self.seconds
+
+    def __str__(self):
+        return f"every {self.seconds:g}s"
+
+
+# Five field cron expressions (minute hour day month weekday) in the server's time zone. Fields take *, numbers, ranges, lists and steps
+# (ex. "*/15 2-4 * * 1,3"). Sunday is 0 or 7 and, as in cron, a job restricted by both day and weekday runs when either matches.
+class CronSchedule():
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise InvalidScheduleError(expression)
+        self.expression = expression
+        try:
+            self.minutes, self.hours, self.days, self.months, weekdays = [self.parse(part, *limits) for part, limits in zip(parts, self.FIELDS)]
+        except ValueError:
+            raise InvalidScheduleError(expression)
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def parse(field: str, low: int, high: int):
+        values = set()
+        for item in field.split(","):
+            spread, _, step = item.partition("/")
+            if spread == "*":
+                start, end = low, high
+            elif "-" in spread:
+                start, end = (int(value) for value in spread.split("-", 1))
+            else:
+                start = end = int(spread)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(field)
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def day_matches(self, moment: datetime):
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first_run(self, now: float):
+        return self.next_run(now)
+
+    # Steps forward a month, day, hour or minute at a time, skipping straight past whatever doesn't match
+    def next_run(self, now: float):
+        moment = datetime.fromtimestamp(now).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise InvalidScheduleError(self.expression)
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+LEADER_LEASE = "leader"
+jobs = {}
+# Run by every worker on each tick whether or not it leads, for state each worker keeps for itself. See every_tick.
+worker_tasks = []
+# Identifies this worker in the lease table. Recomputed after a fork (see start).
+worker_id = f"{socket.gethostname()}:{os.getpid()}"
+scheduler_thread = None
+stop_event = threading.Event()
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+def register_job(name: str, function, every: float = None, cron: str = None):
+    if name in jobs:
+        raise DuplicateJobError(name)
+    if (every is None) == (cron is None):
+        raise InvalidScheduleError(f"every={every}, cron={cron}")
+    jobs[name] = {'name': name, 'function': function, 'schedule': CronSchedule(cron) if cron else IntervalSchedule(every)}
+
+
+# Registers the decorated function as a job. Give it either an interval in seconds or a cron expression:
+#   @scheduled("clear_expired_reset_codes", every=900)
+#   @scheduled("housekeeping", cron="0 * * * *")
+def scheduled(name: str = None, every: float = None, cron: str = None):
+    def decorator(function):
+        register_job(name or function.__name__, function, every=every, cron=cron)
+        return function
+    return decorator
+
+
+# Registers the decorated function to run in every worker on each scheduler tick, ex. flushing what a worker has buffered in memory that the leader
+# can't see. Keep them quick, as they hold up the worker's tick.
+def every_tick(function):
+    worker_tasks.append(function)
+    return function
+
+
+def run_worker_tasks():
+    for task in worker_tasks:
+        try:
+            task()
+        except Exception:
+            log.error(f"Scheduler task {task.__name__} failed", traceback=traceback.format_exc())
+
+
+# Takes or renews the leader lease. The lease is held for SCHEDULER_LEASE_SECONDS, so if the leader dies another worker takes over once it runs out.
+def claim_leadership(now: float):
+    expires = now + config.SCHEDULER_LEASE_SECONDS
+    renewed = db.session.execute(update(SchedulerLease)
+                                 .where(SchedulerLease.name == LEADER_LEASE, or_(SchedulerLease.holder == worker_id, SchedulerLease.expires < now))
+                                 .values(holder=worker_id, expires=expires))
+    if renewed.rowcount == 0 and db.session.get(SchedulerLease, LEADER_LEASE) is None:
+        db.session.add(SchedulerLease(name=LEADER_LEASE, holder=worker_id, expires=expires))
+        try:
+            db.session.commit()
+            return True
+        except SQLAlchemyError:
+            # Another worker created the lease first
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return renewed.rowcount == 1
+
+
+def release_leadership():
+    db.session.execute(update(SchedulerLease).where(SchedulerLease.name == LEADER_LEASE, SchedulerLease.holder == worker_id).values(expires=0))
+    db.session.commit()
+
+
+# Moves a due job's next run forward and reports whether this worker won it. Even if two workers briefly both think they lead, only one moves it.
+def claim_run(job: dict, now: float):
+    record = db.session.get(ScheduledJob, job['name'])
+    if record is None:
+        record = ScheduledJob(name=job['name'], schedule=str(job['schedule']), next_run=job['schedule'].first_run(now), runs=0, failures=0)
+        db.session.add(record)
+        try:
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            return False
+    if record.next_run > now:
+        return False
+    claimed = db.session.execute(update(ScheduledJob)
+                                 .where(ScheduledJob.name == job['name'], ScheduledJob.next_run == record.next_run)
+                                 .values(next_run=job['schedule'].next_run(now), schedule=str(job['schedule']), last_started=now))
+    db.session.commit()
+    return claimed.rowcount == 1
+
+
+def run_job(job: dict):
+    started = time.perf_counter()
+    error = None
+    try:
+        job['function']()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+    duration_ms = int((time.perf_counter() - started) * 1000)
+
+    values = {'runs': ScheduledJob.runs + 1, 'last_duration_ms': duration_ms, 'last_error': error}
+    if error:
+        values['failures'] = ScheduledJob.failures + 1
+        log.error(f"Scheduled job {job['name']} failed after {duration_ms} ms", traceback=error)
+    else:
+        log.info(f"Scheduled job {job['name']} finished in {duration_ms} ms")
+    db.session.execute(update(ScheduledJob).where(ScheduledJob.name == job['name']).values(**values))
+    db.session.commit()
+
+
+# One pass of the scheduler: the leader runs every job that is due. A failing job or an unreachable database never stops the scheduler.
+def tick(now: float = None):
+    now = time.time() if now is None else now
+    with app.app_context():
+        try:
+            if not claim_leadership(now):
+                return False
+            for job in list(jobs.values()):
+                if claim_run(job, now):
+                    run_job(job)
+            return True
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            log.warning(f"Scheduler tick failed: {error}")
+            return False
+
+
+def run_scheduler():
+    while not stop_event.wait(config.SCHEDULER_TICK_SECONDS):
+        run_worker_tasks()
+        tick()
+
+
+# Whether this process is serving the app. Flask CLI commands other than "flask run" (ex. build-assets in entrypoint.sh) only load it, so they don't
+# start a scheduler thread and compete for the leader lease.
+def serving():
+    if os.environ.get("FLASK_RUN_FROM_CLI") != "true":
+        return True
+    context = click.get_current_context(silent=True)
+    return context is not None and context.info_name == "run"
+
+
+# Starts this process's scheduler thread. Threads don't survive a fork, so gunicorn calls this again in each worker (see post_fork in gunicorn.conf.py).
+def start():
+    global scheduler_thread, worker_id
+    if not config.SCHEDULER_ENABLED or (scheduler_thread is not None and scheduler_thread.is_alive()):
+        return
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event.clear()
+    scheduler_thread = threading.Thread(target=run_scheduler, name="scheduler", daemon=True)
+    scheduler_thread.start()
+
+
+# Stops the thread and hands the lease on straight away instead of making the other workers wait for it to expire
+def stop():
+    global scheduler_thread
+    if scheduler_thread is None:
+        return
+    stop_event.set()
+    scheduler_thread.join(timeout=config.SCHEDULER_TICK_SECONDS)
+    scheduler_thread = None
+    with app.app_context():
+        try:
+            release_leadership()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            log.warning(f"Could not release the scheduler lease: {error}")
+
+# ==============================================================================================================================================================
+#                                                                    Endpoint Routes
+# ==============================================================================================================================================================
+@app.get('/api/v1/scheduler/jobs')
+@login_required
+@require_system_role
+@priority(PRIORITY_LOW)
+def get_scheduled_jobs():
+    lease = db.session.get(SchedulerLease, LEADER_LEASE)
+    leader = lease.holder if lease is not None and lease.expires > time.time() else None
+    return {"leader": leader, "jobs": ScheduledJob.query.order_by(ScheduledJob.name).all()}
@@ -0,0 +1,111 @@
+import boilerplate.utils.lumberjack as log
+from boilerplate.db import db
+from sqlalchemy import Column, event, select, table, column, literal_column, func, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import visitors
+import re
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# Queries are split into words. Each is matched as a prefix, so results follow along as someone types.
+TERM = re.compile(r"\w+")
+MAX_TERMS = 8
+
+# ==============================================================================================================================================================
+#                                                                     Search Indexes
+# ==============================================================================================================================================================
+# A SQLite FTS5 table shadowing some columns of a model. columns maps each indexed column to the SQL expression it is filled from, so a value can be
+# trimmed before it is indexed (ex. an email without its domain). Triggers on the model's table keep the index in step with every insert, update
+# and delete, including bulk updates and writes from other processes that ORM events would never see. The index is created along with the table,
+# or by ensure() for a database that already has the table.
+#
+# search() ranks matches with bm25, weighting each column by weights. Filters are applied alongside the match, before ranking and paging, so
+# rows they exclude never take the place of ones they keep. On any other database it falls back to case insensitive prefix matches on the
+# model's columns of the same names.
+class SearchIndex():
+    def __init__(self, name: str, model, columns: dict, weights: tuple = None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.weights = weights or (1,) * len(columns)
+        self.key = model.__mapper__.primary_key[0]
+        # Cleared if this SQLite was built without FTS5
+        self.available = True
+        event.listen(model.__table__, "after_create", lambda target, connection, **kwargs: self.create(connection))
+        event.listen(model.__table__, "before_drop", lambda target, connection, **kwargs: self.drop(connection))
+
+    # The model's rows as the index stores them, rowid first
+    def rows(self, connection, where=None):
+        statement = select(self.key, *self.columns.values())
+        if where is not None:
+            statement = statement.where(where)
+        sql = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+        return f"INSERT INTO {self.name}(rowid, {', '.join(self.columns)}) {sql}"
+
+    # Table columns the indexed values are read from. Updates to any other column leave the index alone.
+    def source_columns(self):
+        names = []
+        for element in visitors.iterate(select(*self.columns.values())):
+            if isinstance(element, Column) and element.name not in names:
+                names.append(element.name)
+        return names
+
+    def create(self, connection):
+        if connection.dialect.name != "sqlite":
+            return
+        if connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": self.name}).first():
+            return
+        source = connection.dialect.identifier_preparer.quote(self.model.__table__.name)
+        key = self.key.name
+        try:
+            connection.exec_driver_sql(f"CREATE VIRTUAL TABLE {self.name} USING fts5({', '.join(self.columns)}, "
+                                       f"tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')")
+        except OperationalError as e:
+            self.available = False
+            log.warning(f"Search index {self.name} not created, searches will scan the {source} table: {e}")
+            return
+        inserted = self.rows(connection, self.key == literal_column(f"new.{key}"))
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {self.name}_insert AFTER INSERT ON {source} BEGIN {inserted}; END")
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {self.name}_update AFTER UPDATE OF {', '.join(self.source_columns())} ON {source} "
+                                   f"BEGIN DELETE FROM {self.name} WHERE rowid = old.{key}; {inserted}; END")
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {self.name}_delete AFTER DELETE ON {source} "
+                                   f"BEGIN DELETE FROM {self.name} WHERE rowid = old.{key}; END")
+        self.rebuild(connection)
+
+    def drop(self, connection):
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {self.name}")
+
+    # Indexes every row again, ex. after the indexed expressions change
+    def rebuild(self, connection):
+        connection.exec_driver_sql(f"DELETE FROM {self.name}")
+        connection.exec_driver_sql(self.rows(connection))
+
+    # Creates the index of a table made before it existed. Safe to call on every start.
+    def ensure(self):
+        with db.engine.begin() as connection:
+            self.create(connection)
+
+    def uses_index(self):
+        return self.available and db.session.get_bind().dialect.name == "sqlite"
+
+    def ranked(self, terms: list):
+        index = table(self.name, column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        return (select(self.model).join(index, self.key == index.c.rowid)
+                .where(literal_column(self.name).op("MATCH")(match))
+                .order_by(func.bm25(literal_column(self.name), *self.weights), self.key))
+
+    def scanned(self, terms: list):
+        attributes = [getattr(self.model, name) for name in self.columns]
+        matches = [or_(*(attribute.istartswith(term, autoescape=True) for attribute in attributes)) for term in terms]
+        return select(self.model).where(*matches).order_by(*attributes, self.key)
+
+    # Models matching every word of the query, best first. filters are applied to the model like Query.filter().
+    def search(self, query: str, *filters, limit: int = 20, offset: int = 0):
+        terms = TERM.findall(query.lower())[:MAX_TERMS]
+        if not terms:
+            return []
+        statement = self.ranked(terms) if self.uses_index() else self.scanned(terms)
+        return db.session.scalars(statement.where(*filters).offset(offset).limit(limit)).all()
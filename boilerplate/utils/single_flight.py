@@ -0,0 +1,109 @@
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+import boilerplate.utils.cache as cache
+from flask import request
+from flask_login import current_user
+from functools import wraps
+import threading
+import time
+
+# ==============================================================================================================================================================
+#                                                                      Variables
+# ==============================================================================================================================================================
+# In flight computations and recently finished results, keyed by flight_key(). Both are per worker: threads within a worker share them.
+flights = {}
+results = {}
+# Endpoints whose results are dropped when a channel is published on the invalidation bus
+channel_endpoints = {}
+lock = threading.Lock()
+
+# ==============================================================================================================================================================
+#                                                                      Functions
+# ==============================================================================================================================================================
+class Flight():
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+
+# Identical requests are the same endpoint with the same arguments, seen by a viewer with the same permissions. Two users with the same role get the
+# same answer from these endpoints, so the role's permission set stands in for the user.
+def flight_key():
+    role = current_user.role
+    permissions = (bool(role.system), tuple(sorted(role.actions or ())))
+    return (request.endpoint, tuple(sorted(request.view_args.items())), tuple(sorted(request.args.items(multi=True))), permissions)
+
+
+# Responses are shared as their serialized body, status and headers. Followers get their own response object built from them, so nothing bound
+# to the leader's database session or thread crosses over.
+def freeze(response):
+    return response.get_data(), response.status_code, [(name, value) for name, value in response.headers if name.lower() != "set-cookie"]
+
+
+def thaw(frozen):
+    body, status, headers = frozen
+    return app.response_class(body, status=status, headers=headers)
+
+
+def drop_results(channel: str):
+    endpoints = channel_endpoints.get(channel, ())
+    with lock:
+        for key in [key for key in results if key[0] in endpoints]:
+            del results[key]
+
+
+def remember(key, frozen, ttl: float):
+    now = time.monotonic()
+    for stale in [stale for stale, (expires, _) in results.items() if expires <= now]:
+        del results[stale]
+    results[key] = (now + ttl, frozen)
+
+# ==============================================================================================================================================================
+#                                                                      Decorators
+# ==============================================================================================================================================================
+# Coalesces concurrent identical requests to an expensive read only endpoint. The first request runs the view while the rest wait for it and reuse
+# its response. With a ttl the response is also reused for that many seconds afterwards, unless one of the given invalidation channels is
+# published first. Place it after the login and permission decorators so every request is still authorized on its own.
+def single_flight(ttl: float = None, channels: tuple = ()):
+    ttl = config.SINGLE_FLIGHT_TTL if ttl is None else ttl
+
+    def decorator(function):
+        for channel in channels:
+            if channel not in channel_endpoints:
+                cache.subscribe(channel, drop_results)
+            channel_endpoints.setdefault(channel, set()).add(function.__name__)
+        view = app.ensure_sync(function)
+
+        @wraps(function)
+        def decorated_function(*args, **kwargs):
+            key = flight_key()
+            with lock:
+                remembered = results.get(key)
+                if remembered and remembered[0] > time.monotonic():
+                    return thaw(remembered[1])
+                flight = flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = flights[key] = Flight()
+
+            if not leader:
+                if flight.done.wait(config.SINGLE_FLIGHT_TIMEOUT) and flight.response is not None:
+                    return thaw(flight.response)
+                # The leader failed or is taking too long. Answer this request on its own.
+                log.debug(f"Single flight for {request.endpoint} not shared, running it again")
+                return view(*args, **kwargs)
+
+            try:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    flight.response = freeze(response)
+                return response
+            finally:
+                with lock:
+                    del flights[key]
+                    if ttl and flight.response is not None:
+                        remember(key, flight.response, ttl)
+                flight.done.set()
+        return decorated_function
+    return decorator
@@ -0,0 +1,223 @@
+from boilerplate.app import app
+from boilerplate.db import db, UPSERT_INSERTS
+import boilerplate.config as config
+import boilerplate.utils.lumberjack as log
+from boilerplate.utils.scheduler import scheduled
+from boilerplate.modules.role.role_decorators import require_system_role
+from flask_login import login_required
+from sqlalchemy import event, select, insert, update, delete, func, inspect
+from sqlalchemy.orm import Session, object_session
+from collections import Counter
+from types import SimpleNamespace
+
+# ==============================================================================================================================================================
+#                                                                     Aggregate Model
+# ==============================================================================================================================================================
+# One running count per key (ex. "users.active"). Reading a count is a primary key lookup however large the counted table gets.
+class Aggregate(db.Model):
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# ==============================================================================================================================================================
+#                                                                        Variables
+# ==============================================================================================================================================================
+# Counted model -> (keys function, columns it reads, prefix of every key it returns). See count_rows.
+counted_models = {}
+
+# ==============================================================================================================================================================
+#                                                                       Registration
+# ==============================================================================================================================================================
+# Keeps counts of a model's rows. keys(row) returns the keys a row counts toward and may only read the columns named in columns, ex. a user
+# counts toward "users.active" or "users.deactivated" depending on its active column. Every key starts with prefix, which reconcile() uses to
+# find the keys it owns.
+def count_rows(model, keys, columns: tuple, prefix: str):
+    counted_models[model] = (keys, tuple(columns), prefix)
+    event.listen(model, "after_insert", _count_inserted)
+    event.listen(model, "after_delete", _count_deleted)
+    event.listen(model, "after_update", _count_updated)
+
+# ==============================================================================================================================================================
+#                                                                    Incremental Counts
+# ==============================================================================================================================================================
+# Changes are added up while a flush runs and written once per key after it, in the flush's transaction, so a rollback undoes them too.
+def add_row(session, row, model, sign: int):
+    keys, _, _ = counted_models[model]
+    deltas = session.info.setdefault("aggregate_deltas", Counter())
+    for key in keys(row):
+        deltas[key] += sign
+
+
+def mark_stale(session, model):
+    session.info.setdefault("aggregates_stale", set()).add(model)
+
+
+def apply_deltas(connection, deltas: dict):
+    upsert = UPSERT_INSERTS.get(connection.dialect.name)
+    # Sorted so concurrent transactions lock the rows in the same order
+    for key, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if upsert is not None:
+            connection.execute(upsert(Aggregate).values(key=key, value=delta)
+                               .on_conflict_do_update(index_elements=[Aggregate.key], set_={"value": Aggregate.value + delta}))
+        elif connection.execute(update(Aggregate).where(Aggregate.key == key).values(value=Aggregate.value + delta)).rowcount == 0:
+            connection.execute(insert(Aggregate).values(key=key, value=delta))
+
+
+def _count_inserted(mapper, connection, target):
+    add_row(object_session(target), target, type(target), 1)
+
+
+def _count_deleted(mapper, connection, target):
+    add_row(object_session(target), target, type(target), -1)
+
+
+# A row that moved between keys (ex. a user deactivated) is taken off its old keys and added to its new ones
+def _count_updated(mapper, connection, target):
+    model = type(target)
+    _, columns, _ = counted_models[model]
+    session = object_session(target)
+    state = inspect(target)
+    old = {}
+    for name in columns:
+        history = state.attrs[name].history
+        if history.deleted:
+            old[name] = history.deleted[0]
+        elif history.added:
+            # Set without the old value ever being loaded, so there's no telling which key it leaves
+            mark_stale(session, model)
+            return
+        else:
+            old[name] = getattr(target, name)
+    if any(old[name] != getattr(target, name) for name in columns):
+        add_row(session, SimpleNamespace(**old), model, -1)
+        add_row(session, target, model, 1)
+
+
+@event.listens_for(Session, "after_flush")
+def _write_flushed_counts(session, flush_context):
+    deltas = session.info.pop("aggregate_deltas", None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+# Bulk writes skip the mapper events above. Rows created by an INSERT ... RETURNING (see insert_if_not_exists in db.py) are counted from what
+# it returns. Anything else that may have moved rows between keys has the model's counts taken again before the transaction commits.
+@event.listens_for(Session, "do_orm_execute")
+def _count_bulk_writes(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    models = [mapper.class_ for mapper in orm_execute_state.all_mappers if mapper.class_ in counted_models]
+    if not models:
+        return None
+    session = orm_execute_state.session
+    if orm_execute_state.is_update:
+        # Updates of other columns (ex. clearing expired reset codes) can't move a row
+        values = getattr(orm_execute_state.statement, "_values", None) or {}
+        changed = {getattr(column, "key", column) for column in values}
+        models = [model for model in models if not values or changed & set(counted_models[model][1])]
+        if not models:
+            return None
+    # Inserts without RETURNING (ex. session.execute(insert(User), rows)) leave nothing to count from
+    if orm_execute_state.is_insert and getattr(orm_execute_state.statement, "_returning", None):
+        frozen = orm_execute_state.invoke_statement().freeze()
+        rows = [row for row in frozen().scalars() if type(row) in counted_models]
+        if rows:
+            for row in rows:
+                add_row(session, row, type(row), 1)
+            apply_deltas(session.connection(), session.info.pop("aggregate_deltas"))
+        else:
+            for model in models:
+                mark_stale(session, model)
+        return frozen()
+    for model in models:
+        mark_stale(session, model)
+    return None
+
+
+@event.listens_for(Session, "before_commit")
+def _recount_stale_models(session):
+    stale = session.info.pop("aggregates_stale", None)
+    if stale:
+        reconcile(stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_counts(session):
+    session.info.pop("aggregate_deltas", None)
+    session.info.pop("aggregates_stale", None)
+
+# ==============================================================================================================================================================
+#                                                                      Reconciliation
+# ==============================================================================================================================================================
+# Counts the rows of each model again and corrects any stored count that differs. Returns the corrected keys as {key: (stored, counted)}.
+# Run when the app starts, after bulk writes and on a schedule, in case a write from outside the app (or a crash between writes) left a count
+# behind. The caller commits.
+def reconcile(models=None):
+    drift = {}
+    connection = db.session.connection()
+    for model in models or list(counted_models):
+        keys, columns, prefix = counted_models[model]
+        counted = Counter()
+        attributes = [getattr(model, name) for name in columns]
+        for row in connection.execute(select(*attributes, func.count().label("rows")).select_from(model).group_by(*attributes)):
+            if row.rows:
+                for key in keys(row):
+                    counted[key] += row.rows
+        stored = dict(connection.execute(select(Aggregate.key, Aggregate.value).where(Aggregate.key.startswith(prefix, autoescape=True))).all())
+        changed = {key: (stored.get(key, 0), counted.get(key, 0)) for key in set(stored) | set(counted) if stored.get(key) != counted.get(key)}
+        if changed:
+            drift.update(changed)
+            connection.execute(delete(Aggregate).where(Aggregate.key.startswith(prefix, autoescape=True)))
+            if counted:
+                connection.execute(insert(Aggregate), [{"key": key, "value": value} for key, value in counted.items()])
+    return drift
+
+
+@scheduled("reconcile_aggregates", every=config.AGGREGATES_RECONCILE_SECONDS)
+def reconcile_aggregates():
+    try:
+        drift = reconcile()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Keys that only dropped to zero (ex. the count of a deleted role) are tidied up quietly
+    drifted = {key: values for key, values in drift.items() if values[0] != values[1]}
+    if drifted:
+        log.warning(f"Corrected {len(drifted)} aggregate counts that had drifted: "
+                    + ", ".join(f"{key} {stored} -> {counted}" for key, (stored, counted) in sorted(drifted.items())))
+    return len(drifted)
+
+# ==============================================================================================================================================================
+#                                                                          Reads
+# ==============================================================================================================================================================
+def get_count(key: str):
+    return db.session.scalar(select(Aggregate.value).where(Aggregate.key == key)) or 0
+
+
+def get_counts(keys: list):
+    keys = list(keys)
+    stored = dict(db.session.execute(select(Aggregate.key, Aggregate.value).where(Aggregate.key.in_(keys))).all()) if keys else {}
+    return {key: stored.get(key, 0) for key in keys}
+
+
+# Every count, nested by the parts of its key, ex. {"users": {"active": 2, "role": {"<uuid>": 1}}, "roles": 3}
+def get_all_counts():
+    counts = {}
+    for key, value in db.session.execute(select(Aggregate.key, Aggregate.value).order_by(Aggregate.key)).all():
+        *parents, name = key.split(".")
+        level = counts
+        for parent in parents:
+            level = level.setdefault(parent, {})
+        level[name] = value
+    return counts
+
+# ==============================================================================================================================================================
+#                                                                     Endpoint Routes
+# ==============================================================================================================================================================
+@app.get('/api/v1/stats')
+@login_required
+@require_system_role
+def get_stats_json():
+    return get_all_counts()
@@ -1,8 +1,22 @@
 from boilerplate.app import app
-from urllib.parse import urlparse, urljoin, unquote
-from flask import request, url_for
+from urllib.parse import urlparse, urljoin
+from flask import request
+from flask_login import login_required
 import re
 import importlib
+import hashlib
+
+# login_required() gives every view it wraps the same code object, which is how it is recognised in a stack of decorators
+LOGIN_REQUIRED_CODE = login_required(lambda: None).__code__
+# <converter:name> or <name> in a rule
+RULE_ARGUMENT = re.compile(r"<(?:[^<>:]+:)?([^<>]+)>")
+
+# Built once every route is registered (see boilerplate/__init__.py). Flask refuses new routes once the app has handled a request, so it never
+# goes stale. routes lists every rule while endpoint_access holds what each endpoint's decorators require of the viewer.
+routes = []
+routes_json = None
+endpoint_access = {}
+manifest_version = None
 
 def validate_uuid(uuid_string: str):
     uuid_regex = re.compile(r'^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$')
@@ -13,28 +27,74 @@ def is_safe_url(target: str):
     test_url = urlparse(urljoin(request.host_url, target))
     return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
 
-def route_info():
-    routes = []
-    # Fetch data about all the routes
+# ==============================================================================================================================================================
+#                                                                    Route Manifest
+# ==============================================================================================================================================================
+# Every decorator uses functools.wraps, so the whole stack can be walked through __wrapped__
+def requires_login(view_function):
+    while view_function is not None:
+        if getattr(view_function, "__code__", None) is LOGIN_REQUIRED_CODE:
+            return True
+        view_function = getattr(view_function, "__wrapped__", None)
+    return False
+
+# Records every route along with what it requires of the viewer, read from the metadata left by login_required, @require_system_role,
+# @require_action and @anonymous_route, along with its load shedding @priority and any @rate_limit. /api/v1/routes and the request fast
+# path read it instead of inspecting views on every request.
+def build_route_manifest():
+    global manifest_version, routes_json
+    access = {}
+    for endpoint, view_function in app.view_functions.items():
+        system_role_required = bool(getattr(view_function, "system_role_required", False))
+        required_actions = list(getattr(view_function, "required_actions", ()))
+        access[endpoint] = {
+            'auth_required': requires_login(view_function) or system_role_required or bool(required_actions),
+            'system_role_required': system_role_required,
+            'required_actions': required_actions,
+            'anonymous': bool(getattr(view_function, "anonymous_route", False)),
+            'priority': getattr(view_function, "priority", "normal"),
+            'rate_limits': list(getattr(view_function, "rate_limits", ())),
+        }
+
+    manifest = []
     for rule in app.url_map.iter_rules():
-        view_function = app.view_functions[rule.endpoint]
-        module = view_function.__module__
-        #location = view_function.__module__['__file__']
-        location = str(importlib.util.find_spec(module).origin)
-        method = list(rule.methods)
-
-        # Format the url options parameters
-        options = {}
-        for arg in rule.arguments:
-            options[arg] = "[{0}]".format(arg)
-        url = unquote(url_for(rule.endpoint, **options))
-
-        # Check to see if the function requires auth
-        auth_required = False
-        if 'is_authenticated' in view_function.__code__.co_names:
-            auth_required = True
-
-        # create a dictionary object to represent the route and add it to the routes list
-        route = {'method': method, 'url': url, 'auth_required': auth_required, 'location': location, 'module': module}
-        routes.append(route)
-    return routes
\ No newline at end of file
+        module = app.view_functions[rule.endpoint].__module__
+        manifest.append({
+            'method': sorted(rule.methods),
+            'url': RULE_ARGUMENT.sub(r"[\1]", rule.rule),
+            'endpoint': rule.endpoint,
+            'location': str(importlib.util.find_spec(module).origin),
+            'module': module,
+            **access[rule.endpoint],
+        })
+    manifest.sort(key=lambda route: (route['module'], route['url']))
+
+    routes[:] = manifest
+    routes_json = app.json.dumps(manifest)
+    endpoint_access.clear()
+    endpoint_access.update(access)
+    manifest_version = hashlib.sha256(repr(manifest).encode("utf-8")).hexdigest()
+
+
+def is_anonymous_endpoint(endpoint: str):
+    access = endpoint_access.get(endpoint)
+    return access is not None and access['anonymous']
+
+
+def route_info():
+    if manifest_version is None:
+        build_route_manifest()
+    return routes
+
+
+# The manifest already serialized, so /api/v1/routes only has to send it
+def route_info_response():
+    if manifest_version is None:
+        build_route_manifest()
+    return app.response_class(routes_json, mimetype="application/json")
+
+# Used as the ETag version of /api/v1/routes
+def route_version():
+    if manifest_version is None:
+        build_route_manifest()
+    return manifest_version
\ No newline at end of file
@@ -8,6 +8,10 @@ pip3 install -r requirements.txt --root-user-action=ignore | grep -v 'already sa
 chmod +x ./nginx/ssl/generate-selfsigned.sh
 ./nginx/ssl/generate-selfsigned.sh
 
-# Boot the application with 5 workers using gthread workers. 
-# Uses --reload to restart gunicorn. Might want to remove for production.
-/usr/local/bin/gunicorn -b :8443 boilerplate:app --log-level=debug --workers=5 -t 30 --certfile=nginx/ssl/bundle.pem --keyfile=nginx/ssl/server.key --ssl-version=TLSv1_2 --reload
\ No newline at end of file
+# Build the minified, fingerprinted and precompressed static assets served by NGINX
+echo "Building Static Assets..."
+flask --app boilerplate build-assets
+
+# Boot the application. Workers, threads, timeouts and TLS are chosen in gunicorn.conf.py from SERVER_PROFILE and the cores and memory available.
+# The development profile serves HTTPS on :8443 and uses --reload. See docker-compose.production.yml for the production profile.
+exec /usr/local/bin/gunicorn -c gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,183 @@
+import importlib.util
+import gc
+import os
+import psutil
+
+# ==============================================================================================================================================================
+#                                                                      Configuration
+# ==============================================================================================================================================================
+# gunicorn settings loaded with "gunicorn -c gunicorn.conf.py". Anything set in .env through config.py drives the values below and options given on
+# the command line still take priority. Every top level name in this file is read as a gunicorn setting, so helpers are kept out of the way with a
+# leading underscore.
+
+# Load boilerplate/config.py on its own. Importing it as boilerplate.config would run boilerplate/__init__.py and build the whole app right here.
+_spec = importlib.util.spec_from_file_location("boilerplate_settings", os.path.join(os.path.dirname(os.path.abspath(__file__)), "boilerplate", "config.py"))
+_settings = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_settings)
+_production = _settings.SERVER_PROFILE == "production"
+
+# ==============================================================================================================================================================
+#                                                                    Resource Sizing
+# ==============================================================================================================================================================
+
+# Cores this container may actually use. A cgroup CPU quota (docker --cpus) is honoured before the affinity mask.
+def _available_cores():
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as quota_file, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period_file:
+            quota, period = int(quota_file.read()), int(period_file.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+# Memory this container may use in MB. A cgroup memory limit (docker --memory) is honoured before the host's total.
+def _available_memory_mb():
+    host_memory = psutil.virtual_memory().total
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as limit_file:
+                limit = limit_file.read().strip()
+            if limit != "max" and int(limit) < host_memory:
+                return int(limit) // (1024 * 1024)
+        except (OSError, ValueError):
+            continue
+    return host_memory // (1024 * 1024)
+
+
+# The usual 2 x cores + 1, capped so the workers fit in 80% of memory at GUNICORN_WORKER_MEMORY_MB each. Bcrypt hashing is CPU bound so CPU
+# parallelism comes from processes.
+def _size_workers(cores: int, memory_mb: int):
+    by_cpu = 2 * cores + 1
+    by_memory = int(memory_mb * 0.8) // _settings.GUNICORN_WORKER_MEMORY_MB
+    return max(1, min(by_cpu, by_memory))
+
+
+# Threads only help while a request is waiting (database, socket, file system). A handful per worker covers the database waits without letting
+# bcrypt heavy requests pile up behind one GIL.
+def _size_threads(production: bool):
+    return 4 if production else 2
+
+
+_cores = _available_cores()
+_memory_mb = _available_memory_mb()
+
+# ==============================================================================================================================================================
+#                                                                    Gunicorn Settings
+# ==============================================================================================================================================================
+wsgi_app = "boilerplate:app"
+worker_class = "gthread"
+workers = _settings.GUNICORN_WORKERS or _size_workers(_cores, _memory_mb)
+threads = _settings.GUNICORN_THREADS or _size_threads(_production)
+
+# ASGI mode (see boilerplate/asgi.py). Each uvicorn worker runs one event loop for the async API routes and ASGI_THREADS threads for everything
+# else, so "threads" no longer applies. uvicorn workers don't call post_request, so GUNICORN_MAX_WORKER_RSS_MB has no effect in this mode.
+if _settings.SERVER_INTERFACE == "asgi":
+    wsgi_app = "boilerplate.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+# Build the app once in the master and fork the workers from it. Templates, SQLAlchemy metadata and the registered actions are then shared
+# copy-on-write between workers instead of being rebuilt in every process.
+preload_app = _settings.GUNICORN_PRELOAD
+
+if _production:
+    # Plain HTTP on a unix socket shared with NGINX, which terminates TLS. See docker-compose.production.yml.
+    os.makedirs(os.path.dirname(_settings.GUNICORN_SOCKET), exist_ok=True)
+    bind = [f"unix:{_settings.GUNICORN_SOCKET}"]
+    umask = 0o111
+    loglevel = "info"
+    timeout = _settings.GUNICORN_TIMEOUT or 30
+    graceful_timeout = 30
+    # Must outlast the upstream keepalive_timeout in nginx.production.conf so NGINX is always the side that closes idle connections.
+    keepalive = _settings.GUNICORN_KEEPALIVE or 75
+    # Recycle workers after a number of requests to cap slow memory growth. The jitter stops every worker restarting at the same moment.
+    max_requests = _settings.GUNICORN_MAX_REQUESTS
+    max_requests_jitter = _settings.GUNICORN_MAX_REQUESTS_JITTER
+else:
+    bind = [":8443"]
+    certfile = "nginx/ssl/bundle.pem"
+    keyfile = "nginx/ssl/server.key"
+    ssl_version = "TLSv1_2"
+    loglevel = "debug"
+    reload = True
+    # Generous so a paused debugger does not get the worker killed
+    timeout = _settings.GUNICORN_TIMEOUT or 120
+    keepalive = _settings.GUNICORN_KEEPALIVE or 2
+
+# ==============================================================================================================================================================
+#                                                                    Server Hooks
+# ==============================================================================================================================================================
+
+# Runs in the master as it boots. Logs what was chosen and why so a misbehaving instance size is easy to spot.
+def on_starting(server):
+    cfg = server.cfg
+    server.log.info(f"Profile: {_settings.SERVER_PROFILE} ({_cores} cores, {_memory_mb} MB available)")
+    server.log.info(f"Workers: {cfg.workers} x {cfg.threads} threads ({cfg.worker_class_str}), preload: {cfg.preload_app}")
+    server.log.info(f"Timeout: {cfg.timeout}s, keep-alive: {cfg.keepalive}s, "
+                    f"max requests: {cfg.max_requests or 'unlimited'} (+/- {cfg.max_requests_jitter})")
+
+
+# Runs in the master once the (preloaded) app is ready and before any worker is forked.
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from boilerplate.app import app
+    from boilerplate.db import dispose_engines
+    import boilerplate.utils.scheduler as scheduler
+
+    # The master never serves requests or runs jobs, so it stops the scheduler thread the import started and must not hold database connections
+    # the workers would inherit.
+    scheduler.stop()
+    with app.app_context():
+        dispose_engines()
+
+    # Move everything allocated so far into the permanent generation. The garbage collector then never touches (and so never writes to) those
+    # objects' pages, which keeps them shared between the workers instead of being copied into each one on the first collection.
+    gc.collect()
+    gc.freeze()
+
+
+# Runs in the master before each worker (including replacements) is forked.
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        gc.freeze()
+
+
+# Runs in each worker straight after it is forked.
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    from boilerplate.app import app
+    from boilerplate.db import dispose_engines
+    import boilerplate.utils.lumberjack as lumberjack
+    import boilerplate.utils.scheduler as scheduler
+
+    with app.app_context():
+        dispose_engines(close=False)
+    lumberjack.configure_handler()
+    scheduler.start()
+
+
+# Runs in each worker after every request. Once the worker's RSS passes GUNICORN_MAX_WORKER_RSS_MB it is retired the same way max_requests retires
+# it: it finishes its in flight requests and exits, and the master forks a fresh one. Reading RSS is a single /proc read so it is checked every time.
+def post_request(worker, req, environ, resp):
+    if not _settings.GUNICORN_MAX_WORKER_RSS_MB or not worker.alive:
+        return
+    rss_mb = psutil.Process().memory_info().rss / (1024 * 1024)
+    if rss_mb > _settings.GUNICORN_MAX_WORKER_RSS_MB:
+        worker.log.warning(f"Worker {worker.pid} RSS is {rss_mb:.0f} MB, over the {_settings.GUNICORN_MAX_WORKER_RSS_MB} MB ceiling. Restarting it.")
+        worker.alive = False
+
+
+# Runs in each worker as it exits. A leader releases its lease so another worker takes over on its next tick instead of after the lease runs out.
+def worker_exit(server, worker):
+    import boilerplate.utils.scheduler as scheduler
+    scheduler.stop()
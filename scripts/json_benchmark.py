@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# ==============================================================================================================================================================
+#                                                                    JSON Benchmark
+# ==============================================================================================================================================================
+# Times serializing a generated list of users and roles to a JSON response with Flask's default provider and with ModelJSONProvider on each
+# available backend. The models are built in memory and never touch the database, but importing the app still needs DB_CONNECTION_STRING.
+#
+# Examples:
+#   DB_CONNECTION_STRING=sqlite:////tmp/benchmark.db python scripts/json_benchmark.py
+#   DB_CONNECTION_STRING=sqlite:////tmp/benchmark.db python scripts/json_benchmark.py --users 5000 --repeat 20
+import argparse
+import datetime
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from boilerplate.app import app
+from boilerplate.modules.user.user_model import User
+from boilerplate.modules.role.role_model import Role
+from boilerplate.utils.json_provider import ModelJSONProvider, orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+# Instances made through the mapper skip __init__, which would hash a password for every user
+def build(model, **values):
+    instance = model.__mapper__.class_manager.new_instance()
+    for name, value in values.items():
+        setattr(instance, name, value)
+    return instance
+
+
+def generate(count: int):
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    users = [build(User, id=number, uuid=uuid.uuid4(), active=bool(number % 7), first_name=f"First{number}", last_name=f"Last{number}",
+                   email=f"user{number}@example.com", creation_time=now + datetime.timedelta(minutes=number)) for number in range(count)]
+    roles = [build(Role, id=number, uuid=uuid.uuid4(), active=True, hidden=False, system=number == 0, name=f"Role {number}",
+                   description="Generated role " * 4, actions=["read_users_list", "read_roles_list", "create_or_edit_user"],
+                   creation_time=now) for number in range(max(1, count // 50))]
+    return users, roles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON providers on generated users and roles.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    users, roles = generate(args.users)
+    providers = [("flask default", DefaultJSONProvider(app))]
+    stdlib = ModelJSONProvider(app)
+    stdlib.backend = "stdlib"
+    providers.append(("model stdlib", stdlib))
+    if orjson is not None:
+        optimized = ModelJSONProvider(app)
+        optimized.backend = "orjson"
+        providers.append(("model orjson", optimized))
+
+    with app.app_context():
+        app.debug = False
+        print(f"{len(users)} users, {len(roles)} roles, best of {args.repeat}")
+        print(f"{'provider':<16}{'users':>12}{'per user':>12}{'roles':>12}{'bytes':>10}")
+        baseline = None
+        for name, provider in providers:
+            user_time = min(timeit.repeat(lambda: provider.response(users), number=1, repeat=args.repeat))
+            role_time = min(timeit.repeat(lambda: provider.response(roles), number=1, repeat=args.repeat))
+            baseline = baseline or user_time
+            size = len(provider.response(users).get_data())
+            print(f"{name:<16}{user_time * 1000:>9.2f} ms{user_time / len(users) * 1e6:>9.2f} us{role_time * 1000:>9.2f} ms{size:>10}"
+                  f"  ({baseline / user_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
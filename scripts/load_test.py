@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# ==============================================================================================================================================================
+#                                                                      Load Harness
+# ==============================================================================================================================================================
+# Small dependency free load generator used to compare server configurations. Fires a fixed number of requests at a URL from a pool of threads and
+# reports throughput and latency percentiles. Works over HTTP, HTTPS (self signed certificates accepted) or a unix socket.
+#
+# Examples:
+#   python scripts/load_test.py https://localhost/login -n 2000 -c 10
+#   python scripts/load_test.py http://localhost/login --unix-socket /run/gunicorn/gunicorn.sock
+#   python scripts/load_test.py https://localhost/api/v1/roles --login admin@default.com 'iloveflask!'
+#   python scripts/load_test.py https://localhost/login --no-keepalive
+#   python scripts/load_test.py http://localhost/api/v1/roles --unix-socket /run/gunicorn/gunicorn.sock --request-start -c 64
+import argparse
+import http.client
+import socket
+import ssl
+import statistics
+import threading
+import time
+from urllib.parse import urlparse, urlencode
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def open_connection(url, args):
+    if args.unix_socket:
+        return UnixHTTPConnection(args.unix_socket, args.timeout)
+    if url.scheme == "https":
+        context = ssl.create_default_context()
+        if args.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return http.client.HTTPSConnection(url.hostname, url.port or 443, timeout=args.timeout, context=context)
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=args.timeout)
+
+
+def login(url, args):
+    connection = open_connection(url, args)
+    body = urlencode({"email": args.login[0], "password": args.login[1]})
+    connection.request("POST", "/login", body=body, headers={"Host": url.netloc, "Content-Type": "application/x-www-form-urlencoded"})
+    response = connection.getresponse()
+    response.read()
+    cookies = [header.split(";", 1)[0] for name, header in response.getheaders() if name.lower() == "set-cookie"]
+    connection.close()
+    if response.status not in (200, 302) or not cookies:
+        raise SystemExit(f"Login failed with HTTP {response.status}")
+    return "; ".join(cookies)
+
+
+def worker(url, args, headers, counter, lock, latencies, errors):
+    connection = None
+    path = url.path or "/"
+    if url.query:
+        path += "?" + url.query
+    while True:
+        with lock:
+            if counter[0] >= args.requests:
+                break
+            counter[0] += 1
+        if connection is None:
+            connection = open_connection(url, args)
+        start = time.perf_counter()
+        if args.request_start:
+            headers = {**headers, "X-Request-Start": f"t={time.time():.3f}"}
+        try:
+            connection.request(args.method, path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            if response.status >= 500:
+                errors.append(response.status)
+            else:
+                latencies.append(elapsed)
+            if not args.keepalive or response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as error:
+            errors.append(type(error).__name__)
+            if connection is not None:
+                connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire requests at a URL and report latency percentiles.")
+    parser.add_argument("url")
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("-m", "--method", default="GET")
+    parser.add_argument("-H", "--header", action="append", default=[], help="Extra header as 'Name: value'")
+    parser.add_argument("--unix-socket", help="Connect through a unix socket instead of TCP")
+    parser.add_argument("--no-keepalive", dest="keepalive", action="store_false", help="Open a new connection for every request")
+    parser.add_argument("--verify", dest="insecure", action="store_false", help="Verify TLS certificates. Self signed certificates are accepted by default")
+    parser.add_argument("--login", nargs=2, metavar=("EMAIL", "PASSWORD"), help="Log in first and send the session cookie")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--request-start", action="store_true", help="Stamp each request with X-Request-Start as NGINX does, so load shedding sees the queueing delay")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    headers = {"Host": url.netloc or "localhost"}
+    for header in args.header:
+        name, value = header.split(":", 1)
+        headers[name.strip()] = value.strip()
+    if args.login:
+        headers["Cookie"] = login(url, args)
+
+    counter = [0]
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=worker, args=(url, args, headers, counter, lock, latencies, errors)) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"URL:          {args.url}{' via ' + args.unix_socket if args.unix_socket else ''}")
+    print(f"Keep-alive:   {'on' if args.keepalive else 'off'}")
+    print(f"Requests:     {len(latencies)} ok, {len(errors)} failed in {duration:.2f}s ({len(latencies) / duration:.1f} req/s)")
+    if errors:
+        print(f"Failures:     {', '.join(f'{error} x{errors.count(error)}' for error in sorted(set(errors), key=str))}")
+    if latencies:
+        print(f"Latency (ms): mean {statistics.mean(latencies) * 1000:.2f}  p50 {percentile(latencies, 0.5) * 1000:.2f}  "
+              f"p90 {percentile(latencies, 0.9) * 1000:.2f}  p99 {percentile(latencies, 0.99) * 1000:.2f}  max {latencies[-1] * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# ==============================================================================================================================================================
+#                                                                  Worker Memory Report
+# ==============================================================================================================================================================
+# Reports the memory of every gunicorn worker under a master process using psutil. USS (unique set size) is the memory that would be freed if the
+# worker exited, so it is the number that shrinks when preloading lets workers share pages copy-on-write with the master.
+#
+# Examples:
+#   python scripts/worker_memory.py 1234
+#   python scripts/worker_memory.py $(pgrep -o -f "gunicorn.*boilerplate:app")
+import argparse
+import psutil
+
+
+def megabytes(value):
+    return f"{value / 1024 / 1024:8.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report RSS, USS and PSS for a gunicorn master and its workers.")
+    parser.add_argument("master_pid", type=int)
+    args = parser.parse_args()
+
+    master = psutil.Process(args.master_pid)
+    processes = [("master", master)] + [("worker", child) for child in master.children()]
+    total_uss = 0
+    print(f"{'role':<8}{'pid':>8}{'rss':>14}{'uss':>14}{'pss':>14}")
+    for role, process in processes:
+        memory = process.memory_full_info()
+        if role == "worker":
+            total_uss += memory.uss
+        print(f"{role:<8}{process.pid:>8}{megabytes(memory.rss):>14}{megabytes(memory.uss):>14}{megabytes(getattr(memory, 'pss', 0)):>14}")
+    workers = len(processes) - 1
+    if workers:
+        print(f"Average worker USS: {megabytes(total_uss / workers).strip()} across {workers} workers")
+
+
+if __name__ == "__main__":
+    main()
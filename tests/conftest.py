@@ -4,55 +4,132 @@ This module provides shared test configuration and reusable fixtures for all tes
 """
 
 import pytest
+import sqlite3
+import shutil
 import tempfile
 import os
+
+# Each process (every pytest-xdist worker included) gets its own folder for the database, the SQLite cache and rate limit stores, logs and
+# captures. It is set before the app is imported, so importing it never creates or seeds anything in the configured database.
+worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+test_folder = tempfile.mkdtemp(prefix=f"boilerplate-tests-{worker}-")
+database_path = os.path.join(test_folder, "test.db")
+template_path = os.path.join(test_folder, "template.db")
+os.environ["DB_CONNECTION_STRING"] = f"sqlite:///{database_path}"
+os.environ["DB_SEED"] = "False"
+os.environ["CACHE_SQLITE_PATH"] = os.path.join(test_folder, "cache.db")
+os.environ["RATE_LIMIT_SQLITE_PATH"] = os.path.join(test_folder, "rate_limit.db")
+os.environ["LOGGING_FILE"] = os.path.join(test_folder, "main.log")
+os.environ["PROFILER_FOLDER"] = os.path.join(test_folder, "profiles")
+os.environ["DIAGNOSTICS_FOLDER"] = os.path.join(test_folder, "diagnostics")
+# The cheapest bcrypt cost. Three users are hashed for the suite instead of three full cost hashes per test.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The scheduler thread would run jobs against the test database in the background. Tests call scheduler.tick() themselves.
+os.environ.setdefault("SCHEDULER_ENABLED", "False")
+
 from boilerplate.app import app
-from boilerplate.db import db
+from boilerplate.db import db, dispose_engines
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
 from boilerplate.modules.role.role_model import get_role_by_name, seed_roles_if_required, update_system_roles
 from boilerplate.modules.user.user_model import User
+import boilerplate.config as config
+import boilerplate.utils.cache as cache
+import boilerplate.utils.rate_limit as rate_limit
 
 
-@pytest.fixture
-def client():
+def pytest_configure(config):
+    config.addinivalue_line("markers", "commits: run against the real database instead of inside a rolled back transaction, for tests whose "
+                                       "writes must reach other connections or threads. The database is restored from the template afterwards.")
+
+
+class ConnectionSession(Session):
+    """A session that always uses the test's connection. Flask-SQLAlchemy's session picks an engine by bind key and would ignore bind."""
+
+    def get_bind(self, *args, **kwargs):
+        return self.bind
+
+
+def copy_database(source: str, destination: str):
+    """Copies a SQLite database with the backup API, which is safe while the app has connections to either file"""
+    with sqlite3.connect(source) as source_connection, sqlite3.connect(destination) as destination_connection:
+        source_connection.backup(destination_connection)
+    source_connection.close()
+    destination_connection.close()
+
+
+@pytest.fixture(scope="session")
+def database():
     """
-    Creates a test client for the Flask application.
-    Sets up an in-memory SQLite database for testing.
-    
-    Yields:
-        FlaskClient: A test client for making requests to the app
+    Builds the schema and seed data once per session and keeps a copy of it as the template tests are restored from.
+    The app created the tables when it was imported.
     """
-    # Create a temporary database file
-    db_fd, db_path = tempfile.mkstemp()
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-    app.config['TESTING'] = True
-    app.config['DB_SEED'] = False
-    app.config['WTF_CSRF_ENABLED'] = False
-    
-    with app.app_context():
-        db.create_all()
-        # Seed roles for testing
+    with app.app_context(), pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(config, "DB_SEED", True)
         seed_roles_if_required()
         update_system_roles()
-        
-        # Create test users
+
         admin_role = get_role_by_name("System Admin")
         default_role = get_role_by_name("Default Role")
-        
+
         admin = User("admin@test.com", "Admin", "User", "TestPassword123!", admin_role)
         user = User("user@test.com", "Default", "User", "TestPassword123!", default_role)
         inactive = User("inactive@test.com", "Inactive", "User", "TestPassword123!", default_role, active=False)
-        
+
         db.session.add_all([admin, user, inactive])
         db.session.commit()
-        
-        yield app.test_client()
-        
         db.session.remove()
-        db.drop_all()
-    
-    # Clean up the temporary database file
-    os.close(db_fd)
-    os.unlink(db_path)
+    copy_database(database_path, template_path)
+    yield database_path
+    with app.app_context():
+        dispose_engines()
+    shutil.rmtree(test_folder, ignore_errors=True)
+
+
+@pytest.fixture
+def client(database, request):
+    """
+    Creates a test client for the Flask application.
+    Every session of the test shares one connection whose transaction is rolled back afterwards, so commits only release a savepoint and
+    each test starts from the seeded database. Tests marked commits write to the database for real and it is restored from the template.
+
+    Yields:
+        FlaskClient: A test client for making requests to the app
+    """
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        # Every test starts with full rate limit buckets
+        rate_limit.clear()
+        if request.node.get_closest_marker("commits"):
+            yield app.test_client()
+            db.session.remove()
+            dispose_engines()
+            copy_database(template_path, database_path)
+        else:
+            connection = db.engine.connect()
+            driver_connection = connection.connection.driver_connection
+            # pysqlite only opens a transaction before a write, so the first SAVEPOINT would open it instead and releasing that savepoint would
+            # commit. The transaction is begun explicitly so savepoints nest inside it.
+            driver_connection.isolation_level = None
+            transaction = connection.begin()
+            connection.exec_driver_sql("BEGIN")
+            db.session.remove()
+            app_session = db.session
+            db.session = db._make_scoped_session({"class_": ConnectionSession, "bind": connection, "join_transaction_mode": "create_savepoint"})
+
+            yield app.test_client()
+
+            db.session.remove()
+            db.session = app_session
+            transaction.rollback()
+            driver_connection.isolation_level = ""
+            connection.close()
+
+        # Anything cached from the rolled back data is dropped
+        for channel in {channel for channel, _ in cache.model_channels.values()}:
+            cache.publish(channel)
 
 
 @pytest.fixture
@@ -66,6 +143,26 @@ def runner(client):
     yield app.test_cli_runner()
 
 
+@pytest.fixture
+def statements(client):
+    """
+    Records every SQL statement executed while the test runs.
+    
+    Yields:
+        list: The SQL of each executed statement, in order
+    """
+    executed = []
+    with app.app_context():
+        engine = db.engine
+    # The savepoints standing in for the test's commits are left out
+    def listener(conn, cursor, statement, *args):
+        if not statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")):
+            executed.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    yield executed
+    event.remove(engine, "before_cursor_execute", listener)
+
+
 @pytest.fixture
 def authenticated_admin_client(client):
     """
@@ -0,0 +1,128 @@
+"""
+ASGI mode tests.
+Tests the async API route variants return what their sync routes return and that the ASGI adapter serves the app with lifespan support.
+"""
+
+import asyncio
+import uuid
+import pytest
+from werkzeug.exceptions import BadRequest, NotFound
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.db as database
+from boilerplate.asgi import application
+from boilerplate.utils.async_routes import async_variant
+from boilerplate.modules.user.user_api import get_user_list_json_async, get_user_profile_json_async
+from boilerplate.modules.role.role_api import get_all_roles_async
+from boilerplate.modules.user.user_model import User, get_user_by_uuid
+from boilerplate.modules.role.role_model import Role
+
+
+def run_async(function, *args):
+    """Runs an async view the way Flask runs it under WSGI and returns its JSON"""
+    with app.test_request_context():
+        return app.json.loads(app.json.dumps(app.ensure_sync(function)(*args)))
+
+
+async def asgi_get(path: str):
+    """Sends a GET through the ASGI application and returns the status and body"""
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "scheme": "http", "headers": [], "server": ("localhost", 80), "client": ("127.0.0.1", 1234)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"], b"".join(message.get("body", b"") for message in messages[1:])
+
+
+class TestAsyncVariant:
+    """Test the async_variant decorator"""
+
+    def test_sync_view_kept_under_wsgi(self, monkeypatch):
+        """Test the sync view is registered when serving over WSGI"""
+        monkeypatch.setattr(config, 'SERVER_INTERFACE', 'wsgi')
+
+        def view():
+            return "sync"
+        assert async_variant(get_all_roles_async)(view) is view
+
+    def test_async_view_used_under_asgi(self, monkeypatch):
+        """Test the async variant takes the sync view's name under ASGI so the endpoint is unchanged"""
+        monkeypatch.setattr(config, 'SERVER_INTERFACE', 'asgi')
+
+        async def variant():
+            return "async"
+
+        def view():
+            return "sync"
+        decorated = async_variant(variant)(view)
+        assert decorated is variant
+        assert decorated.__name__ == "view"
+
+
+class TestAsyncRoutes:
+    """Test the async variants match the sync routes"""
+
+    def test_user_list_matches(self, client):
+        """Test the async user list holds the same users as the sync route"""
+        with app.app_context():
+            expected = app.json.loads(app.json.dumps(User.query.all()))
+        assert run_async(get_user_list_json_async) == expected
+
+    def test_user_profile_matches(self, client, admin_user):
+        """Test the async profile is the same as the sync route's"""
+        with app.app_context():
+            expected = app.json.loads(app.json.dumps(get_user_by_uuid(admin_user).dict()))
+        assert run_async(get_user_profile_json_async, admin_user) == expected
+
+    def test_user_profile_errors(self, client):
+        """Test the async profile rejects bad UUIDs and unknown users like the sync route"""
+        with pytest.raises(BadRequest):
+            run_async(get_user_profile_json_async, "not-a-uuid")
+        with pytest.raises(NotFound):
+            run_async(get_user_profile_json_async, str(uuid.uuid4()))
+
+    def test_roles_match(self, client):
+        """Test the async role list holds the same roles as the sync route"""
+        with app.app_context():
+            expected = app.json.loads(app.json.dumps(Role.query.all()))
+        assert run_async(get_all_roles_async) == expected
+
+    def test_async_driver_derived(self, client, monkeypatch):
+        """Test the async connection string swaps in the async driver unless one is configured"""
+        with app.app_context():
+            assert database.async_connection_string().drivername == "sqlite+aiosqlite"
+            monkeypatch.setattr(config, 'DB_ASYNC_CONNECTION_STRING', 'postgresql+asyncpg://db/app')
+            assert database.async_connection_string() == 'postgresql+asyncpg://db/app'
+
+
+class TestASGIApplication:
+    """Test the ASGI adapter"""
+
+    def test_lifespan_and_request(self, client):
+        """Test startup pools the server loop, requests are served and shutdown disposes the engine"""
+        async def serve():
+            events = asyncio.Queue()
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+            lifespan = asyncio.create_task(application({"type": "lifespan"}, events.get, send))
+            await events.put({"type": "lifespan.startup"})
+            while not sent:
+                await asyncio.sleep(0)
+            assert asyncio.get_running_loop() in database.pooled_loops
+            response = await asgi_get("/healthz")
+            await events.put({"type": "lifespan.shutdown"})
+            await lifespan
+            return sent, response
+
+        sent, (status, body) = asyncio.run(serve())
+        assert [message["type"] for message in sent] == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        assert status == 200
+        assert body == b"ok"
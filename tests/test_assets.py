@@ -0,0 +1,84 @@
+"""
+Static asset pipeline tests.
+Tests minification, fingerprinting, precompression and the static_url template helper.
+"""
+
+import pytest
+import gzip
+import json
+import os
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.assets as assets
+
+
+@pytest.fixture
+def static_folder(tmp_path, monkeypatch):
+    """Points the asset pipeline at a throwaway static folder"""
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js").mkdir()
+    (tmp_path / "css" / "site.css").write_text("/* comment */\nbody {\n    color: red;\n    background: url('data:image/svg+xml,a  b');\n}\n")
+    (tmp_path / "js" / "site.js").write_text("// comment\nfunction hello() {\n    /* block */\n    return `a  // b`;\n}\n")
+    dist = tmp_path / config.ASSETS_DIST_FOLDER
+    monkeypatch.setattr(assets, "STATIC_FOLDER", str(tmp_path))
+    monkeypatch.setattr(assets, "DIST_FOLDER", str(dist))
+    monkeypatch.setattr(assets, "MANIFEST_PATH", str(dist / "manifest.json"))
+    yield tmp_path
+    assets.manifest = {}
+
+
+class TestMinifiers:
+    """Test the conservative CSS and JS minifiers"""
+
+    def test_css_comments_and_whitespace_removed(self):
+        """Test CSS is compacted without touching strings"""
+        output = assets.minify_css("/* c */ a  >  b {\n  color: red ;\n  content: 'x  y';\n}")
+        assert output == "a>b{color:red;content:'x  y'}"
+
+    def test_js_comments_removed_and_strings_kept(self):
+        """Test JS comments are dropped while strings and newlines are kept"""
+        output = assets.minify_js("// line\nconst a = '// not a comment';\n\n    const b = 1; /* block */\n")
+        assert output == "const a = '// not a comment';\nconst b = 1;\n"
+
+
+class TestBuildAssets:
+    """Test the fingerprinted build output"""
+
+    def test_build_writes_hashed_files_and_manifest(self, static_folder):
+        """Test each asset gets a hashed copy, a gzip sibling and a manifest entry"""
+        built = assets.build_assets()
+        assert set(built) == {"css/site.css", "js/site.js"}
+        for hashed in built.values():
+            path = static_folder / hashed
+            assert path.exists()
+            assert gzip.decompress((static_folder / (hashed + ".gz")).read_bytes()) == path.read_bytes()
+            if assets.brotli:
+                assert (static_folder / (hashed + ".br")).exists()
+        manifest = json.loads((static_folder / config.ASSETS_DIST_FOLDER / "manifest.json").read_text())
+        assert manifest == built
+
+    def test_hash_changes_with_content(self, static_folder):
+        """Test editing an asset produces a new fingerprint"""
+        first = assets.build_assets()["css/site.css"]
+        (static_folder / "css" / "site.css").write_text("body { color: blue; }")
+        second = assets.build_assets()["css/site.css"]
+        assert first != second
+        assert not (static_folder / first).exists()
+
+
+class TestStaticUrl:
+    """Test the static_url template helper"""
+
+    def test_falls_back_to_original_file(self, monkeypatch):
+        """Test unknown assets resolve to the plain static path"""
+        monkeypatch.setattr(config, "ASSETS_USE_MANIFEST", True)
+        with app.test_request_context():
+            assert assets.static_url("css/unknown.css") == "/static/css/unknown.css"
+
+    def test_resolves_hashed_name_from_manifest(self, static_folder, monkeypatch):
+        """Test built assets resolve to their fingerprinted path"""
+        monkeypatch.setattr(config, "ASSETS_USE_MANIFEST", True)
+        built = assets.build_assets()
+        assets.load_manifest()
+        with app.test_request_context():
+            assert assets.static_url("css/site.css") == f"/static/{built['css/site.css']}"
@@ -0,0 +1,275 @@
+"""
+Shared cache and invalidation bus tests.
+Tests the memory, SQLite and Redis protocol backends and the publishing of model changes.
+"""
+
+import pytest
+import re
+import socket
+import socketserver
+import threading
+import time
+from boilerplate.app import app
+from boilerplate.db import db
+import boilerplate.utils.cache as cache
+from boilerplate.modules.role.role_model import get_role_by_name
+from boilerplate.modules.user.user_model import get_user_by_email
+
+
+class RedisStandIn(socketserver.StreamRequestHandler):
+    """Just enough of the Redis protocol to exercise RedisCache"""
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            header = self.rfile.readline()
+            if not header:
+                return
+            args = []
+            for _ in range(int(header[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command = args[0].upper()
+            if command in self.server.drop:
+                # Applies the command and hangs up before replying, like a server restarting mid command
+                self.server.drop.discard(command)
+                self.server.applied.append(command)
+                if command == b"INCR":
+                    store[args[1]] = str(int(store.get(args[1], b"0")) + 1).encode()
+                return
+            self.server.applied.append(command)
+            if command == b"GET":
+                value = store.get(args[1])
+                self.wfile.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+            elif command == b"SET":
+                store[args[1]] = args[2]
+                self.wfile.write(b"+OK\r\n")
+            elif command == b"DEL":
+                self.wfile.write(b":%d\r\n" % (1 if store.pop(args[1], None) is not None else 0))
+            elif command == b"INCR":
+                store[args[1]] = str(int(store.get(args[1], b"0")) + 1).encode()
+                self.wfile.write(b":%s\r\n" % store[args[1]])
+            elif command == b"SCAN":
+                # Two keys a page from the keys there when the scan started, so clearing takes more than one
+                cursor, prefix = int(args[1]), re.sub(rb"\\(.)", rb"\1", args[3][:-1])
+                if cursor == 0:
+                    self.server.scanned = sorted(key for key in store if key.startswith(prefix))
+                keys = self.server.scanned
+                page, following = keys[cursor:cursor + 2], cursor + 2 if cursor + 2 < len(keys) else 0
+                self.wfile.write(b"*2\r\n$%d\r\n%d\r\n*%d\r\n" % (len(str(following)), following, len(page))
+                                 + b"".join(b"$%d\r\n%s\r\n" % (len(key), key) for key in page))
+            elif command == b"UNLINK":
+                self.wfile.write(b":%d\r\n" % sum(store.pop(key, None) is not None for key in args[1:]))
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+
+def redis_url(server):
+    """The URL of a stand-in server"""
+    return f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+
+@pytest.fixture
+def redis_stand_in():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RedisStandIn)
+    server.daemon_threads = True
+    server.store = {}
+    server.drop = set()
+    server.applied = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestMemoryCache:
+    """Test the in process backend"""
+
+    def test_get_set_delete(self):
+        """Test values round trip and can be deleted"""
+        memory = cache.MemoryCache()
+        memory.set("key", {"a": 1})
+        assert memory.get("key") == {"a": 1}
+        memory.delete("key")
+        assert memory.get("key", "missing") == "missing"
+
+    def test_ttl_expires_entries(self):
+        """Test entries are not returned after their TTL"""
+        memory = cache.MemoryCache()
+        memory.set("key", "value", ttl=0.01)
+        time.sleep(0.02)
+        assert memory.get("key") is None
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test the LRU entry is dropped when the cache is full"""
+        memory = cache.MemoryCache(max_entries=2)
+        memory.set("a", 1)
+        memory.set("b", 2)
+        memory.get("a")
+        memory.set("c", 3)
+        assert memory.get("a") == 1
+        assert memory.get("b") is None
+        assert memory.get("c") == 3
+
+
+class TestSQLiteCache:
+    """Test the shared file backend"""
+
+    def test_values_are_shared_between_instances(self, tmp_path):
+        """Test two workers pointed at the same file see each other's writes"""
+        path = str(tmp_path / "cache.db")
+        worker_one = cache.SQLiteCache(path=path)
+        worker_two = cache.SQLiteCache(path=path)
+        worker_one.set("key", [1, 2, 3])
+        assert worker_two.get("key") == [1, 2, 3]
+        worker_two.delete("key")
+        assert worker_one.get("key") is None
+
+    def test_counters_are_shared_between_instances(self, tmp_path):
+        """Test generation counters are shared"""
+        path = str(tmp_path / "cache.db")
+        worker_one = cache.SQLiteCache(path=path)
+        worker_two = cache.SQLiteCache(path=path)
+        assert worker_one.incr("generation:roles") == 1
+        assert worker_two.incr("generation:roles") == 2
+        assert worker_one.counter("generation:roles") == 2
+
+    def test_ttl_and_eviction(self, tmp_path):
+        """Test expired and least recently used entries are dropped"""
+        sqlite_cache = cache.SQLiteCache(path=str(tmp_path / "cache.db"), max_entries=2, touch_seconds=0, evict_every=1)
+        sqlite_cache.set("expired", "value", ttl=0.01)
+        time.sleep(0.02)
+        assert sqlite_cache.get("expired") is None
+        sqlite_cache.set("a", 1)
+        time.sleep(0.01)
+        sqlite_cache.set("b", 2)
+        time.sleep(0.01)
+        sqlite_cache.get("a")
+        sqlite_cache.set("c", 3)
+        assert sqlite_cache.get("b") is None
+        assert sqlite_cache.get("a") == 1
+
+    def test_hits_only_touch_stale_entries(self, tmp_path):
+        """Test a hit on an entry used within touch_seconds doesn't write"""
+        sqlite_cache = cache.SQLiteCache(path=str(tmp_path / "cache.db"), touch_seconds=60)
+        sqlite_cache.set("key", "value")
+        statements = []
+        sqlite_cache._connection().set_trace_callback(statements.append)
+        assert sqlite_cache.get("key") == "value"
+        assert not [statement for statement in statements if statement.startswith("UPDATE")]
+        sqlite_cache.touch_seconds = 0
+        sqlite_cache.get("key")
+        assert [statement for statement in statements if statement.startswith("UPDATE")]
+
+    def test_eviction_is_periodic(self, tmp_path):
+        """Test the cache is trimmed to max_entries every evict_every sets rather than on each one"""
+        sqlite_cache = cache.SQLiteCache(path=str(tmp_path / "cache.db"), max_entries=2, evict_every=4)
+        for number in range(3):
+            sqlite_cache.set(f"key{number}", number)
+        assert sqlite_cache.get("key0") == 0
+        sqlite_cache.set("key3", 3)
+        assert sqlite_cache.get("key0") is None
+        assert sqlite_cache.get("key1") is None
+        assert (sqlite_cache.get("key2"), sqlite_cache.get("key3")) == (2, 3)
+
+
+class TestRedisCache:
+    """Test the Redis protocol backend against a local stand-in"""
+
+    def test_get_set_delete(self, redis_stand_in):
+        """Test values round trip through the stand-in"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in))
+        redis_cache.set("key", {"a": 1})
+        assert redis_cache.get("key") == {"a": 1}
+        redis_cache.delete("key")
+        assert redis_cache.get("key") is None
+
+    def test_counters(self, redis_stand_in):
+        """Test generation counters use INCR"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in))
+        assert redis_cache.counter("generation:users") == 0
+        assert redis_cache.incr("generation:users") == 1
+        assert redis_cache.counter("generation:users") == 1
+
+    def test_clear_keeps_counters(self, redis_stand_in):
+        """Test clear removes only cached values under the prefix"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in), prefix="app[1]:")
+        for number in range(5):
+            redis_cache.set(f"key{number}", number)
+        redis_cache.incr("generation:users")
+        redis_stand_in.store[b"other:key"] = b"1"
+        redis_cache.clear()
+        assert [redis_cache.get(f"key{number}") for number in range(5)] == [None] * 5
+        assert redis_cache.counter("generation:users") == 1
+        assert b"other:key" in redis_stand_in.store
+        assert b"FLUSHDB" not in redis_stand_in.applied
+
+    def test_reads_are_retried(self, redis_stand_in):
+        """Test a read cut off by the connection dropping is sent again on a new connection"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in))
+        redis_cache.set("key", "value")
+        redis_stand_in.drop.add(b"GET")
+        assert redis_cache.get("key") == "value"
+
+    def test_increments_are_not_retried(self, redis_stand_in):
+        """Test an INCR cut off by the connection dropping is not sent again, as it may already have been applied"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in))
+        redis_cache.incr("generation:users")
+        redis_stand_in.drop.add(b"INCR")
+        with pytest.raises(ConnectionError):
+            redis_cache.incr("generation:users")
+        assert redis_stand_in.applied.count(b"INCR") == 2
+        assert redis_cache.counter("generation:users") == 2
+
+    def test_closed_connection_is_replaced_before_sending(self, redis_stand_in):
+        """Test an INCR isn't lost to a connection the server already closed"""
+        redis_cache = cache.RedisCache(url=redis_url(redis_stand_in))
+        redis_cache.incr("generation:users")
+        redis_cache.local.socket.shutdown(socket.SHUT_WR)
+        time.sleep(0.05)
+        assert redis_cache.incr("generation:users") == 2
+
+
+class TestInvalidationBus:
+    """Test model writes are published to the invalidation bus"""
+
+    def test_role_commit_publishes_roles(self, client):
+        """Test committing a role change bumps the roles generation"""
+        with app.app_context():
+            before = cache.generation("roles")
+            role = get_role_by_name("Default Role")
+            role.description = "Changed"
+            db.session.commit()
+            assert cache.generation("roles") > before
+
+    def test_rolled_back_change_is_not_published(self, client):
+        """Test a rolled back change does not publish"""
+        with app.app_context():
+            before = cache.generation("roles")
+            role = get_role_by_name("Default Role")
+            role.description = "Changed"
+            db.session.flush()
+            db.session.rollback()
+            assert cache.generation("roles") == before
+
+    def test_ignored_columns_are_not_published(self, client):
+        """Test a login only touches ignored columns and leaves the users generation alone while a name change bumps it"""
+        with app.app_context():
+            before = cache.generation("users")
+            user = get_user_by_email("user@test.com")
+            user.update_last_logon()
+            assert cache.generation("users") == before
+            user.first_name = "Changed"
+            db.session.commit()
+            assert cache.generation("users") > before
+
+    def test_subscribers_are_notified(self, client):
+        """Test local subscribers are told about published channels"""
+        received = []
+        cache.subscribe("test-channel", received.append)
+        try:
+            cache.publish("test-channel")
+            assert received == ["test-channel"]
+        finally:
+            cache.subscribers.pop("test-channel", None)
@@ -0,0 +1,85 @@
+"""
+Response compression tests.
+Tests dynamic responses are compressed with the negotiated encoding, streamed responses stay streamed and HTML templates have their
+whitespace trimmed.
+"""
+
+import gzip
+import zlib
+import pytest
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.compression as compression
+
+
+class TestResponseCompression:
+    """Test the after request compression hook"""
+
+    def test_html_page_is_gzipped(self, authenticated_admin_client):
+        """Test a large page is gzipped to a fraction of its size"""
+        plain = authenticated_admin_client.get('/roles', headers={'Accept-Encoding': 'identity'})
+        response = authenticated_admin_client.get('/roles', headers={'Accept-Encoding': 'gzip'})
+        assert plain.headers.get('Content-Encoding') is None
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == plain.data
+        assert len(response.data) * 4 < len(plain.data)
+
+    @pytest.mark.skipif(compression.brotli is None, reason="brotli is not installed")
+    def test_brotli_preferred(self, authenticated_admin_client):
+        """Test brotli is chosen over gzip when the client accepts both"""
+        response = authenticated_admin_client.get('/api/v1/routes', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert compression.brotli.decompress(response.data).startswith(b'[')
+
+    def test_client_quality_respected(self, authenticated_admin_client):
+        """Test an encoding the client refuses is never used"""
+        response = authenticated_admin_client.get('/api/v1/routes', headers={'Accept-Encoding': 'br;q=0, gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    def test_small_response_not_compressed(self, client):
+        """Test bodies under COMPRESSION_MIN_SIZE are sent as they are"""
+        response = client.get('/api/v1/users/', headers={'Accept-Encoding': 'gzip'})
+        assert len(response.data) < config.COMPRESSION_MIN_SIZE
+        assert response.headers.get('Content-Encoding') is None
+
+    def test_compressed_etag_is_weak_and_still_matches(self, authenticated_admin_client):
+        """Test a compressed response carries a weak ETag that still earns a 304"""
+        response = authenticated_admin_client.get('/api/v1/routes', headers={'Accept-Encoding': 'gzip'})
+        tag = response.headers['ETag']
+        assert tag.startswith('W/"')
+        repeat = authenticated_admin_client.get('/api/v1/routes', headers={'Accept-Encoding': 'gzip', 'If-None-Match': tag})
+        assert repeat.status_code == 304
+        assert repeat.headers['ETag'] == tag
+
+    def test_stream_compressed_chunk_by_chunk(self, client):
+        """Test each streamed chunk can be decoded as soon as it is sent"""
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = app.response_class((f"chunk {number}\n" for number in range(3)), mimetype='text/plain')
+            response = compression.compress_response(response)
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert 'Content-Length' not in response.headers
+            decoder = zlib.decompressobj(31)
+            chunks = iter(response.response)
+            assert decoder.decompress(next(chunks)) == b"chunk 0\n"
+            assert decoder.decompress(b"".join(chunks)) == b"chunk 1\nchunk 2\n"
+
+
+class TestTemplateWhitespace:
+    """Test HTML templates are trimmed when compiled"""
+
+    def test_indentation_collapsed(self, client):
+        """Test indentation and blank lines are removed while <pre> keeps its own"""
+        source = "<div>\n    <p>Text</p>\n\n    <pre>\n  kept\n    </pre>\n</div>\n"
+        trimmed = app.jinja_env.preprocess(source, "page.html")
+        assert trimmed == "<div>\n<p>Text</p>\n<pre>\n  kept\n    </pre>\n</div>\n"
+
+    def test_only_html_templates_trimmed(self, client):
+        """Test other templates (ex. plain text emails) are left alone"""
+        source = "Hello\n    there\n"
+        assert app.jinja_env.preprocess(source, "email.txt") == source
+
+    def test_block_tags_leave_no_blank_lines(self, client):
+        """Test trim_blocks and lstrip_blocks are on"""
+        rendered = app.jinja_env.from_string("<ul>\n    {% for item in items %}\n    <li>{{ item }}</li>\n    {% endfor %}\n</ul>").render(items=[1, 2])
+        assert rendered == "<ul>\n    <li>1</li>\n    <li>2</li>\n</ul>"
@@ -4,6 +4,7 @@ Tests essential functionality: authentication, user management, and roles.
 """
 
 import pytest
+import os
 from boilerplate.app import app
 from boilerplate.db import db
 from boilerplate.modules.user.user_model import User, get_user_by_email
@@ -182,3 +183,53 @@ class TestFlashMessages:
         
         # Should contain alert class (Bootstrap alert)
         assert b'alert' in response.data.lower()
+
+
+class TestPreloadHooks:
+    """Test the helpers used by the gunicorn post_fork hook"""
+    
+    def test_configure_handler_replaces_log_handler(self):
+        """Test reconfiguring logging swaps the handler instead of adding another"""
+        import boilerplate.utils.lumberjack as lumberjack
+        old_handler = lumberjack.log_handler
+        lumberjack.configure_handler()
+        assert lumberjack.log_handler is not old_handler
+        assert lumberjack.logger.handlers.count(lumberjack.log_handler) == 1
+        assert old_handler not in lumberjack.logger.handlers
+    
+    def test_dispose_engines_releases_connections(self, client):
+        """Test disposing engines leaves no pooled connections checked in"""
+        from boilerplate.db import dispose_engines
+        with app.app_context():
+            get_user_by_email('admin@test.com')
+            db.session.remove()
+            dispose_engines()
+            assert db.engine.pool.checkedin() == 0
+            assert get_user_by_email('admin@test.com') is not None
+
+
+class TestGunicornSizing:
+    """Test the worker sizing in gunicorn.conf.py"""
+    
+    @pytest.fixture
+    def gunicorn_conf(self):
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    
+    def test_workers_follow_cores(self, gunicorn_conf):
+        """Test plenty of memory gives 2 x cores + 1 workers"""
+        assert gunicorn_conf._size_workers(4, 64 * 1024) == 9
+    
+    def test_workers_capped_by_memory(self, gunicorn_conf, monkeypatch):
+        """Test workers are capped to what fits in memory and never drop below one"""
+        monkeypatch.setattr(gunicorn_conf._settings, "GUNICORN_WORKER_MEMORY_MB", 128)
+        assert gunicorn_conf._size_workers(8, 512) == 3
+        assert gunicorn_conf._size_workers(8, 64) == 1
+    
+    def test_available_resources_detected(self, gunicorn_conf):
+        """Test at least one core and some memory are always reported"""
+        assert gunicorn_conf._available_cores() >= 1
+        assert gunicorn_conf._available_memory_mb() > 0
@@ -0,0 +1,106 @@
+"""
+Memory diagnostics tests.
+Tests the worker memory report, tracemalloc snapshots and diffs, and the RSS ceiling worker recycle.
+"""
+
+import pytest
+import importlib.util
+import os
+import tracemalloc
+import boilerplate.config as config
+import boilerplate.utils.diagnostics as diagnostics
+
+
+@pytest.fixture
+def snapshot_folder(tmp_path, monkeypatch):
+    """Stores snapshots in a throwaway folder and stops tracemalloc afterwards"""
+    monkeypatch.setattr(config, "DIAGNOSTICS_FOLDER", str(tmp_path))
+    yield tmp_path
+    diagnostics.set_tracemalloc(False)
+
+
+class TestMemoryReport:
+    """Test the worker memory report"""
+
+    def test_report_includes_serving_worker(self, authenticated_admin_client):
+        """Test the report lists this process with its RSS, USS and sample history"""
+        report = authenticated_admin_client.get('/api/v1/diagnostics/memory').get_json()
+        assert report["process"]["pid"] == os.getpid()
+        worker = next(worker for worker in report["workers"] if worker["pid"] == os.getpid())
+        assert worker["rss_mb"] > 0 and worker["uss_mb"] > 0
+        assert worker["history"]
+
+    def test_non_system_user_forbidden(self, authenticated_user_client):
+        """Test only system users can read diagnostics"""
+        assert authenticated_user_client.get('/api/v1/diagnostics/memory').status_code == 403
+        assert authenticated_user_client.post('/api/v1/diagnostics/tracemalloc', json={"enabled": True}).status_code == 403
+
+
+class TestTracemalloc:
+    """Test tracemalloc control and snapshots"""
+
+    def test_snapshot_requires_tracing(self, authenticated_admin_client, snapshot_folder):
+        """Test taking a snapshot without tracing is a bad request"""
+        assert authenticated_admin_client.post('/api/v1/diagnostics/snapshots').status_code == 400
+
+    def test_snapshot_and_diff(self, authenticated_admin_client, snapshot_folder):
+        """Test snapshots can be taken, listed and diffed to find growth"""
+        response = authenticated_admin_client.post('/api/v1/diagnostics/tracemalloc', json={"enabled": True, "frames": 5})
+        assert response.get_json()["tracing"] is True
+        first = authenticated_admin_client.post('/api/v1/diagnostics/snapshots').get_json()["name"]
+        leak = [bytearray(1024) for _ in range(2000)]
+        second = authenticated_admin_client.post('/api/v1/diagnostics/snapshots?group_by=traceback').get_json()["name"]
+        assert {snapshot["name"] for snapshot in authenticated_admin_client.get('/api/v1/diagnostics/snapshots').get_json()} == {first, second}
+
+        diff = authenticated_admin_client.get(f'/api/v1/diagnostics/snapshots/{second}/diff/{first}').get_json()
+        assert diff["from"] == first
+        assert any("test_diagnostics.py" in statistic["location"][0] and statistic["size_diff_kb"] >= 2000 for statistic in diff["top"])
+        del leak
+
+    def test_stop_tracing(self, authenticated_admin_client, snapshot_folder):
+        """Test tracemalloc can be switched off again"""
+        authenticated_admin_client.post('/api/v1/diagnostics/tracemalloc', json={"enabled": True})
+        authenticated_admin_client.post('/api/v1/diagnostics/tracemalloc', json={"enabled": False})
+        assert not tracemalloc.is_tracing()
+
+    def test_unknown_snapshot(self, authenticated_admin_client, snapshot_folder):
+        """Test unknown or malformed snapshot names are not found"""
+        assert authenticated_admin_client.get('/api/v1/diagnostics/snapshots/missing.snapshot').status_code == 404
+
+
+class TestRssCeiling:
+    """Test the gunicorn post_request hook that recycles bloated workers"""
+
+    class FakeWorker:
+        def __init__(self):
+            self.alive = True
+            self.pid = os.getpid()
+            self.log = self
+            self.warnings = []
+
+        def warning(self, message):
+            self.warnings.append(message)
+
+    @pytest.fixture
+    def gunicorn_conf(self):
+        spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def test_worker_over_ceiling_is_retired(self, gunicorn_conf, monkeypatch):
+        """Test a worker over the RSS ceiling stops accepting new requests"""
+        worker = self.FakeWorker()
+        monkeypatch.setattr(gunicorn_conf._settings, "GUNICORN_MAX_WORKER_RSS_MB", 1)
+        gunicorn_conf.post_request(worker, None, {}, None)
+        assert worker.alive is False
+        assert worker.warnings
+
+    def test_disabled_or_under_ceiling_keeps_worker(self, gunicorn_conf, monkeypatch):
+        """Test nothing happens when the ceiling is off or not reached"""
+        worker = self.FakeWorker()
+        monkeypatch.setattr(gunicorn_conf._settings, "GUNICORN_MAX_WORKER_RSS_MB", 0)
+        gunicorn_conf.post_request(worker, None, {}, None)
+        monkeypatch.setattr(gunicorn_conf._settings, "GUNICORN_MAX_WORKER_RSS_MB", 1024 * 1024)
+        gunicorn_conf.post_request(worker, None, {}, None)
+        assert worker.alive is True
@@ -3,9 +3,23 @@ Error handling and HTTP status code tests.
 Tests error pages and proper HTTP responses.
 """
 
+import time
 import pytest
 from boilerplate.app import app
 from boilerplate.modules.user.user_model import get_user_by_email
+import boilerplate.config as config
+import boilerplate.errors as errors
+import boilerplate.utils.scheduler as scheduler
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    """Collects error log lines, starting from empty sampling windows"""
+    lines = []
+    monkeypatch.setattr(errors, 'error_samples', {})
+    monkeypatch.setattr(errors.log, 'error', lambda message, **kwargs: lines.append(message))
+    monkeypatch.setattr(errors.log, 'warning', lambda message, **kwargs: lines.append(message))
+    return lines
 
 
 class TestHttpStatusCodes:
@@ -74,3 +88,107 @@ class TestFlashMessages:
         assert response.status_code == 200
         # Should show error message
         assert b'alert' in response.data.lower()
+
+
+class TestErrorNegotiation:
+    """Test errors are returned as JSON or HTML depending on the request"""
+
+    def test_api_errors_are_json(self, client):
+        """Test errors under /api/ are compact JSON"""
+        response = client.get('/api/v1/does-not-exist')
+        assert response.status_code == 404
+        assert response.is_json
+        data = response.get_json()
+        assert data["status"] == 404
+        assert data["error"] == "Not Found"
+        assert data["error_id"]
+
+    def test_accept_json(self, client):
+        """Test clients asking for JSON get JSON from any route"""
+        response = client.get('/errors/403', headers={'Accept': 'application/json'})
+        assert response.status_code == 403
+        assert response.get_json()["message"] == errors.ERROR_MESSAGES[403]
+
+    def test_browsers_get_html(self, client):
+        """Test a browser's Accept header still gets the error page"""
+        response = client.get('/errors/400', headers={'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'})
+        assert response.status_code == 400
+        assert response.mimetype == 'text/html'
+        assert b'400 Error' in response.data
+        assert errors.PAGE_ERROR_ID.encode() not in response.data
+
+
+class TestErrorPipeline:
+    """Test error pages are served pre-rendered with the error's own details"""
+
+    def test_pages_not_rendered_per_error(self, client, monkeypatch):
+        """Test errors never go through Jinja once the pages are rendered"""
+        def fail(*args, **kwargs):
+            raise AssertionError("render_template called for an error")
+        monkeypatch.setattr(errors, 'render_template', fail)
+        response = client.get('/this-does-not-exist')
+        assert response.status_code == 404
+        assert errors.ERROR_MESSAGES[404].encode() in response.data
+
+    def test_description_is_escaped(self, client):
+        """Test a view's own description is shown escaped"""
+        with app.test_request_context('/'):
+            page = errors.error_html(403, "<script>alert(1)</script>", "error-id")
+        assert "&lt;script&gt;" in page
+        assert "<script>alert(1)</script>" not in page
+        assert "error-id" in page
+
+    def test_error_headers_kept(self, client):
+        """Test headers the error carries are returned, such as Allow on a 405"""
+        response = client.post('/errors/400')
+        assert response.status_code == 405
+        assert 'GET' in response.headers['Allow']
+
+    def test_no_print(self, client, capsys):
+        """Test a 403 no longer prints its description"""
+        client.get('/errors/403')
+        assert "Description:" not in capsys.readouterr().out
+
+
+class TestErrorSampling:
+    """Test floods of the same error are summarized rather than logged line by line"""
+
+    def test_flood_is_sampled(self, client, logged, monkeypatch):
+        """Test only LOGGING_ERROR_SAMPLE_LIMIT errors per route are logged, however many different paths are requested"""
+        monkeypatch.setattr(config, 'LOGGING_ERROR_SAMPLE_LIMIT', 3)
+        for number in range(20):
+            client.get(f'/scanner/{number}.php')
+        assert len(logged) == 3
+
+    def test_summary_after_window(self, client, logged, monkeypatch):
+        """Test the errors that weren't logged are counted in one line once the window closes"""
+        monkeypatch.setattr(config, 'LOGGING_ERROR_SAMPLE_LIMIT', 2)
+        assert [errors.sample_error(404, "<unmatched>", 100.0 + number) for number in range(5)] == [True, True, False, False, False]
+        assert errors.sample_error(404, "<unmatched>", 100.0 + config.LOGGING_ERROR_SAMPLE_WINDOW)
+        assert logged == [f"HTTP 404 <unmatched>: 3 more of 5 errors not logged in {config.LOGGING_ERROR_SAMPLE_WINDOW:.0f}s"]
+
+    def test_summary_without_another_error(self, client, logged, monkeypatch):
+        """Test the last burst before errors stop is summarized once its window closes"""
+        monkeypatch.setattr(config, 'LOGGING_ERROR_SAMPLE_LIMIT', 1)
+        for number in range(3):
+            errors.sample_error(404, "<unmatched>", 100.0 + number)
+        assert errors.flush_error_samples(100.0 + config.LOGGING_ERROR_SAMPLE_WINDOW - 1) == 0
+        assert errors.flush_error_samples(100.0 + config.LOGGING_ERROR_SAMPLE_WINDOW) == 1
+        assert logged == [f"HTTP 404 <unmatched>: 2 more of 3 errors not logged in {config.LOGGING_ERROR_SAMPLE_WINDOW:.0f}s"]
+        assert errors.error_samples == {}
+
+    def test_flushed_on_every_tick(self, client, logged, monkeypatch):
+        """Test every worker's scheduler tick flushes its own closed windows"""
+        monkeypatch.setattr(config, 'LOGGING_ERROR_SAMPLE_LIMIT', 1)
+        for number in range(2):
+            errors.sample_error(404, "<unmatched>", time.monotonic() - config.LOGGING_ERROR_SAMPLE_WINDOW - 1)
+        scheduler.run_worker_tasks()
+        assert len(logged) == 1
+
+    def test_keys_are_independent(self, client, logged, monkeypatch):
+        """Test each status and route is sampled on its own"""
+        monkeypatch.setattr(config, 'LOGGING_ERROR_SAMPLE_LIMIT', 1)
+        assert errors.sample_error(404, "<unmatched>", 100.0)
+        assert not errors.sample_error(404, "<unmatched>", 101.0)
+        assert errors.sample_error(403, "/roles", 101.0)
+        assert errors.sample_error(404, "/api/v1/users/<profile_uuid>", 101.0)
@@ -0,0 +1,95 @@
+"""
+ETag tests.
+Tests the JSON API answers conditional GETs with 304 before doing the work and that tags change with the data behind them.
+"""
+
+import pytest
+from boilerplate.app import app
+from boilerplate.db import db
+from boilerplate.modules.role.role_model import Role
+from boilerplate.modules.role.role_actions import actions, register_action
+import boilerplate.modules.role.role_actions as role_actions
+import boilerplate.utils.single_flight as single_flight
+
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    """Starts every test without results remembered by single flight"""
+    single_flight.results.clear()
+    yield
+    single_flight.results.clear()
+
+
+class TestConditionalRequests:
+    """Test If-None-Match handling"""
+
+    @pytest.mark.parametrize('path', ['/api/v1/roles', '/api/v1/actions', '/api/v1/routes'])
+    def test_matching_tag_returns_304(self, authenticated_admin_client, path):
+        """Test a repeat request with the tag it was given gets an empty 304"""
+        response = authenticated_admin_client.get(path)
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        tag = response.headers['ETag']
+        assert tag.startswith('"')
+
+        repeat = authenticated_admin_client.get(path, headers={'If-None-Match': tag})
+        assert repeat.status_code == 304
+        assert repeat.data == b''
+        assert repeat.headers['ETag'] == tag
+
+    def test_user_profile_returns_304(self, authenticated_admin_client, admin_user, default_user):
+        """Test a user's profile is tagged per user"""
+        response = authenticated_admin_client.get(f'/api/v1/users/{default_user}')
+        assert response.headers['ETag'] != authenticated_admin_client.get(f'/api/v1/users/{admin_user}').headers['ETag']
+        assert authenticated_admin_client.get(f'/api/v1/users/{default_user}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    def test_stale_tag_returns_body(self, authenticated_admin_client):
+        """Test a tag that no longer matches gets the full response"""
+        response = authenticated_admin_client.get('/api/v1/roles', headers={'If-None-Match': '"stale"'})
+        assert response.status_code == 200
+        assert response.get_json()
+
+    def test_304_skips_the_query(self, authenticated_admin_client, statements):
+        """Test a matching request runs fewer statements than a full one, the role list query being skipped"""
+        tag = authenticated_admin_client.get('/api/v1/roles').headers['ETag']
+        single_flight.results.clear()
+        statements.clear()
+        authenticated_admin_client.get('/api/v1/roles')
+        full = len(statements)
+        statements.clear()
+        assert authenticated_admin_client.get('/api/v1/roles', headers={'If-None-Match': tag}).status_code == 304
+        assert len(statements) < full
+
+    def test_unauthorized_viewer_never_gets_304(self, authenticated_admin_client):
+        """Test permissions are checked before the tag is"""
+        tag = authenticated_admin_client.get('/api/v1/roles').headers['ETag']
+        authenticated_admin_client.get('/logout')
+        authenticated_admin_client.post('/login', data={'email': 'user@test.com', 'password': 'TestPassword123!'})
+        assert authenticated_admin_client.get('/api/v1/roles', headers={'If-None-Match': tag}).status_code == 403
+
+
+class TestTagVersions:
+    """Test tags change when the data behind them does"""
+
+    def test_role_change_changes_tag(self, authenticated_admin_client):
+        """Test committing a role change invalidates the role list tag"""
+        tag = authenticated_admin_client.get('/api/v1/roles').headers['ETag']
+        with app.app_context():
+            role = Role.query.filter_by(name="System Admin").first()
+            role.description = "Changed for the ETag test"
+            db.session.commit()
+        response = authenticated_admin_client.get('/api/v1/roles', headers={'If-None-Match': tag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != tag
+
+    def test_registered_action_changes_tag(self, authenticated_admin_client):
+        """Test registering an action invalidates the action list tag"""
+        tag = authenticated_admin_client.get('/api/v1/actions').headers['ETag']
+        register_action("test_etag_action", "ETag Tests", "Registered by the ETag tests")
+        try:
+            response = authenticated_admin_client.get('/api/v1/actions', headers={'If-None-Match': tag})
+            assert response.status_code == 200
+            assert response.headers['ETag'] != tag
+        finally:
+            actions[:] = [action for action in actions if action['action'] != "test_etag_action"]
+            role_actions.registry_version = None
@@ -0,0 +1,59 @@
+"""
+Request fast path tests.
+Tests static, health and anonymous-only requests issue no SQL and never write the session.
+"""
+
+import pytest
+from flask_login import current_user
+from boilerplate.app import app
+from boilerplate.modules.user.user_model import AnonymousUser
+
+
+class TestAnonymousPrincipal:
+    """Test the in memory anonymous user and role"""
+
+    def test_anonymous_role_needs_no_query(self, statements):
+        """Test the anonymous role is available without touching the database"""
+        role = AnonymousUser().role
+        assert role.name == "Anonymous"
+        assert role.system is False
+        assert role.actions == ()
+        assert statements == []
+
+
+class TestRequestClasses:
+    """Test each request class costs zero SQL statements"""
+
+    def test_static_request(self, client, statements):
+        """Test static files are served without SQL or a session cookie"""
+        response = client.get('/static/css/main.css')
+        assert response.status_code == 200
+        assert statements == []
+        assert "Set-Cookie" not in response.headers
+
+    def test_health_request(self, client, statements):
+        """Test liveness probes issue no SQL"""
+        client.get('/healthz')
+        assert statements == []
+
+    def test_anonymous_route(self, client, statements):
+        """Test the login page renders without SQL or a session cookie"""
+        response = client.get('/login')
+        assert response.status_code == 200
+        assert statements == []
+        assert "Set-Cookie" not in response.headers
+
+    def test_anonymous_route_with_logged_in_session(self, authenticated_admin_client, statements):
+        """Test a logged in session cookie does not make anonymous routes load the user"""
+        with authenticated_admin_client:
+            authenticated_admin_client.get('/login')
+            assert current_user.is_anonymous
+        authenticated_admin_client.get('/static/css/main.css')
+        assert statements == []
+
+    def test_full_request_still_loads_user(self, authenticated_admin_client, statements):
+        """Test ordinary views still load the logged in user and refresh the session"""
+        response = authenticated_admin_client.get('/roles')
+        assert response.status_code == 200
+        assert statements
+        assert "Set-Cookie" in response.headers
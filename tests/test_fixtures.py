@@ -0,0 +1,68 @@
+"""
+Test fixture tests.
+Tests each test starts from the seeded database whether it commits inside the rolled back transaction or for real, and that the suite never
+uses the configured database or full cost password hashes.
+"""
+
+import os
+import pytest
+from boilerplate.app import app
+from boilerplate.db import db
+import boilerplate.config as config
+from boilerplate.modules.role.role_model import get_role_by_name
+from boilerplate.modules.user.user_model import User, get_user_by_email
+from tests.conftest import test_folder
+
+
+def add_user(email: str):
+    """Commits a new user"""
+    db.session.add(User(email, "Left", "Behind", "TestPassword123!", get_role_by_name("Default Role")))
+    db.session.commit()
+
+
+class TestIsolation:
+    """Test writes never outlive the test that made them. Each pair writes in its first test and checks in its second."""
+
+    def test_commit_is_rolled_back(self, client):
+        """Test a committed user is visible within the test"""
+        with app.app_context():
+            add_user("rolled.back@test.com")
+            assert get_user_by_email("rolled.back@test.com") is not None
+
+    def test_commit_was_rolled_back(self, client):
+        """Test the user committed by the previous test is gone"""
+        with app.app_context():
+            assert get_user_by_email("rolled.back@test.com") is None
+            assert User.query.count() == 3
+
+    @pytest.mark.commits
+    def test_real_commit_is_restored(self, client):
+        """Test a user committed for real is visible from a new connection"""
+        with app.app_context():
+            add_user("restored@test.com")
+            with db.engine.connect() as connection:
+                assert connection.exec_driver_sql("SELECT 1 FROM user WHERE email = 'restored@test.com'").first()
+
+    def test_real_commit_was_restored(self, client):
+        """Test the database was restored from the template after the previous test"""
+        with app.app_context():
+            assert get_user_by_email("restored@test.com") is None
+            assert User.query.count() == 3
+
+
+class TestTestConfiguration:
+    """Test the suite runs apart from any configured database"""
+
+    def test_database_is_per_process(self, client):
+        """Test the app's database lives in this process's test folder"""
+        with app.app_context():
+            assert os.path.dirname(db.engine.url.database) == test_folder
+        assert config.CACHE_SQLITE_PATH.startswith(test_folder)
+        assert config.RATE_LIMIT_SQLITE_PATH.startswith(test_folder)
+
+    def test_cheap_password_hashes(self, client):
+        """Test seeded users are hashed at the lowest bcrypt cost and can still log in"""
+        with app.app_context():
+            assert get_user_by_email("user@test.com").password.startswith(b"$2b$04$")
+        response = client.post('/login', data={'email': 'user@test.com', 'password': 'TestPassword123!'})
+        assert response.status_code == 302
@@ -0,0 +1,169 @@
+"""
+Fragment response tests.
+Tests mutations posted by the page's scripts get back only the fragments that changed, and that plain form posts still flash and redirect.
+"""
+
+import pytest
+from boilerplate.app import app
+from boilerplate.modules.user.user_model import get_user_by_email
+from boilerplate.db import db
+from boilerplate.modules.role.role_model import Role, get_role_by_name
+from boilerplate.modules.role.role_actions import get_action_names
+
+FRAGMENT = {'X-Fragment': 'true', 'Accept': 'application/json'}
+
+
+def new_user_form(role_uuid: str, email: str = 'new@test.com'):
+    """Form data for creating a user"""
+    return {'email': email, 'first-name': 'New', 'last-name': 'User', 'password': 'TestPassword123!', 'password-confirm': 'TestPassword123!',
+            'role-id': role_uuid}
+
+
+@pytest.fixture
+def default_role(client):
+    """UUID of the default role"""
+    return str(get_role_by_name("Default Role").uuid)
+
+
+@pytest.fixture
+def user_uuid(client):
+    """UUID of the default user"""
+    return str(get_user_by_email('user@test.com').uuid)
+
+
+class TestUserFragments:
+    """Test user mutations return rows and profile cards"""
+
+    def test_create_returns_row(self, authenticated_admin_client, default_role):
+        """Test a created user comes back as one list row rather than the whole list"""
+        response = authenticated_admin_client.post('/users/create', data=new_user_form(default_role), headers=FRAGMENT)
+        assert response.status_code == 200
+        data = response.get_json()
+        user = get_user_by_email('new@test.com')
+        assert f'id="user-{user.uuid}"' in data['html']
+        assert 'data-append-to="active-users-table"' in data['html']
+        assert '<html' not in data['html']
+        assert 'User created successfully!' in data['alert']
+
+    def test_create_duplicate(self, authenticated_admin_client, default_role):
+        """Test a duplicate email is refused with an alert and no fragment"""
+        response = authenticated_admin_client.post('/users/create', data=new_user_form(default_role, 'user@test.com'), headers=FRAGMENT)
+        assert response.status_code == 409
+        data = response.get_json()
+        assert data['html'] == ''
+        assert data['category'] == 'error'
+        assert 'already exists' in data['alert']
+
+    def test_password_rules_listed(self, authenticated_admin_client, default_role):
+        """Test the broken password rules are shown as a list"""
+        form = new_user_form(default_role)
+        form['password'] = 'short'
+        response = authenticated_admin_client.post('/users/create', data=form, headers=FRAGMENT)
+        assert response.status_code == 400
+        assert '<li>' in response.get_json()['alert']
+
+    def test_toggle_returns_profile_cards(self, authenticated_admin_client, user_uuid):
+        """Test deactivating a user returns the updated profile cards"""
+        response = authenticated_admin_client.post(f'/users/{user_uuid}/toggle-active', headers=FRAGMENT)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'id="user-profile"' in data['html']
+        assert 'Account Deactivated' in data['html']
+        assert 'User deactivated successfully!' in data['alert']
+        assert get_user_by_email('user@test.com').active is False
+
+    def test_update_returns_profile_cards(self, authenticated_admin_client, user_uuid, default_role):
+        """Test updating a user returns profile cards with the new details"""
+        response = authenticated_admin_client.post(f'/users/{user_uuid}', headers=FRAGMENT, data={
+            'first-name': 'Renamed', 'last-name': 'User', 'email': 'user@test.com', 'role-id': default_role})
+        assert response.status_code == 200
+        assert 'Renamed' in response.get_json()['html']
+
+    def test_html_fragment(self, authenticated_admin_client, user_uuid):
+        """Test clients asking for HTML get the alert and fragments alone"""
+        response = authenticated_admin_client.post(f'/users/{user_uuid}/toggle-active', headers={'X-Fragment': 'true'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/html'
+        assert b'id="user-profile"' in response.data
+        assert b'<html' not in response.data
+
+    def test_plain_post_redirects(self, authenticated_admin_client, user_uuid):
+        """Test a plain form post still flashes and redirects"""
+        response = authenticated_admin_client.post(f'/users/{user_uuid}/toggle-active')
+        assert response.status_code == 302
+        assert response.location.endswith(f'/users/{user_uuid}')
+
+    def test_list_rows_have_ids(self, authenticated_admin_client, user_uuid):
+        """Test the list page renders the same rows the fragments replace"""
+        response = authenticated_admin_client.get('/users')
+        assert f'id="user-{user_uuid}"'.encode() in response.data
+
+
+class TestRoleFragments:
+    """Test role mutations return role cards"""
+
+    def test_create_returns_card_and_option(self, authenticated_admin_client):
+        """Test a created role comes back as its card and replacement option"""
+        response = authenticated_admin_client.post('/roles', headers=FRAGMENT, data={
+            'role-id': 'new', 'role-name': 'Auditor', 'role-description': 'Reads things', 'action-flag-read_users_list': 'true'})
+        assert response.status_code == 200
+        role = get_role_by_name('Auditor')
+        html = response.get_json()['html']
+        assert f'id="role-{role.uuid}"' in html
+        assert f'id="replacement-option-{role.uuid}"' in html
+
+    def test_edit_returns_card(self, authenticated_admin_client, default_role):
+        """Test an edited role comes back as its card"""
+        form = {f'action-flag-{action}': 'false' for action in get_action_names()}
+        form.update({'role-id': default_role, 'role-name': 'Default Role', 'role-description': 'Edited description'})
+        response = authenticated_admin_client.post('/roles', headers=FRAGMENT, data=form)
+        assert response.status_code == 200
+        html = response.get_json()['html']
+        assert f'id="role-{default_role}"' in html
+        assert 'Edited description' in html
+
+    def test_edit_returns_renamed_option(self, authenticated_admin_client, default_role):
+        """Test an edited role's replacement option comes back with its new name"""
+        form = {f'action-flag-{action}': 'false' for action in get_action_names()}
+        form.update({'role-id': default_role, 'role-name': 'Renamed Role', 'role-description': 'Renamed'})
+        data = authenticated_admin_client.post('/roles', headers=FRAGMENT, data=form).get_json()
+        assert f'id="replacement-option-{default_role}"' in data['html']
+        assert 'Renamed Role</option>' in data['html']
+        assert data['removed'] == []
+
+    def test_edit_removes_ineligible_option(self, authenticated_user_client):
+        """Test editing a role the user can't move users to removes its replacement option"""
+        with app.app_context():
+            default = get_role_by_name('Default Role')
+            default.actions = default.actions + ['create_or_edit_role']
+            retired = Role('Retired', 'No longer used', [], active=False)
+            db.session.add(retired)
+            db.session.commit()
+            retired_uuid = str(retired.uuid)
+        form = {f'action-flag-{action}': 'false' for action in get_action_names()}
+        form.update({'role-id': retired_uuid, 'role-name': 'Retired', 'role-description': 'Still not used'})
+        response = authenticated_user_client.post('/roles', headers=FRAGMENT, data=form)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['removed'] == [f'replacement-option-{retired_uuid}']
+        assert f'id="replacement-option-{retired_uuid}"' not in data['html']
+
+    def test_alert_escapes_input(self, authenticated_admin_client):
+        """Test text from the form is escaped in the alert"""
+        response = authenticated_admin_client.post('/roles', headers=FRAGMENT, data={
+            'role-id': 'new', 'role-name': '<b>bold</b>', 'role-description': 'Markup in the name'})
+        alert = response.get_json()['alert']
+        assert '&lt;B&gt;Bold&lt;/B&gt;' in alert
+        assert '<B>' not in alert
+
+    def test_delete_removes_card(self, authenticated_admin_client, default_role):
+        """Test deleting a role removes its card and sends the replacement role's card with its new users"""
+        authenticated_admin_client.post('/roles', headers=FRAGMENT, data={'role-id': 'new', 'role-name': 'Spare', 'role-description': 'Spare role'})
+        spare = str(get_role_by_name('Spare').uuid)
+        response = authenticated_admin_client.post('/roles/delete', headers=FRAGMENT, data={
+            'delete-role-id': default_role, 'replacement-role-id': spare, 'delete-role-count': '2'})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['removed'] == [f'role-{default_role}', f'replacement-option-{default_role}']
+        assert f'id="role-{spare}"' in data['html']
+        assert 'user@test.com' in data['html']
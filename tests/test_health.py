@@ -0,0 +1,65 @@
+"""
+Health check tests.
+Tests the liveness and readiness probes bypass the app's request machinery.
+"""
+
+import pytest
+import time
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.health as health
+
+
+class TestLiveness:
+    """Test the /healthz liveness probe"""
+
+    def test_healthz_ok_without_cookie(self, client):
+        """Test liveness answers without a session cookie"""
+        response = client.get('/healthz')
+        assert response.status_code == 200
+        assert response.data == b"ok"
+        assert "Set-Cookie" not in response.headers
+        assert response.headers["Cache-Control"] == "no-store"
+
+    def test_healthz_skips_request_hooks(self, client, monkeypatch):
+        """Test probes never reach Flask's before_request hooks"""
+        called = []
+        monkeypatch.setitem(app.before_request_funcs, None, [lambda: called.append(True)])
+        client.get('/healthz')
+        client.get('/readyz')
+        assert called == []
+
+    def test_other_methods_rejected(self, client):
+        """Test probes only answer GET and HEAD"""
+        assert client.post('/healthz').status_code == 405
+        assert client.head('/healthz').status_code == 200
+
+
+class TestReadiness:
+    """Test the /readyz readiness probe"""
+
+    def test_readyz_checks_database(self, client):
+        """Test readiness runs a query and reports the pool"""
+        response = client.get('/readyz')
+        assert response.status_code == 200
+        assert response.get_json()["database"] == "ok"
+        assert "pool" in response.get_json()
+        assert "Set-Cookie" not in response.headers
+
+    def test_readyz_database_error(self, client, monkeypatch):
+        """Test a failing database makes the worker unavailable"""
+        def broken():
+            raise RuntimeError("database is gone")
+        monkeypatch.setattr(health, "check_database", broken)
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()["database"] == "error"
+
+    def test_readyz_timeout(self, client, monkeypatch):
+        """Test a hung database check times out"""
+        monkeypatch.setattr(config, "HEALTH_READY_TIMEOUT", 0.05)
+        monkeypatch.setattr(health, "check_database", lambda: time.sleep(0.2))
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()["database"] == "timeout"
+        time.sleep(0.2)
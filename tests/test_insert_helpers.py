@@ -0,0 +1,172 @@
+"""
+Insert helper tests.
+Tests insert_if_not_exists creates rows in one statement, skips rows that already exist and reports which ones it created.
+"""
+
+import threading
+import pytest
+from sqlalchemy.exc import OperationalError
+import boilerplate.db as database
+from boilerplate.app import app
+from boilerplate.db import db, insert_if_not_exists
+from boilerplate.utils.fragments import FRAGMENT_HEADER
+from boilerplate.modules.role.role_model import Role, get_role_by_name, seed_roles_if_required
+from boilerplate.modules.user.user_model import User, create_if_not_exists, get_user_by_email
+
+
+def inserts(statements, table: str):
+    """Returns the executed INSERT statements for a table"""
+    return [statement for statement in statements if statement.startswith(f"INSERT INTO {table} ")]
+
+
+@pytest.fixture(params=["upsert", "savepoint"])
+def dialect(request, monkeypatch):
+    """Runs a test with ON CONFLICT DO NOTHING and with the per row savepoints other databases use"""
+    if request.param == "savepoint":
+        monkeypatch.setattr(database, "UPSERT_INSERTS", {})
+    return request.param
+
+
+class TestInsertIfNotExists:
+    """Test conflicting rows are skipped and created rows returned"""
+
+    def test_reports_created_rows(self, client, dialect):
+        """Test only the rows that did not exist come back"""
+        with app.app_context():
+            created = insert_if_not_exists(Role, [Role("Default Role", "Taken", []), Role("Auditor", "Reads things", [])])
+            assert [role.name for role in created] == ["Auditor"]
+            assert get_role_by_name("Default Role").description == "A Default Role for Testing."
+            assert get_role_by_name("Auditor").id == created[0].id
+
+    def test_dictionaries(self, client, dialect):
+        """Test rows can be given as column values, with defaults filling the rest"""
+        with app.app_context():
+            created = insert_if_not_exists(Role, [{"name": "Auditor", "description": "Reads things", "actions": []}])
+            assert created[0].uuid is not None
+            assert created[0].active is True
+
+    def test_nothing_to_insert(self, client, statements):
+        """Test an empty list runs no statement"""
+        with app.app_context():
+            assert insert_if_not_exists(Role, []) == []
+        assert statements == []
+
+    def test_relationships_become_foreign_keys(self, client, dialect):
+        """Test a user given a role is stored with that role"""
+        with app.app_context():
+            role = get_role_by_name("Default Role")
+            user = create_if_not_exists(User("new@test.com", "New", "User", "TestPassword123!", role))
+            assert user.role_uuid == role.uuid
+            assert get_user_by_email("new@test.com").role is role
+
+    def test_duplicate_user(self, client, dialect):
+        """Test creating a user with a taken email returns None and changes nothing"""
+        with app.app_context():
+            role = get_role_by_name("System Admin")
+            assert create_if_not_exists(User("user@test.com", "Other", "Person", "TestPassword123!", role)) is None
+            assert get_user_by_email("user@test.com").first_name == "Default"
+
+
+class TestStatements:
+    """Test creates cost one statement"""
+
+    def test_bulk_insert_is_one_statement(self, client, statements):
+        """Test several rows are inserted by a single statement without a lookup first"""
+        with app.app_context():
+            roles = [Role(f"Role {number}", "Generated", []) for number in range(5)]
+            del statements[:]
+            assert len(insert_if_not_exists(Role, roles)) == 5
+        assert len(inserts(statements, "role")) == 1
+        assert not [statement for statement in statements if statement.startswith("SELECT")]
+
+    def test_created_rows_not_loaded_again(self, client, statements):
+        """Test the returned rows can be read after the commit without another query"""
+        with app.app_context():
+            role = Role("Auditor", "Reads things", [])
+            del statements[:]
+            created = insert_if_not_exists(Role, [role])[0]
+            count = len(statements)
+            assert (created.uuid, created.name, created.creation_time) is not None
+            assert len(statements) == count
+
+    def test_create_user_route(self, authenticated_admin_client, statements):
+        """Test creating a user through the page inserts without looking the email up first"""
+        role_uuid = str(get_role_by_name("Default Role").uuid)
+        del statements[:]
+        response = authenticated_admin_client.post('/users/create', data={
+            'email': 'new@test.com', 'first-name': 'New', 'last-name': 'User', 'password': 'TestPassword123!', 'role-id': role_uuid})
+        assert response.status_code == 302
+        assert len(inserts(statements, "user")) == 1
+        assert not [statement for statement in statements if "WHERE user.email" in statement]
+
+
+class TestCreateUserErrors:
+    """Test the create user page explains why a user wasn't created"""
+
+    def post_user(self, client, email: str):
+        """Posts the create user form for an email"""
+        with app.app_context():
+            role_uuid = str(get_role_by_name("Default Role").uuid)
+        return client.post('/users/create', data={
+            'email': email, 'first-name': 'New', 'last-name': 'User', 'password': 'TestPassword123!', 'role-id': role_uuid},
+            headers={FRAGMENT_HEADER: 'true', 'Accept': 'application/json'})
+
+    def test_database_error(self, authenticated_admin_client, monkeypatch):
+        """Test a database failure is reported as one rather than as a 500 page"""
+        def fail(model, rows):
+            raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+        monkeypatch.setattr("boilerplate.modules.user.user_model.insert_if_not_exists", fail)
+        response = self.post_user(authenticated_admin_client, "new@test.com")
+        assert response.status_code == 500
+        assert "database error" in response.get_json()["alert"]
+
+    def test_skipped_without_taken_email(self, authenticated_admin_client, monkeypatch):
+        """Test a skipped insert only says the email exists when a user has it"""
+        def skip(model, rows):
+            # Detached from their role the way the real insert leaves them, then skipped as if another unique column clashed
+            for row in rows:
+                database.carried_values(row)
+            return []
+        monkeypatch.setattr("boilerplate.modules.user.user_model.insert_if_not_exists", skip)
+        response = self.post_user(authenticated_admin_client, "new@test.com")
+        assert response.status_code == 409
+        assert "already exists" not in response.get_json()["alert"]
+
+    def test_taken_email(self, authenticated_admin_client):
+        """Test a taken email is reported as taken"""
+        response = self.post_user(authenticated_admin_client, "user@test.com")
+        assert response.status_code == 409
+        assert "already exists" in response.get_json()["alert"]
+
+
+class TestConcurrentSeeding:
+    """Test workers seeding at the same time"""
+
+    @pytest.mark.commits
+    def test_workers_seed_at_once(self, client, monkeypatch):
+        """Test five workers seeding the same roles neither fail nor create duplicates"""
+        monkeypatch.setattr("boilerplate.config.DB_SEED", True)
+        with app.app_context():
+            Role.query.delete()
+            db.session.commit()
+        errors = []
+        barrier = threading.Barrier(5)
+
+        def worker():
+            with app.app_context():
+                barrier.wait()
+                try:
+                    seed_roles_if_required()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        with app.app_context():
+            assert sorted(role.name for role in Role.query.all()) == ["Default Role", "System", "System Admin"]
@@ -0,0 +1,59 @@
+"""
+JSON provider tests.
+Tests ModelJSONProvider writes the same JSON as Flask's default provider on every backend without copying models through asdict.
+"""
+
+import dataclasses
+import datetime
+import uuid
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from boilerplate.app import app
+from boilerplate.modules.user.user_model import User
+from boilerplate.modules.role.role_model import Role
+from boilerplate.utils.json_provider import ModelJSONProvider, orjson
+
+BACKENDS = ["stdlib"] + (["orjson"] if orjson is not None else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def provider(request):
+    """A provider for each available backend"""
+    provider = ModelJSONProvider(app)
+    provider.backend = request.param
+    return provider
+
+
+class TestSerialization:
+    """Test output matches Flask's default provider"""
+
+    def test_models_match_default_provider(self, client, provider):
+        """Test users and roles serialize exactly as before"""
+        with app.app_context():
+            data = {"users": User.query.all(), "roles": Role.query.all()}
+            expected = DefaultJSONProvider(app).response(data).get_data()
+            assert provider.response(data).get_data() == expected
+
+    def test_special_types(self, client, provider):
+        """Test UUIDs and datetimes are written like the default provider writes them"""
+        value = {"id": uuid.UUID("12345678-1234-5678-1234-567812345678"), "time": datetime.datetime(2024, 1, 2, 3, 4, 5), "day": datetime.date(2024, 1, 2)}
+        assert provider.loads(provider.dumps(value)) == DefaultJSONProvider(app).loads(DefaultJSONProvider(app).dumps(value))
+
+    def test_large_integers(self, client, provider):
+        """Test integers orjson can't encode still serialize"""
+        assert provider.dumps([2 ** 70]) == "[1180591620717411303424]"
+
+    def test_unserializable_raises_type_error(self, client, provider):
+        """Test unknown types fail the way the standard library fails"""
+        with pytest.raises(TypeError):
+            provider.dumps({"value": object()})
+
+    def test_models_not_deep_copied(self, authenticated_admin_client, admin_user, monkeypatch):
+        """Test API responses never go through dataclasses.asdict"""
+        def fail(*args, **kwargs):
+            raise AssertionError("dataclasses.asdict called")
+        monkeypatch.setattr(dataclasses, "asdict", fail)
+        assert authenticated_admin_client.get('/api/v1/users/').status_code == 200
+        response = authenticated_admin_client.get(f'/api/v1/users/{admin_user}')
+        assert response.status_code == 200
+        assert response.get_json()["uuid"] == admin_user
@@ -0,0 +1,129 @@
+"""
+Load shedding tests.
+Tests the CoDel style overload detection and that an overloaded worker sheds low priority routes while still admitting login and pages.
+"""
+
+import time
+import pytest
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.load_shedding as load_shedding
+from boilerplate.utils.load_shedding import QueueMonitor
+import boilerplate.utils.urls as urls
+
+
+def started(seconds_ago: float):
+    """An X-Request-Start header for a request NGINX accepted the given number of seconds ago"""
+    return {'X-Request-Start': f"t={time.time() - seconds_ago:.3f}"}
+
+
+@pytest.fixture
+def overloaded(monkeypatch):
+    """Replaces the worker's monitor with one that is already overloaded"""
+    monitor = QueueMonitor(0.1, 1.0)
+    monitor.overloaded = True
+    monkeypatch.setattr(load_shedding, 'monitor', monitor)
+    return monitor
+
+
+class TestQueueMonitor:
+    """Test overload is only declared for a standing queue"""
+
+    def test_short_burst_is_not_overload(self):
+        """Test delays over the target for less than an interval are tolerated"""
+        monitor = QueueMonitor(0.1, 1.0)
+        assert monitor.observe(0.5, 100.0) is False
+        assert monitor.observe(0.5, 100.9) is False
+
+    def test_standing_queue_is_overload(self):
+        """Test delays over the target for a full interval mark the worker overloaded"""
+        monitor = QueueMonitor(0.1, 1.0)
+        monitor.observe(0.5, 100.0)
+        assert monitor.observe(0.5, 101.0) is True
+
+    def test_recovers_once_under_target(self):
+        """Test one request under the target ends the overload and restarts the interval"""
+        monitor = QueueMonitor(0.1, 1.0)
+        monitor.observe(0.5, 100.0)
+        monitor.observe(0.5, 101.0)
+        assert monitor.observe(0.05, 101.5) is False
+        assert monitor.observe(0.5, 101.6) is False
+        assert monitor.observe(0.5, 102.0) is False
+
+
+class TestRoutePriorities:
+    """Test priorities are read into the route manifest"""
+
+    def test_declared_priorities(self, client):
+        """Test login is critical, bulk API routes are low and other routes are normal"""
+        assert urls.endpoint_access['post_login_user']['priority'] == 'critical'
+        assert urls.endpoint_access['get_all_routes']['priority'] == 'low'
+        assert urls.endpoint_access['get_user_list_json']['priority'] == 'low'
+        assert urls.endpoint_access['get_user_list']['priority'] == 'normal'
+
+
+class TestShedding:
+    """Test the before request hook"""
+
+    def test_low_priority_shed_when_overloaded(self, authenticated_admin_client, overloaded):
+        """Test a low priority route gets a 503 with Retry-After"""
+        response = authenticated_admin_client.get('/api/v1/routes', headers=started(0.5))
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(config.LOAD_SHED_RETRY_AFTER)
+
+    def test_critical_and_normal_admitted_when_overloaded(self, authenticated_admin_client, overloaded):
+        """Test login and pages are still served while low priority routes are shed"""
+        assert authenticated_admin_client.get('/users', headers=started(0.5)).status_code == 200
+        assert authenticated_admin_client.get('/login', headers=started(0.5)).status_code != 503
+
+    def test_normal_shed_after_max_delay(self, authenticated_admin_client, overloaded):
+        """Test a page that already waited past LOAD_SHED_MAX_DELAY_MS is shed but login never is"""
+        delay = config.LOAD_SHED_MAX_DELAY_MS / 1000 + 1
+        assert authenticated_admin_client.get('/users', headers=started(delay)).status_code == 503
+        assert authenticated_admin_client.get('/login', headers=started(delay)).status_code != 503
+
+    def test_nothing_shed_without_header(self, authenticated_admin_client, overloaded):
+        """Test requests that didn't come through NGINX are never shed"""
+        assert authenticated_admin_client.get('/api/v1/routes').status_code == 200
+
+    def test_nothing_shed_when_disabled(self, authenticated_admin_client, overloaded, monkeypatch):
+        """Test LOAD_SHED_ENABLED turns shedding off"""
+        monkeypatch.setattr(config, 'LOAD_SHED_ENABLED', False)
+        assert authenticated_admin_client.get('/api/v1/routes', headers=started(0.5)).status_code == 200
+
+    def test_untrusted_header_ignored(self, authenticated_admin_client, overloaded):
+        """Test a client reaching gunicorn directly can't get requests shed by claiming they waited"""
+        response = authenticated_admin_client.get('/api/v1/routes', headers=started(0.5), environ_base={'REMOTE_ADDR': '198.51.100.7'})
+        assert response.status_code == 200
+
+
+class TestQueueingDelay:
+    """Test the delay read from X-Request-Start"""
+
+    def delay(self, header: str, now: float = 1000.0):
+        """The queueing delay of a request from NGINX carrying X-Request-Start: header"""
+        with app.test_request_context('/', headers={'X-Request-Start': header}):
+            return load_shedding.queueing_delay(now)
+
+    def test_delay(self):
+        """Test the delay is the time since NGINX stamped the request"""
+        assert self.delay("t=999.750") == pytest.approx(0.25)
+
+    def test_clock_ahead_is_no_wait(self):
+        """Test a start slightly in the future counts as no wait"""
+        assert self.delay("t=1000.5") == 0.0
+
+    def test_implausible_delays_ignored(self):
+        """Test starts further off than NGINX would ever wait, or not a time at all, are ignored"""
+        assert self.delay("t=0") is None
+        assert self.delay("t=5000") is None
+        assert self.delay("t=soon") is None
+
+    def test_implausible_delay_is_not_overload(self, client, monkeypatch):
+        """Test a request claiming to have waited since 1970 doesn't mark the worker overloaded"""
+        monitor = QueueMonitor(0.1, 1.0)
+        monkeypatch.setattr(load_shedding, 'monitor', monitor)
+        for _ in range(3):
+            client.get('/login', headers={'X-Request-Start': 't=0'})
+        assert not monitor.overloaded
+        assert monitor.above_target_until == 0.0
@@ -0,0 +1,88 @@
+"""
+Request scoped loader tests.
+Tests repeated lookups within a request hit memory and batched lookups collapse into one query.
+"""
+
+import pytest
+from boilerplate.app import app
+from boilerplate.db import db
+from boilerplate.modules.user.user_model import User, get_user_by_email, get_user_by_uuid, attach_roles
+from boilerplate.modules.role.role_model import Role, get_role_by_name, get_role_by_uuid, get_roles_by_uuid, create_if_not_exists
+
+
+@pytest.fixture
+def uuids(client):
+    """UUIDs of the admin user and the two seeded test roles"""
+    with app.app_context():
+        return {
+            "admin": get_user_by_email('admin@test.com').uuid,
+            "admin_role": get_role_by_name("System Admin").uuid,
+            "default_role": get_role_by_name("Default Role").uuid,
+        }
+
+
+class TestLoaderCache:
+    """Test lookups are memoized for the length of a request"""
+
+    def test_repeat_lookups_hit_memory(self, uuids, statements):
+        """Test a user and its role cost one query each however often they are looked up"""
+        with app.test_request_context():
+            user = get_user_by_uuid(str(uuids["admin"]))
+            count = len(statements)
+            assert get_user_by_uuid(uuids["admin"]) is user
+            assert get_role_by_uuid(uuids["admin_role"]) is user.role
+            assert user.role.system
+            assert len(statements) == count
+
+    def test_batched_lookup_is_one_query(self, uuids, statements):
+        """Test load_many fetches every unseen key in a single IN query"""
+        with app.test_request_context():
+            roles = get_roles_by_uuid([uuids["admin_role"], str(uuids["default_role"])])
+            assert len(statements) == 1
+            assert set(roles) == {uuids["admin_role"], uuids["default_role"]}
+            assert get_role_by_name("System Admin").uuid == uuids["admin_role"]
+            get_role_by_uuid(uuids["default_role"])
+            assert len(statements) == 2
+
+    def test_attach_roles_collapses_lazy_loads(self, client, statements):
+        """Test the roles of many users load in one query"""
+        with app.test_request_context():
+            users = attach_roles(User.query.all())
+            [user.role.name for user in users]
+            assert len(statements) == 2
+
+    def test_cache_ends_with_request(self, uuids, statements):
+        """Test a new request starts with an empty cache"""
+        with app.test_request_context():
+            get_role_by_name("System Admin")
+        with app.test_request_context():
+            get_role_by_name("System Admin")
+        assert len(statements) == 2
+
+
+class TestLoaderInvalidation:
+    """Test writes never leave a loader with stale answers"""
+
+    def test_remembered_miss_cleared_by_write(self, client):
+        """Test a role created after a failed lookup is found in the same request"""
+        with app.test_request_context():
+            assert get_role_by_name("Auditor") is None
+            create_if_not_exists(Role("Auditor", "Reads things", []))
+            assert get_role_by_name("Auditor") is not None
+
+    def test_deleted_row_forgotten(self, client):
+        """Test a deleted user is no longer returned in the same request"""
+        with app.test_request_context():
+            user = get_user_by_email('inactive@test.com')
+            user_uuid = user.uuid
+            assert get_user_by_uuid(user_uuid) is user
+            db.session.delete(user)
+            db.session.commit()
+            assert get_user_by_uuid(user_uuid) is None
+
+    def test_no_caching_outside_requests(self, uuids, statements):
+        """Test lookups outside a request always go to the database"""
+        with app.app_context():
+            get_role_by_name("System Admin")
+            get_role_by_name("System Admin")
+        assert len(statements) == 2
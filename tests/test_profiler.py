@@ -0,0 +1,100 @@
+"""
+Request profiler tests.
+Tests arming endpoints, capturing cProfile and sampled profiles, the profile ring and the system only routes.
+"""
+
+import pytest
+import pstats
+import boilerplate.config as config
+import boilerplate.utils.profiler as profiler
+
+
+@pytest.fixture
+def profile_folder(tmp_path, monkeypatch):
+    """Stores captured profiles in a throwaway folder and disarms everything afterwards"""
+    monkeypatch.setattr(config, "PROFILER_FOLDER", str(tmp_path))
+    yield tmp_path
+    profiler.save_arms({})
+
+
+class TestArming:
+    """Test arming endpoints for profiling"""
+
+    def test_counted_arm_profiles_next_requests(self, authenticated_admin_client, profile_folder):
+        """Test a count arm profiles exactly N requests and then disarms itself"""
+        response = authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list", "requests": 2})
+        assert response.status_code == 201
+        for _ in range(3):
+            authenticated_admin_client.get('/roles')
+        profiles = authenticated_admin_client.get('/api/v1/profiles').get_json()
+        assert len(profiles) == 2
+        assert all(profile["endpoint"] == "get_roles_list" and profile["kind"] == "cprofile" for profile in profiles)
+        assert "get_roles_list" not in profiler.arms
+
+    def test_header_arm_needs_token(self, authenticated_admin_client, profile_folder):
+        """Test a header arm only profiles requests carrying its token"""
+        arm = authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list", "header": True}).get_json()
+        authenticated_admin_client.get('/roles')
+        authenticated_admin_client.get('/roles', headers={config.PROFILER_HEADER: "wrong"})
+        assert profiler.list_profiles() == []
+        authenticated_admin_client.get('/roles', headers={config.PROFILER_HEADER: arm["token"]})
+        authenticated_admin_client.get('/roles', headers={config.PROFILER_HEADER: arm["token"]})
+        assert len(profiler.list_profiles()) == 2
+
+    def test_unknown_endpoint_rejected(self, authenticated_admin_client, profile_folder):
+        """Test arming an endpoint that does not exist is a bad request"""
+        response = authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "nope"})
+        assert response.status_code == 400
+
+    def test_disarm(self, authenticated_admin_client, profile_folder):
+        """Test an arm can be removed"""
+        authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list", "requests": 5})
+        assert authenticated_admin_client.delete('/api/v1/profiles/arms/get_roles_list').status_code == 200
+        authenticated_admin_client.get('/roles')
+        assert profiler.list_profiles() == []
+
+    def test_non_system_user_forbidden(self, authenticated_user_client, profile_folder):
+        """Test only system users may arm or list profiles"""
+        assert authenticated_user_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list"}).status_code == 403
+        assert authenticated_user_client.get('/api/v1/profiles').status_code == 403
+
+
+class TestCapture:
+    """Test captured profile output"""
+
+    def test_cprofile_download_is_valid_pstats(self, authenticated_admin_client, profile_folder):
+        """Test a downloaded cProfile capture loads with pstats"""
+        authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list"})
+        authenticated_admin_client.get('/roles')
+        name = profiler.list_profiles()[0]["name"]
+        response = authenticated_admin_client.get(f'/api/v1/profiles/{name}')
+        assert response.status_code == 200
+        path = profile_folder / "download.pstats"
+        path.write_bytes(response.data)
+        assert pstats.Stats(str(path)).total_calls > 0
+
+    def test_sampler_writes_collapsed_stacks(self, authenticated_admin_client, profile_folder, monkeypatch):
+        """Test the statistical sampler writes collapsed stacks"""
+        monkeypatch.setattr(config, "PROFILER_SAMPLE_INTERVAL_MS", 0.1)
+        authenticated_admin_client.post('/api/v1/profiles/arms', json={"endpoint": "get_roles_list", "kind": "sample"})
+        authenticated_admin_client.get('/roles')
+        profile = profiler.list_profiles()[0]
+        assert profile["kind"] == "sample"
+        lines = (profile_folder / profile["name"]).read_text().splitlines()
+        assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    def test_ring_is_bounded(self, profile_folder, monkeypatch):
+        """Test the oldest profiles are dropped once the ring is full"""
+        monkeypatch.setattr(config, "PROFILER_MAX_PROFILES", 2)
+        for index in range(4):
+            (profile_folder / f"20260101-00000{index}-000-1-5ms-index.pstats").write_text("")
+        profiler.store_profile("index", "sample", 5, lambda path: open(path, "w").close())
+        names = [profile["name"] for profile in profiler.list_profiles()]
+        assert len(names) == 2
+        assert "20260101-000003-000-1-5ms-index.pstats" in names
+
+    def test_route_listing_includes_profiler_routes(self, authenticated_admin_client):
+        """Test the profiler's routes do not break the route listing"""
+        response = authenticated_admin_client.get('/api/v1/routes')
+        assert response.status_code == 200
+        assert any(route["url"].startswith("/api/v1/profiles/arms/") for route in response.get_json())
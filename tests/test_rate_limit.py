@@ -0,0 +1,176 @@
+"""
+Rate limiter tests.
+Tests the token buckets admit bursts up to the limit and refill steadily, that workers share them through SQLite and that throttled logins
+and password resets are turned away before any password is checked.
+"""
+
+import pytest
+from boilerplate.app import app
+import boilerplate.config as config
+import boilerplate.utils.rate_limit as rate_limit
+import boilerplate.modules.user.user_model as user_model
+from boilerplate.utils.rate_limit import MemoryRateLimitStore, SQLiteRateLimitStore, InvalidRateLimitError, parse_limit
+import boilerplate.utils.urls as urls
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """A store of each kind"""
+    if request.param == "memory":
+        return MemoryRateLimitStore()
+    return SQLiteRateLimitStore(str(tmp_path / "rate_limit.db"))
+
+
+@pytest.fixture
+def counted_passwords(monkeypatch):
+    """Counts password checks (bcrypt) made during the test"""
+    checks = []
+    original = user_model.check_password
+
+    def check_password(*args):
+        checks.append(args)
+        return original(*args)
+    monkeypatch.setattr(user_model, 'check_password', check_password)
+    return checks
+
+
+def failed_login(client, email='admin@test.com', ip='203.0.113.1'):
+    """Attempts a login with the wrong password"""
+    return client.post('/login', data={'email': email, 'password': 'wrong'}, headers={'X-Real-IP': ip})
+
+
+class TestParseLimit:
+    """Test limits written in config.py"""
+
+    def test_formats(self):
+        """Test requests per period, with and without a period multiplier"""
+        assert parse_limit("5/minute") == (5, 60)
+        assert parse_limit("20/15minutes") == (20, 900)
+        assert parse_limit("100 / hour") == (100, 3600)
+
+    def test_disabled(self):
+        """Test empty and zero limits mean no limit"""
+        assert parse_limit("") is None
+        assert parse_limit("0") is None
+        assert parse_limit("0/minute") is None
+
+    def test_invalid(self):
+        """Test a malformed limit fails loudly"""
+        with pytest.raises(InvalidRateLimitError):
+            parse_limit("5 per minute")
+
+
+class TestBuckets:
+    """Test the generic cell rate algorithm in each store"""
+
+    def test_burst_then_refill(self, store):
+        """Test the limit is admitted at once, the next request waits one emission interval and is admitted after it"""
+        assert [store.acquire("key", 1000.0, 12.0, 60.0) for _ in range(5)] == [0.0] * 5
+        assert store.acquire("key", 1000.0, 12.0, 60.0) == pytest.approx(12.0)
+        assert store.acquire("key", 1011.0, 12.0, 60.0) == pytest.approx(1.0)
+        assert store.acquire("key", 1012.0, 12.0, 60.0) == 0.0
+
+    def test_keys_are_independent(self, store):
+        """Test one key running out does not affect another"""
+        store.acquire("first", 1000.0, 60.0, 60.0)
+        assert store.acquire("first", 1000.0, 60.0, 60.0) > 0
+        assert store.acquire("second", 1000.0, 60.0, 60.0) == 0.0
+
+    def test_prune_forgets_full_buckets(self, store):
+        """Test buckets that have refilled are removed and behave the same afterwards"""
+        store.acquire("key", 1000.0, 60.0, 60.0)
+        store.prune(2000.0)
+        assert store.acquire("key", 2000.0, 60.0, 60.0) == 0.0
+
+    def test_sqlite_shared_between_workers(self, tmp_path):
+        """Test two stores on one file (as two workers would have) draw from the same bucket"""
+        path = str(tmp_path / "shared.db")
+        first, second = SQLiteRateLimitStore(path), SQLiteRateLimitStore(path)
+        assert first.acquire("key", 1000.0, 30.0, 60.0) == 0.0
+        assert second.acquire("key", 1000.0, 30.0, 60.0) == 0.0
+        assert first.acquire("key", 1000.0, 30.0, 60.0) > 0
+
+
+class TestLoginLimits:
+    """Test the limits on login and password reset"""
+
+    def test_account_throttled_before_bcrypt(self, client, counted_passwords):
+        """Test attempts past the per account limit get a 429 without a password check"""
+        requests, _ = parse_limit(config.RATE_LIMIT_LOGIN_ACCOUNT)
+        for number in range(requests):
+            assert failed_login(client, ip=f'203.0.113.{number}').status_code == 302
+        checks = len(counted_passwords)
+        response = failed_login(client, ip='203.0.113.200')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) > 0
+        assert len(counted_passwords) == checks
+
+    def test_account_key_ignores_case(self, client):
+        """Test changing the case of the email does not get a fresh bucket"""
+        requests, _ = parse_limit(config.RATE_LIMIT_LOGIN_ACCOUNT)
+        for _ in range(requests):
+            failed_login(client)
+        assert failed_login(client, email='ADMIN@test.com').status_code == 429
+
+    def test_ip_throttled_across_accounts(self, client):
+        """Test one address trying many accounts is limited and other addresses are not"""
+        requests, _ = parse_limit(config.RATE_LIMIT_LOGIN_IP)
+        for number in range(requests):
+            failed_login(client, email=f'user{number}@test.com')
+        assert failed_login(client, email='another@test.com').status_code == 429
+        assert failed_login(client, email='another@test.com', ip='198.51.100.7').status_code == 302
+
+    def test_password_reset_requests_limited(self, client):
+        """Test password reset emails for one account are limited"""
+        requests, _ = parse_limit(config.RATE_LIMIT_PASSWORD_RESET_ACCOUNT)
+        for _ in range(requests):
+            assert client.post('/send-password-reset', data={'email': 'nobody@test.com'}).status_code != 429
+        assert client.post('/send-password-reset', data={'email': 'nobody@test.com'}).status_code == 429
+
+    def test_disabled(self, client, monkeypatch):
+        """Test RATE_LIMIT_ENABLED turns every limit off"""
+        monkeypatch.setattr(config, 'RATE_LIMIT_ENABLED', False)
+        requests, _ = parse_limit(config.RATE_LIMIT_LOGIN_ACCOUNT)
+        for _ in range(requests + 1):
+            assert failed_login(client).status_code == 302
+
+    def test_limits_in_manifest(self, client):
+        """Test the route manifest lists each route's limits"""
+        assert len(urls.endpoint_access['post_login_user']['rate_limits']) == 2
+        assert urls.endpoint_access['get_login_page']['rate_limits'] == []
+
+
+class TestClientAddress:
+    """Test the client address header is only believed from a trusted proxy"""
+
+    def client_ip(self, peer, header='203.0.113.1'):
+        """The client address of a request from peer carrying X-Real-IP: header"""
+        with app.test_request_context('/', headers={'X-Real-IP': header}, environ_base={'REMOTE_ADDR': peer}):
+            return rate_limit.client_ip()
+
+    def test_header_from_trusted_proxy(self):
+        """Test loopback, listed networks and the unix socket (no peer address) may set the client address"""
+        assert self.client_ip('127.0.0.1') == '203.0.113.1'
+        assert self.client_ip('') == '203.0.113.1'
+
+    def test_header_from_anyone_else_ignored(self):
+        """Test a client reaching gunicorn directly can't pick its own bucket"""
+        assert self.client_ip('198.51.100.7') == '198.51.100.7'
+
+    def test_configured_networks(self, monkeypatch):
+        """Test TRUSTED_PROXIES takes networks and host names and is read again when changed"""
+        monkeypatch.setattr(config, 'TRUSTED_PROXIES', '172.16.0.0/12, localhost')
+        assert self.client_ip('172.18.0.5') == '203.0.113.1'
+        assert self.client_ip('127.0.0.1') == '203.0.113.1'
+        assert self.client_ip('::ffff:172.18.0.5') == '203.0.113.1'
+        assert self.client_ip('10.0.0.1') == '10.0.0.1'
+
+    def test_spoofed_header_still_limited(self, client):
+        """Test changing X-Real-IP on every login from an untrusted address doesn't get around the address limit"""
+        requests, _ = parse_limit(config.RATE_LIMIT_LOGIN_IP)
+        for number in range(requests):
+            client.post('/login', data={'email': f'user{number}@test.com', 'password': 'wrong'},
+                        headers={'X-Real-IP': f'203.0.113.{number}'}, environ_base={'REMOTE_ADDR': '198.51.100.7'})
+        response = client.post('/login', data={'email': 'another@test.com', 'password': 'wrong'},
+                               headers={'X-Real-IP': '203.0.113.250'}, environ_base={'REMOTE_ADDR': '198.51.100.7'})
+        assert response.status_code == 429
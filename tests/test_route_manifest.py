@@ -0,0 +1,59 @@
+"""
+Route manifest tests.
+Tests the manifest records what each route requires of the viewer and that /api/v1/routes is served from it.
+"""
+
+import importlib.util
+from boilerplate.app import app
+import boilerplate.utils.urls as urls
+
+
+def find_route(url: str, method: str = 'GET'):
+    """Returns the manifest entry for a URL and method"""
+    return next(route for route in urls.routes if route['url'] == url and method in route['method'])
+
+
+class TestManifestContents:
+    """Test requirements are read from decorator metadata"""
+
+    def test_system_role_route(self, client):
+        """Test a login_required and require_system_role view is recorded as both"""
+        route = find_route('/api/v1/roles')
+        assert route['auth_required'] is True
+        assert route['system_role_required'] is True
+        assert route['required_actions'] == []
+
+    def test_action_route(self, client):
+        """Test a require_action view records its action"""
+        route = find_route('/roles', 'POST')
+        assert route['auth_required'] is True
+        assert route['required_actions'] == ['create_or_edit_role']
+
+    def test_anonymous_route(self, client):
+        """Test an @anonymous_route view needs no login"""
+        route = find_route('/login')
+        assert route['anonymous'] is True
+        assert route['auth_required'] is False
+
+    def test_rule_arguments_shown_in_brackets(self, client):
+        """Test URL arguments are written as [name] without their converter"""
+        route = find_route('/api/v1/users/[profile_uuid]')
+        assert route['endpoint'] == 'get_user_profile_json'
+
+    def test_every_rule_listed(self, client):
+        """Test the manifest has one entry per URL rule, sorted by module"""
+        assert len(urls.routes) == len(list(app.url_map.iter_rules()))
+        assert [route['module'] for route in urls.routes] == sorted(route['module'] for route in urls.routes)
+
+
+class TestManifestEndpoint:
+    """Test /api/v1/routes"""
+
+    def test_served_without_introspection(self, authenticated_admin_client, monkeypatch):
+        """Test the endpoint returns the prebuilt manifest without looking up modules again"""
+        def fail(*args, **kwargs):
+            raise AssertionError("find_spec called while serving /api/v1/routes")
+        monkeypatch.setattr(importlib.util, 'find_spec', fail)
+        response = authenticated_admin_client.get('/api/v1/routes')
+        assert response.status_code == 200
+        assert response.get_json() == urls.routes
@@ -0,0 +1,257 @@
+"""
+Scheduler tests.
+Tests schedules work out the right next run, that only one worker leads at a time, that each due job runs exactly once and that the
+built in jobs do their cleanup.
+"""
+
+import os
+import time
+import click
+import pytest
+from datetime import datetime, timedelta
+from boilerplate.db import db
+import boilerplate.config as config
+import boilerplate.utils.scheduler as scheduler
+import boilerplate.utils.housekeeping as housekeeping
+from boilerplate.utils.scheduler import CronSchedule, IntervalSchedule, ScheduledJob, DuplicateJobError, InvalidScheduleError
+from boilerplate.modules.user.user_model import User, clear_expired_reset_codes
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """An empty job registry for the test, leaving the app's own jobs untouched"""
+    registry = {}
+    monkeypatch.setattr(scheduler, 'jobs', registry)
+    monkeypatch.setattr(scheduler, 'worker_id', 'worker-a')
+    return registry
+
+
+def timestamp(*args):
+    """Local time to a UNIX timestamp, as cron schedules run in the server's time zone"""
+    return datetime(*args).timestamp()
+
+
+def job_record(name: str):
+    """The job's row as committed by the scheduler"""
+    db.session.expire_all()
+    return db.session.get(ScheduledJob, name)
+
+
+class TestSchedules:
+    """Test interval and cron schedules"""
+
+    def test_interval(self):
+        """Test an interval job runs straight away and then every interval"""
+        schedule = IntervalSchedule(900)
+        assert schedule.first_run(1000.0) == 1000.0
+        assert schedule.next_run(1000.0) == 1900.0
+
+    def test_cron_hourly(self):
+        """Test "0 * * * *" runs at the top of the next hour"""
+        schedule = CronSchedule("0 * * * *")
+        assert schedule.next_run(timestamp(2024, 1, 2, 3, 4, 5)) == timestamp(2024, 1, 2, 4, 0)
+        assert schedule.next_run(timestamp(2024, 1, 2, 4, 0)) == timestamp(2024, 1, 2, 5, 0)
+
+    def test_cron_steps_ranges_and_lists(self):
+        """Test steps, ranges and lists in one expression"""
+        schedule = CronSchedule("*/15 2-4 * * *")
+        assert schedule.next_run(timestamp(2024, 1, 2, 4, 50)) == timestamp(2024, 1, 3, 2, 0)
+        assert schedule.next_run(timestamp(2024, 1, 2, 2, 16)) == timestamp(2024, 1, 2, 2, 30)
+
+    def test_cron_weekdays(self):
+        """Test weekdays, with Sunday as 0 or 7, and cron's day OR weekday rule"""
+        # 2024-01-02 is a Tuesday
+        assert CronSchedule("30 9 * * 7").next_run(timestamp(2024, 1, 2)) == timestamp(2024, 1, 7, 9, 30)
+        assert CronSchedule("0 0 15 * 0").next_run(timestamp(2024, 1, 2)) == timestamp(2024, 1, 7, 0, 0)
+
+    def test_cron_month_end(self):
+        """Test a day that some months lack is found in the next month that has it"""
+        assert CronSchedule("0 0 31 * *").next_run(timestamp(2024, 2, 1)) == timestamp(2024, 3, 31)
+
+    def test_invalid_schedules(self):
+        """Test malformed schedules fail when registered"""
+        for expression in ["* * * *", "60 * * * *", "a * * * *", "5-1 * * * *"]:
+            with pytest.raises(InvalidScheduleError):
+                CronSchedule(expression)
+        with pytest.raises(InvalidScheduleError):
+            IntervalSchedule(0)
+
+
+class TestRegistration:
+    """Test registering jobs"""
+
+    def test_decorator_registers(self, jobs):
+        """Test @scheduled registers the function under its name"""
+        @scheduler.scheduled(every=60)
+        def example():
+            pass
+        assert jobs['example']['function'] is example
+
+    def test_duplicate(self, jobs):
+        """Test two jobs can't share a name"""
+        scheduler.register_job("example", lambda: None, every=60)
+        with pytest.raises(DuplicateJobError):
+            scheduler.register_job("example", lambda: None, every=60)
+
+    def test_needs_one_schedule(self, jobs):
+        """Test a job needs an interval or a cron expression but not both"""
+        with pytest.raises(InvalidScheduleError):
+            scheduler.register_job("neither", lambda: None)
+        with pytest.raises(InvalidScheduleError):
+            scheduler.register_job("both", lambda: None, every=60, cron="* * * * *")
+
+    def test_app_jobs_registered(self):
+        """Test the built in jobs are registered when the app loads"""
+        assert {"clear_expired_reset_codes", "housekeeping"} <= set(scheduler.jobs)
+
+
+class TestLeadership:
+    """Test only one worker leads at a time"""
+
+    def test_single_leader(self, client, jobs, monkeypatch):
+        """Test a second worker can't lead until the first one's lease runs out"""
+        assert scheduler.claim_leadership(1000.0)
+        monkeypatch.setattr(scheduler, 'worker_id', 'worker-b')
+        assert not scheduler.claim_leadership(1001.0)
+        assert scheduler.claim_leadership(1001.0 + config.SCHEDULER_LEASE_SECONDS)
+        monkeypatch.setattr(scheduler, 'worker_id', 'worker-a')
+        assert not scheduler.claim_leadership(1002.0 + config.SCHEDULER_LEASE_SECONDS)
+
+    def test_leader_renews(self, client, jobs):
+        """Test the leader keeps its lease by renewing it"""
+        assert scheduler.claim_leadership(1000.0)
+        assert scheduler.claim_leadership(1000.0 + config.SCHEDULER_LEASE_SECONDS - 1)
+        assert scheduler.claim_leadership(1000.0 + config.SCHEDULER_LEASE_SECONDS * 2 - 2)
+
+    def test_release_hands_over(self, client, jobs, monkeypatch):
+        """Test a stopping leader lets another worker lead straight away"""
+        assert scheduler.claim_leadership(1000.0)
+        scheduler.release_leadership()
+        monkeypatch.setattr(scheduler, 'worker_id', 'worker-b')
+        assert scheduler.claim_leadership(1001.0)
+
+    def test_follower_runs_nothing(self, client, jobs, monkeypatch):
+        """Test only the leader's tick runs jobs"""
+        runs = []
+        scheduler.register_job("example", lambda: runs.append(1), every=1)
+        assert scheduler.tick(1000.0)
+        monkeypatch.setattr(scheduler, 'worker_id', 'worker-b')
+        assert not scheduler.tick(1010.0)
+        assert runs == [1]
+
+
+class TestRuns:
+    """Test due jobs run exactly once and their outcome is recorded"""
+
+    def test_runs_once_per_interval(self, client, jobs):
+        """Test a job runs on the first tick, not again until its interval passes, and then again"""
+        runs = []
+        scheduler.register_job("example", lambda: runs.append(1), every=60)
+        scheduler.tick(1000.0)
+        scheduler.tick(1030.0)
+        assert len(runs) == 1
+        scheduler.tick(1060.0)
+        assert len(runs) == 2
+        record = job_record("example")
+        assert record.runs == 2
+        assert record.next_run == 1120.0
+
+    def test_claimed_once(self, client, jobs):
+        """Test two workers that both believe they lead can't both claim the same run"""
+        scheduler.register_job("example", lambda: None, every=60)
+        job = jobs["example"]
+        assert scheduler.claim_run(job, 1000.0)
+        assert not scheduler.claim_run(job, 1000.0)
+
+    def test_failure_recorded(self, client, jobs):
+        """Test a failing job is counted and doesn't stop the other jobs"""
+        runs = []
+
+        def broken():
+            raise RuntimeError("broken job")
+        scheduler.register_job("broken", broken, every=60)
+        scheduler.register_job("working", lambda: runs.append(1), every=60)
+        assert scheduler.tick(1000.0)
+        assert runs == [1]
+        record = job_record("broken")
+        assert record.failures == 1
+        assert "broken job" in record.last_error
+        assert job_record("working").failures == 0
+
+    def test_start_disabled(self, jobs, monkeypatch):
+        """Test no thread is started when the scheduler is disabled"""
+        monkeypatch.setattr(config, 'SCHEDULER_ENABLED', False)
+        scheduler.start()
+        assert scheduler.scheduler_thread is None
+
+
+    def test_not_serving_under_cli_commands(self, monkeypatch):
+        """Test Flask CLI commands only load the app, except flask run"""
+        assert scheduler.serving()
+        monkeypatch.setenv("FLASK_RUN_FROM_CLI", "true")
+        assert not scheduler.serving()
+        with click.Context(click.Command("build-assets"), info_name="build-assets"):
+            assert not scheduler.serving()
+        with click.Context(click.Command("run"), info_name="run"):
+            assert scheduler.serving()
+
+
+class TestJobs:
+    """Test the built in jobs"""
+
+    def test_clear_expired_reset_codes(self, client):
+        """Test expired reset codes are cleared and current ones kept"""
+        expired = User.query.filter_by(email="admin@test.com").first()
+        current = User.query.filter_by(email="user@test.com").first()
+        expired.reset_code, expired.reset_time = "EXPIRED", datetime.utcnow() - timedelta(minutes=config.PASSWORD_RESET_CODE_VALIDITY + 1)
+        current.reset_code, current.reset_time = "CURRENT", datetime.utcnow()
+        db.session.commit()
+        assert clear_expired_reset_codes() == 1
+        db.session.expire_all()
+        assert User.query.filter_by(email="admin@test.com").first().reset_code == "NORESET"
+        assert User.query.filter_by(email="user@test.com").first().reset_code == "CURRENT"
+
+    def test_housekeeping_removes_old_files(self, client, tmp_path, monkeypatch):
+        """Test old captures and surplus rotated logs are removed and recent files kept"""
+        monkeypatch.setattr(config, 'PROFILER_FOLDER', str(tmp_path))
+        monkeypatch.setattr(config, 'DIAGNOSTICS_FOLDER', str(tmp_path))
+        monkeypatch.setattr(config, 'LOGGING_FILE', str(tmp_path / "main.log"))
+        monkeypatch.setattr(config, 'LOGGING_MAX_LOGS', 1)
+        old = time.time() - (config.HOUSEKEEPING_MAX_AGE_DAYS + 1) * 24 * 60 * 60
+        for name in ["old.pstats", "old.snapshot", "new.folded", "main.log.1", "main.log.2"]:
+            (tmp_path / name).write_text("data")
+        for name in ["old.pstats", "old.snapshot"]:
+            os.utime(tmp_path / name, (old, old))
+        housekeeping.housekeeping()
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["main.log.1", "new.folded"]
+
+    def test_housekeeping_survives_undeletable_logs(self, client, tmp_path, monkeypatch):
+        """Test a log that can't be removed is warned about and the rest of the job still runs"""
+        monkeypatch.setattr(config, 'LOGGING_FILE', str(tmp_path / "main.log"))
+        monkeypatch.setattr(config, 'LOGGING_MAX_LOGS', 1)
+        (tmp_path / "main.log.2").mkdir()
+        (tmp_path / "main.log.3").write_text("data")
+        warnings = []
+        monkeypatch.setattr(housekeeping.log, 'warning', warnings.append)
+        housekeeping.housekeeping()
+        assert [path.name for path in tmp_path.iterdir()] == ["main.log.2"]
+        assert len(warnings) == 1 and "main.log.2" in warnings[0]
+
+
+class TestEndpoint:
+    """Test /api/v1/scheduler/jobs"""
+
+    def test_lists_jobs(self, authenticated_admin_client, jobs):
+        """Test system users see the leader and each job's state"""
+        scheduler.register_job("example", lambda: None, every=60)
+        scheduler.tick()
+        response = authenticated_admin_client.get('/api/v1/scheduler/jobs')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["leader"] == "worker-a"
+        assert [job["name"] for job in data["jobs"]] == ["example"]
+        assert data["jobs"][0]["runs"] == 1
+
+    def test_requires_system_role(self, authenticated_user_client):
+        """Test users without a system role are refused"""
+        assert authenticated_user_client.get('/api/v1/scheduler/jobs').status_code in (302, 403)
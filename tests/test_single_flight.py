@@ -0,0 +1,134 @@
+"""
+Single flight tests.
+Tests concurrent identical requests share one computation and that shared results expire or are invalidated.
+"""
+
+import pytest
+import threading
+import time
+from boilerplate.app import app
+import boilerplate.utils.cache as cache
+import boilerplate.utils.single_flight as single_flight
+
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    """Starts every test without remembered results"""
+    single_flight.results.clear()
+    yield
+    single_flight.results.clear()
+
+
+def run_concurrently(view, count: int, path: str = '/api/v1/roles'):
+    """Calls a view from several threads at once, each in its own request context"""
+    barrier = threading.Barrier(count)
+    responses = []
+
+    def call():
+        with app.test_request_context(path):
+            barrier.wait()
+            try:
+                responses.append(app.make_response(view()))
+            except Exception as error:
+                responses.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+class TestCoalescing:
+    """Test identical concurrent requests collapse into one computation"""
+
+    def test_concurrent_requests_share_one_call(self, client):
+        """Test only the leader runs the view and every request gets its response"""
+        calls = []
+
+        @single_flight.single_flight(ttl=0)
+        def slow_view():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"value": 42}
+
+        responses = run_concurrently(slow_view, 5)
+        assert len(calls) == 1
+        assert [response.get_json() for response in responses] == [{"value": 42}] * 5
+        assert len({id(response) for response in responses}) == 5
+
+    def test_different_arguments_not_shared(self, client):
+        """Test requests with different query strings run separately"""
+        calls = []
+
+        @single_flight.single_flight(ttl=10)
+        def view():
+            calls.append(1)
+            return {"value": 1}
+
+        for path in ('/api/v1/roles?page=1', '/api/v1/roles?page=2'):
+            with app.test_request_context(path):
+                view()
+        assert len(calls) == 2
+
+    def test_leader_failure_lets_followers_run(self, client):
+        """Test followers compute on their own when the leader raises"""
+        calls = []
+
+        @single_flight.single_flight(ttl=0)
+        def flaky_view():
+            calls.append(1)
+            time.sleep(0.2)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return {"value": 1}
+
+        responses = run_concurrently(flaky_view, 3)
+        assert sum(isinstance(response, RuntimeError) for response in responses) == 1
+        assert [response.get_json() for response in responses if not isinstance(response, RuntimeError)] == [{"value": 1}] * 2
+        assert single_flight.flights == {}
+
+
+class TestRememberedResults:
+    """Test the short lived result cache"""
+
+    def test_result_reused_within_ttl(self, client):
+        """Test a finished result is reused until its TTL runs out"""
+        calls = []
+
+        @single_flight.single_flight(ttl=0.2)
+        def view():
+            calls.append(1)
+            return {"value": len(calls)}
+
+        for _ in range(3):
+            with app.test_request_context('/api/v1/roles'):
+                assert app.make_response(view()).get_json() == {"value": 1}
+        time.sleep(0.25)
+        with app.test_request_context('/api/v1/roles'):
+            assert app.make_response(view()).get_json() == {"value": 2}
+
+    def test_published_channel_drops_result(self, client):
+        """Test publishing an invalidation channel drops remembered results"""
+        calls = []
+
+        @single_flight.single_flight(ttl=60, channels=("test-single-flight",))
+        def get_all_roles():
+            calls.append(1)
+            return {"value": len(calls)}
+
+        try:
+            with app.test_request_context('/api/v1/roles'):
+                get_all_roles()
+                cache.publish("test-single-flight")
+                assert app.make_response(get_all_roles()).get_json() == {"value": 2}
+        finally:
+            cache.subscribers.pop("test-single-flight", None)
+
+    def test_api_endpoint_still_authorizes(self, authenticated_admin_client):
+        """Test a shared result is never served to a viewer without permission"""
+        assert authenticated_admin_client.get('/api/v1/users/').status_code == 200
+        authenticated_admin_client.get('/logout')
+        authenticated_admin_client.post('/login', data={'email': 'user@test.com', 'password': 'TestPassword123!'})
+        assert authenticated_admin_client.get('/api/v1/users/').status_code == 403
@@ -0,0 +1,179 @@
+"""
+Aggregate tests.
+Tests user and role counts follow every kind of write, that reconciliation corrects drift and that /api/v1/stats and the role page read them.
+"""
+
+from sqlalchemy import insert, update
+from boilerplate.app import app
+from boilerplate.db import db, insert_if_not_exists
+from boilerplate.modules.role.role_model import Role, get_role_by_name, get_all_roles
+from boilerplate.modules.user.user_model import User, get_user_by_email, count_users_by_role
+from boilerplate.utils.stats import Aggregate, get_all_counts, get_count, reconcile, reconcile_aggregates
+
+
+def user_counts():
+    """Returns the active and deactivated user counts"""
+    return get_count("users.active"), get_count("users.deactivated")
+
+
+def counted_users():
+    """Returns the active and deactivated users in the user table"""
+    return User.query.filter_by(active=True).count(), User.query.filter_by(active=False).count()
+
+
+def role_count(name: str):
+    """Returns the stored user count of a role"""
+    role = get_role_by_name(name)
+    return count_users_by_role([role])[role.uuid]
+
+
+class TestIncrementalCounts:
+    """Test counts change with the rows they count"""
+
+    def test_seeded_counts(self, client):
+        """Test rows created before any count was read are counted"""
+        with app.app_context():
+            assert user_counts() == counted_users()
+            for role in get_all_roles():
+                assert role_count(role.name) == User.query.filter_by(role_uuid=role.uuid).count()
+            assert get_count("roles") == Role.query.count()
+
+    def test_create_deactivate_move_delete(self, client):
+        """Test a user is counted when created and moved between counts as it changes"""
+        with app.app_context():
+            active, deactivated = user_counts()
+            default, admin = role_count("Default Role"), role_count("System Admin")
+            db.session.add(User("new@test.com", "New", "User", "TestPassword123!", get_role_by_name("Default Role")))
+            db.session.commit()
+            assert user_counts() == (active + 1, deactivated)
+            user = get_user_by_email("new@test.com")
+            user.active = False
+            db.session.commit()
+            assert user_counts() == (active, deactivated + 1)
+            user = get_user_by_email("new@test.com")
+            user.role = get_role_by_name("System Admin")
+            db.session.commit()
+            assert (role_count("Default Role"), role_count("System Admin")) == (default, admin + 1)
+            db.session.delete(get_user_by_email("new@test.com"))
+            db.session.commit()
+            assert user_counts() == (active, deactivated)
+            assert role_count("System Admin") == admin
+
+    def test_unrelated_update_writes_nothing(self, client, statements):
+        """Test a login that only touches other columns leaves the counts alone"""
+        with app.app_context():
+            user = get_user_by_email("user@test.com")
+            del statements[:]
+            user.update_last_logon()
+        assert not [statement for statement in statements if "aggregate" in statement]
+
+    def test_rollback_discards_changes(self, client):
+        """Test changes rolled back are not counted"""
+        with app.app_context():
+            before = user_counts()
+            db.session.add(User("new@test.com", "New", "User", "TestPassword123!", get_role_by_name("Default Role")))
+            db.session.flush()
+            db.session.rollback()
+            assert user_counts() == before
+
+    def test_bulk_insert(self, client):
+        """Test rows created by one INSERT ... RETURNING are counted"""
+        with app.app_context():
+            roles = get_count("roles")
+            insert_if_not_exists(Role, [Role("Auditor", "Reads things", []), Role("Default Role", "Taken", [])])
+            assert get_count("roles") == roles + 1
+
+    def test_bulk_insert_without_returning(self, client):
+        """Test rows inserted by an executemany without RETURNING are counted again on commit"""
+        with app.app_context():
+            active, deactivated = user_counts()
+            role = get_role_by_name("Default Role")
+            db.session.execute(insert(User), [{"email": f"bulk{number}@test.com", "first_name": "Bulk", "last_name": "User", "password": b"x",
+                                               "active": False, "role_uuid": role.uuid} for number in range(3)])
+            db.session.commit()
+            assert user_counts() == (active, deactivated + 3)
+
+    def test_bulk_update(self, client):
+        """Test users moved by a bulk update are counted again on commit"""
+        with app.app_context():
+            total = User.query.count()
+            User.query.filter_by(active=True).update({"active": False})
+            db.session.commit()
+            assert user_counts() == (0, total)
+
+
+class TestReconciliation:
+    """Test counts taken from scratch"""
+
+    def test_corrects_drift(self, client):
+        """Test wrong and missing counts are corrected and reported"""
+        with app.app_context():
+            active, deactivated = counted_users()
+            db.session.execute(update(Aggregate).where(Aggregate.key == "users.active").values(value=40))
+            db.session.execute(Aggregate.__table__.delete().where(Aggregate.key == "users.deactivated"))
+            db.session.commit()
+            assert reconcile() == {"users.active": (40, active), "users.deactivated": (0, deactivated)}
+            db.session.commit()
+            assert user_counts() == (active, deactivated)
+            assert reconcile() == {}
+
+    def test_scheduled_job(self, client):
+        """Test the scheduled job commits its corrections and returns how many counts drifted"""
+        with app.app_context():
+            db.session.execute(update(Aggregate).where(Aggregate.key == "roles").values(value=0))
+            db.session.commit()
+            assert reconcile_aggregates() == 1
+            db.session.remove()
+            assert get_count("roles") == Role.query.count()
+
+    def test_deleted_role(self, authenticated_admin_client):
+        """Test deleting a role moves its users to the replacement and drops its count"""
+        with app.app_context():
+            default_uuid = get_role_by_name("Default Role").uuid
+            admin_uuid = str(get_role_by_name("System Admin").uuid)
+            users, roles = role_count("Default Role") + role_count("System Admin"), get_count("roles")
+        response = authenticated_admin_client.post('/roles/delete', data={
+            'delete-role-id': str(default_uuid), 'replacement-role-id': admin_uuid, 'delete-role-count': '2'})
+        assert response.status_code == 302
+        with app.app_context():
+            assert role_count("System Admin") == users
+            assert get_count("roles") == roles - 1
+            assert str(default_uuid) not in get_all_counts()["users"]["role"]
+
+
+class TestStatsEndpoint:
+    """Test /api/v1/stats"""
+
+    def test_counts(self, authenticated_admin_client):
+        """Test counts are nested by their keys"""
+        response = authenticated_admin_client.get('/api/v1/stats')
+        assert response.status_code == 200
+        data = response.get_json()
+        with app.app_context():
+            assert data["roles"] == Role.query.count()
+            assert (data["users"]["active"], data["users"]["deactivated"]) == counted_users()
+            assert data["users"]["role"][str(get_role_by_name("Default Role").uuid)] == role_count("Default Role")
+
+    def test_requires_system_role(self, authenticated_user_client):
+        """Test users without a system role are refused"""
+        assert authenticated_user_client.get('/api/v1/stats').status_code == 403
+
+
+class TestRolePage:
+    """Test the role page reads the counts"""
+
+    def test_page_does_not_count_users(self, authenticated_admin_client, statements):
+        """Test the role list neither counts users nor loads them role by role"""
+        del statements[:]
+        response = authenticated_admin_client.get('/roles')
+        assert response.status_code == 200
+        assert not [statement for statement in statements if "count(" in statement.lower()]
+        members = [statement for statement in statements if "row_number()" in statement]
+        assert len(members) == 1
+        assert not [statement for statement in statements if "FROM user" in statement and "role_uuid =" in statement]
+
+    def test_members_are_capped(self, authenticated_admin_client, monkeypatch):
+        """Test a role card lists at most ROLE_CARD_MAX_USERS users and says how many more there are"""
+        monkeypatch.setattr("boilerplate.config.ROLE_CARD_MAX_USERS", 1)
+        html = authenticated_admin_client.get('/roles').get_data(as_text=True)
+        assert "And 1 more." in html
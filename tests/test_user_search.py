@@ -0,0 +1,178 @@
+"""
+User search tests.
+Tests the FTS5 index follows the user table, ranks matches and that /api/v1/users/search pages through them for viewers allowed to see them.
+"""
+
+import pytest
+from sqlalchemy import insert
+from boilerplate.app import app
+from boilerplate.db import db
+from boilerplate.modules.role.role_model import get_role_by_name
+from boilerplate.modules.user.user_model import User, search_users, user_search, get_user_by_email
+
+
+def emails(users):
+    """Returns the emails of users in order"""
+    return [user.email for user in users]
+
+
+@pytest.fixture
+def people(client):
+    """Adds users whose names and emails overlap in different columns"""
+    with app.app_context():
+        role = get_role_by_name("Default Role")
+        db.session.add_all([
+            User("jane.doe@example.com", "Jane", "Doe", "TestPassword123!", role),
+            User("jsmith@example.com", "John", "Smith", "TestPassword123!", role),
+            User("smithers@acme.org", "Waylon", "Jones", "TestPassword123!", role),
+            User("old.smith@example.com", "Olga", "Smith", "TestPassword123!", role, active=False),
+        ])
+        db.session.commit()
+
+
+@pytest.fixture
+def reader_client(client):
+    """A client logged in as a user who can read the user list but not see deactivated users"""
+    with app.app_context():
+        role = get_role_by_name("Default Role")
+        role.actions = ["read_users_list"]
+        db.session.commit()
+    client.post('/login', data={'email': 'user@test.com', 'password': 'TestPassword123!'})
+    return client
+
+
+class TestSearchIndex:
+    """Test matching and ranking"""
+
+    def test_prefix_of_any_column(self, people):
+        """Test a prefix finds first names, last names and the start of emails"""
+        with app.app_context():
+            assert emails(search_users("jan")) == ["jane.doe@example.com"]
+            assert emails(search_users("jon")) == ["smithers@acme.org"]
+            assert "jsmith@example.com" in emails(search_users("jsm"))
+
+    def test_every_word_must_match(self, people):
+        """Test words narrow the results in any order"""
+        with app.app_context():
+            assert emails(search_users("smith john")) == ["jsmith@example.com"]
+            assert search_users("jane smith") == []
+
+    def test_names_rank_above_emails(self, people):
+        """Test a last name match comes before a match on the email alone"""
+        with app.app_context():
+            assert emails(search_users("smith")) == ["jsmith@example.com", "smithers@acme.org"]
+
+    def test_domain_filters_matches(self, people):
+        """Test the part after an @ is matched against the email's domain"""
+        with app.app_context():
+            assert emails(search_users("smith@acme")) == ["smithers@acme.org"]
+            assert search_users("jane@acme") == []
+
+    def test_deactivated_users_only_when_included(self, people):
+        """Test deactivated users are left out unless asked for"""
+        with app.app_context():
+            assert "old.smith@example.com" not in emails(search_users("olga"))
+            assert emails(search_users("olga", include_deactivated=True)) == ["old.smith@example.com"]
+
+    def test_query_syntax_is_not_interpreted(self, people):
+        """Test quotes, operators and empty queries neither fail nor match everything"""
+        with app.app_context():
+            assert emails(search_users('"jane* ^(')) == ["jane.doe@example.com"]
+            assert search_users("  ") == []
+            assert search_users("%") == []
+
+    def test_filtered_rows_ahead_of_match(self, client):
+        """Test a match is found behind more deactivated matches than were ever ranked, on any page and with a domain"""
+        with app.app_context():
+            role = get_role_by_name("Default Role")
+            db.session.execute(insert(User), [{"email": f"zed{number}@old.com", "first_name": "Zed", "last_name": "Gone", "password": b"x",
+                                               "active": False, "role_uuid": role.uuid} for number in range(205)])
+            db.session.add(User("zed.active@new.com", "Zed", "Active", "TestPassword123!", role))
+            db.session.commit()
+            assert emails(search_users("zed")) == ["zed.active@new.com"]
+            assert emails(search_users("zed@new.com")) == ["zed.active@new.com"]
+            assert len(search_users("zed", include_deactivated=True, limit=10, offset=200)) == 6
+
+    def test_scan_matches_index(self, people, monkeypatch):
+        """Test the fallback for databases without FTS5 finds the same users"""
+        with app.app_context():
+            indexed = set(emails(search_users("smith", include_deactivated=True)))
+            monkeypatch.setattr(user_search, "available", False)
+            assert set(emails(search_users("smith", include_deactivated=True))) == indexed
+
+
+class TestIndexSync:
+    """Test the index follows changes to the user table"""
+
+    def test_rename(self, people):
+        """Test an updated name is found under the new name only"""
+        with app.app_context():
+            user = get_user_by_email("jsmith@example.com")
+            user.last_name = "Baker"
+            db.session.commit()
+            assert search_users("john smith") == []
+            assert emails(search_users("john baker")) == ["jsmith@example.com"]
+
+    def test_bulk_update_and_delete(self, people):
+        """Test writes that bypass the ORM's unit of work are indexed too"""
+        with app.app_context():
+            User.query.filter_by(email="jsmith@example.com").update({"first_name": "Jack"})
+            db.session.commit()
+            assert emails(search_users("jack")) == ["jsmith@example.com"]
+            User.query.filter_by(email="jsmith@example.com").delete()
+            db.session.commit()
+            assert search_users("jack") == []
+
+    @pytest.mark.commits
+    def test_ensure_indexes_existing_table(self, people):
+        """Test a database made before the index existed is indexed on start"""
+        with app.app_context():
+            with db.engine.begin() as connection:
+                user_search.drop(connection)
+            user_search.ensure()
+            assert emails(search_users("jane")) == ["jane.doe@example.com"]
+
+
+class TestSearchEndpoint:
+    """Test /api/v1/users/search"""
+
+    def test_results(self, authenticated_admin_client, people):
+        """Test matches are returned as users"""
+        response = authenticated_admin_client.get('/api/v1/users/search?q=jane')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["query"] == "jane"
+        assert data["has_more"] is False
+        assert [user["email"] for user in data["results"]] == ["jane.doe@example.com"]
+        assert "password" not in data["results"][0]
+
+    def test_pages(self, authenticated_admin_client, people):
+        """Test results are split into pages without repeating a user"""
+        first = authenticated_admin_client.get('/api/v1/users/search?q=smith&per_page=2').get_json()
+        second = authenticated_admin_client.get('/api/v1/users/search?q=smith&per_page=2&page=2').get_json()
+        assert first["has_more"] is True and second["has_more"] is False
+        assert len(first["results"]) == 2 and len(second["results"]) == 1
+        assert not {user["email"] for user in first["results"]} & {user["email"] for user in second["results"]}
+
+    def test_invalid_page(self, authenticated_admin_client):
+        """Test pages and page sizes below one are rejected"""
+        assert authenticated_admin_client.get('/api/v1/users/search?q=a&page=0').status_code == 400
+        assert authenticated_admin_client.get('/api/v1/users/search?q=a&per_page=0').status_code == 400
+
+    def test_admin_sees_deactivated_users(self, authenticated_admin_client, people):
+        """Test viewers who manage deactivated users find them"""
+        data = authenticated_admin_client.get('/api/v1/users/search?q=olga').get_json()
+        assert [user["email"] for user in data["results"]] == ["old.smith@example.com"]
+
+    def test_reader_does_not_see_deactivated_users(self, reader_client, people):
+        """Test viewers who can only read the list never find deactivated users"""
+        assert reader_client.get('/api/v1/users/search?q=olga').get_json()["results"] == []
+        assert len(reader_client.get('/api/v1/users/search?q=smith').get_json()["results"]) == 2
+
+    def test_requires_read_users_list(self, authenticated_user_client, people):
+        """Test viewers without read_users_list are refused"""
+        assert authenticated_user_client.get('/api/v1/users/search?q=jane').status_code == 403
+
+    def test_requires_login(self, client):
+        """Test anonymous visitors are refused"""
+        assert client.get('/api/v1/users/search?q=jane').status_code in (302, 401)